@@ -0,0 +1,84 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from store.cache import is_shared
+from .models import User
+
+
+def token_cache_key(key):
+    return 'auth-token:%s' % key
+
+
+def invalidate_token(key):
+    cache.delete(token_cache_key(key))
+
+
+def invalidate_user_tokens(user_id):
+    keys = Token.objects.filter(user_id=user_id).values_list('key', flat=True)
+    cache.delete_many([token_cache_key(key) for key in keys])
+
+
+class CachingTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication that keeps the token -> user id lookup in the
+    Django cache, so an authenticated request loads the User row by primary
+    key instead of joining it to the Token table.
+
+    The user is still read from the database every time, so deactivated
+    and deleted accounts are refused at once. Entries are dropped on logout,
+    password change, account deletion and any other User save (see
+    Auth.signals); TOKEN_CACHE_TIMEOUT bounds anything missed. Those deletes
+    only reach other workers through a shared cache, so with a per-process
+    one (store.W001) nothing is cached and a revoked token is refused
+    everywhere immediately.
+    """
+
+    def authenticate_credentials(self, key):
+        if not is_shared():
+            return super().authenticate_credentials(key)
+
+        user_id = cache.get(token_cache_key(key))
+        if user_id is None:
+            user, token = super().authenticate_credentials(key)
+            cache.set(token_cache_key(key), user.pk, getattr(settings, 'TOKEN_CACHE_TIMEOUT', 300))
+            return (user, token)
+
+        user = User.objects.filter(pk=user_id).first()
+        if user is None or not user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        # request.auth stays a Token so LogoutView can still delete it
+        return (user, Token(key=key, user=user))
+
+
+async def aauthenticate(request):
+    """
+    Async counterpart of CachingTokenAuthentication for plain Django async
+    views. Returns the user for a valid 'Authorization: Token <key>' header,
+    None when there is no token, and raises AuthenticationFailed otherwise.
+    """
+    auth = request.headers.get('Authorization', '').split()
+    if not auth or auth[0].lower() != 'token':
+        return None
+    if len(auth) != 2:
+        raise exceptions.AuthenticationFailed(_('Invalid token header.'))
+
+    key = auth[1]
+    user_id = await cache.aget(token_cache_key(key)) if is_shared() else None
+    if user_id is None:
+        try:
+            token = await Token.objects.select_related('user').aget(key=key)
+        except Token.DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        user = token.user
+        if is_shared():
+            await cache.aset(token_cache_key(key), user.pk, getattr(settings, 'TOKEN_CACHE_TIMEOUT', 300))
+    else:
+        user = await User.objects.filter(pk=user_id).afirst()
+
+    if user is None or not user.is_active:
+        raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+    return user
@@ -0,0 +1,89 @@
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+from django.db import transaction
+from django.db.models import F
+
+from store.cache import bump_user_shops
+from .models import BalanceTransaction, User
+
+
+class LedgerError(Exception):
+    message = 'Something went wrong with the transaction'
+
+
+class InvalidAmount(LedgerError):
+    message = 'Invalid amount'
+
+
+class InsufficientBalance(LedgerError):
+    message = 'Insufficient balance'
+
+
+class UnknownAccount(LedgerError):
+    message = 'Account not found'
+
+
+def to_amount(value):
+    try:
+        amount = Decimal(str(value)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+    except (InvalidOperation, TypeError, ValueError):
+        raise InvalidAmount()
+    if not amount.is_finite() or amount <= 0:
+        raise InvalidAmount()
+    return amount
+
+
+def _changed(user_id):
+    # update() sends no post_save: don't let the cached shops embedding the
+    # user keep the old balance
+    bump_user_shops(user_id)
+
+
+def _check(amount):
+    # Callers pass amounts they computed themselves, not only to_amount()'s
+    if not amount > 0:
+        raise InvalidAmount()
+
+
+def credit(user_id, amount, kind='D', counterparty_id=None):
+    _check(amount)
+    with transaction.atomic():
+        if not User.objects.filter(pk=user_id).update(acc_balance=F('acc_balance') + amount):
+            raise UnknownAccount()
+        BalanceTransaction.objects.create(
+            user_id=user_id, kind=kind, amount=amount, counterparty_id=counterparty_id)
+        transaction.on_commit(lambda: _changed(user_id))
+
+
+def debit(user_id, amount, kind='W', counterparty_id=None):
+    """
+    Takes amount off the balance with a single conditional UPDATE, so two
+    concurrent debits can never both pass the balance check.
+    """
+    _check(amount)
+    with transaction.atomic():
+        updated = User.objects.filter(pk=user_id, acc_balance__gte=amount).update(
+            acc_balance=F('acc_balance') - amount
+        )
+        if not updated:
+            if User.objects.filter(pk=user_id).exists():
+                raise InsufficientBalance()
+            raise UnknownAccount()
+        BalanceTransaction.objects.create(
+            user_id=user_id, kind=kind, amount=-amount, counterparty_id=counterparty_id)
+        transaction.on_commit(lambda: _changed(user_id))
+
+
+def transfer(from_user_id, to_user_id, amount):
+    from_user_id, to_user_id = int(from_user_id), int(to_user_id)
+    if from_user_id == to_user_id:
+        raise InvalidAmount()
+    with transaction.atomic():
+        # Both rows are locked by their UPDATEs; always taking them in
+        # primary key order means opposite transfers can't deadlock. A failed
+        # debit rolls back a credit that already happened.
+        for user_id in sorted((from_user_id, to_user_id)):
+            if user_id == from_user_id:
+                debit(from_user_id, amount, kind='O', counterparty_id=to_user_id)
+            else:
+                credit(to_user_id, amount, kind='I', counterparty_id=from_user_id)
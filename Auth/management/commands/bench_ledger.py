@@ -0,0 +1,63 @@
+import random
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Sum
+
+from Auth import ledger
+from Auth.models import BalanceTransaction, User
+from store.bench import run_concurrently, seed_customers, throwaway_database
+
+
+class Command(BaseCommand):
+    help = ('Runs concurrent deposits, withdrawals and transfers over a few hot accounts '
+            'and checks that no update was lost.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=16)
+        parser.add_argument('--operations', type=int, default=2000)
+        parser.add_argument('--accounts', type=int, default=4)
+        parser.add_argument('--keepdb', action='store_true')
+
+    def handle(self, *args, **options):
+        with throwaway_database(keepdb=options['keepdb']):
+            opening = Decimal('1000.00')
+            accounts = [user.pk for user in seed_customers(options['accounts'], balance=opening)]
+            rng = random.Random(0)
+
+            jobs = []
+            for _ in range(options['operations']):
+                amount = Decimal(rng.randint(1, 5000)) / 100
+                choice = rng.random()
+                if choice < 0.4:
+                    jobs.append((ledger.credit, rng.choice(accounts), amount))
+                elif choice < 0.6:
+                    jobs.append((ledger.debit, rng.choice(accounts), amount))
+                else:
+                    from_id, to_id = rng.sample(accounts, 2)
+                    jobs.append((ledger.transfer, from_id, to_id, amount))
+
+            def apply(operation, *args):
+                try:
+                    operation(*args)
+                except ledger.InsufficientBalance:
+                    pass
+
+            result = run_concurrently(apply, jobs, options['clients'])
+            if result.errors:
+                raise CommandError('%d operations failed, first error: %r' % (len(result.errors), result.errors[0]))
+
+            for user in User.objects.filter(pk__in=accounts):
+                booked = BalanceTransaction.objects.filter(user=user).aggregate(total=Sum('amount'))['total'] or 0
+                if user.acc_balance != opening + booked:
+                    raise CommandError('Lost update on account %d: balance %s, ledger says %s' % (
+                        user.pk, user.acc_balance, opening + booked))
+                if user.acc_balance < 0:
+                    raise CommandError('Account %d went negative' % user.pk)
+
+            summary = result.summary()
+            self.stdout.write('clients: %d, operations: %d over %d accounts' % (
+                options['clients'], summary['calls'], len(accounts)))
+            self.stdout.write('operations/second: %s' % summary['throughput'])
+            self.stdout.write('latency ms: p50 %(p50_ms)s  p95 %(p95_ms)s  p99 %(p99_ms)s' % summary)
+            self.stdout.write('balances match the ledger: no lost updates')
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.10 on 2026-10-18 14:18
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Auth', '0008_user_is_client'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceTransaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('D', 'Deposit'), ('W', 'Withdrawal'), ('I', 'Transfer in'), ('O', 'Transfer out'), ('P', 'Payment')], max_length=1)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('counterparty', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_transactions', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
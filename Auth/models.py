@@ -15,3 +15,25 @@ class User(AbstractUser):
     acc_balance = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     phone_num = models.CharField(max_length=300, null=True, blank=True)
     image = models.ImageField(_("Image"), upload_to=upload_to, null=True, blank=True)
+    # Resized copies of image, see core.images
+    image_variants = models.JSONField(default=dict, blank=True)
+
+
+TRANSACTION_CHOICES = (
+    ('D', 'Deposit'),
+    ('W', 'Withdrawal'),
+    ('I', 'Transfer in'),
+    ('O', 'Transfer out'),
+    ('P', 'Payment'),
+)
+
+class BalanceTransaction(models.Model):
+    # Append-only record of every acc_balance change; amount is signed.
+    user = models.ForeignKey(User, related_name='balance_transactions', on_delete=models.CASCADE)
+    kind = models.CharField(max_length=1, choices=TRANSACTION_CHOICES)
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    counterparty = models.ForeignKey(User, related_name='+', on_delete=models.SET_NULL, blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.amount}"
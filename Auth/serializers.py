@@ -1,11 +1,16 @@
 from rest_framework import serializers
+from core.images import variant_url
 from .models import User
 
 class UserSerializer(serializers.ModelSerializer):
+    thumbnail = serializers.SerializerMethodField()
    
     class Meta:
         model=User
-        fields= ['id', 'username', 'email', 'is_vendor', 'is_rider', 'is_client', 'is_active', 'acc_balance', 'image']
+        fields= ['id', 'username', 'email', 'is_vendor', 'is_rider', 'is_client', 'is_active', 'acc_balance', 'image', 'thumbnail']
+
+    def get_thumbnail(self, obj):
+        return variant_url(obj.image, obj.image_variants, self.context)
         
 class SignupSerializer(serializers.ModelSerializer):
     password2=serializers.CharField(style={"input_type":"password"}, write_only=True)
@@ -1,3 +1,184 @@
+from decimal import Decimal
+from unittest import mock
+
+from django.core.cache import cache
 from django.test import TestCase
+from rest_framework.authtoken.models import Token
+
+from Auth import ledger
+from Auth.authentication import token_cache_key
+from Auth.models import BalanceTransaction, User
+from store.models import Shop
+
+
+class LedgerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Created first so the recipient has the lower pk and is credited
+        # before the sender is debited in transfer()
+        cls.recipient = User.objects.create(username='ledger-recipient')
+        cls.sender = User.objects.create(username='ledger-sender')
+        ledger.credit(cls.sender.pk, Decimal('10.00'))
+
+    def balance(self, user):
+        return User.objects.values_list('acc_balance', flat=True).get(pk=user.pk)
+
+    def entries(self, user):
+        return list(BalanceTransaction.objects.filter(user=user).order_by('id').values_list('kind', 'amount'))
+
+    def test_debit(self):
+        ledger.debit(self.sender.pk, Decimal('4.00'))
+        self.assertEqual(self.balance(self.sender), Decimal('6.00'))
+        self.assertEqual(self.entries(self.sender), [('D', Decimal('10.00')), ('W', Decimal('-4.00'))])
+
+    def test_debit_insufficient_balance(self):
+        with self.assertRaises(ledger.InsufficientBalance):
+            ledger.debit(self.sender.pk, Decimal('10.01'))
+        self.assertEqual(self.balance(self.sender), Decimal('10.00'))
+        self.assertEqual(self.entries(self.sender), [('D', Decimal('10.00'))])
+
+    def test_unknown_account(self):
+        with self.assertRaises(ledger.UnknownAccount):
+            ledger.debit(0, Decimal('1.00'))
+        with self.assertRaises(ledger.UnknownAccount):
+            ledger.credit(0, Decimal('1.00'))
+
+    def test_invalid_amounts(self):
+        for value in (None, 'abc', '0', '-1', 'NaN', 'Infinity'):
+            with self.assertRaises(ledger.InvalidAmount):
+                ledger.to_amount(value)
+        self.assertEqual(ledger.to_amount('1.005'), Decimal('1.01'))
+
+    def test_non_positive_amounts(self):
+        for amount in (Decimal('0'), Decimal('-5.00')):
+            with self.assertRaises(ledger.InvalidAmount):
+                ledger.debit(self.sender.pk, amount)
+            with self.assertRaises(ledger.InvalidAmount):
+                ledger.credit(self.sender.pk, amount)
+        self.assertEqual(self.balance(self.sender), Decimal('10.00'))
+        self.assertEqual(self.entries(self.sender), [('D', Decimal('10.00'))])
+
+    def test_transfer(self):
+        ledger.transfer(self.sender.pk, self.recipient.pk, Decimal('2.50'))
+        self.assertEqual(self.balance(self.sender), Decimal('7.50'))
+        self.assertEqual(self.balance(self.recipient), Decimal('2.50'))
+        self.assertEqual(self.entries(self.sender)[-1], ('O', Decimal('-2.50')))
+        self.assertEqual(self.entries(self.recipient), [('I', Decimal('2.50'))])
+        self.assertEqual(BalanceTransaction.objects.get(user=self.recipient).counterparty_id, self.sender.pk)
+
+    def test_transfer_insufficient_balance_rolls_back_the_credit(self):
+        with self.assertRaises(ledger.InsufficientBalance):
+            ledger.transfer(self.sender.pk, self.recipient.pk, Decimal('20.00'))
+        self.assertEqual(self.balance(self.sender), Decimal('10.00'))
+        self.assertEqual(self.balance(self.recipient), Decimal('0.00'))
+        self.assertEqual(self.entries(self.recipient), [])
+
+    def test_transfer_to_self(self):
+        with self.assertRaises(ledger.InvalidAmount):
+            ledger.transfer(self.sender.pk, self.sender.pk, Decimal('1.00'))
+
+
+class BalanceViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create(username='balance-owner')
+        cls.other = User.objects.create(username='balance-other')
+        cls.staff = User.objects.create(username='balance-staff', is_staff=True)
+        ledger.credit(cls.owner.pk, Decimal('10.00'))
+        ledger.credit(cls.other.pk, Decimal('10.00'))
+
+    def post(self, path, data, user=None):
+        headers = {'authorization': 'Token %s' % Token.objects.get_or_create(user=user)[0].key} if user else {}
+        return self.client.post(path, data, content_type='application/json', headers=headers)
+
+    def balance(self, user):
+        return User.objects.values_list('acc_balance', flat=True).get(pk=user.pk)
+
+    def test_anonymous(self):
+        for path, data in (
+                ('/api/deposit/', {'user_id': self.owner.pk, 'amount': '5'}),
+                ('/api/withdraw/', {'user_id': self.owner.pk, 'amount': '5'}),
+                ('/api/transfer/', {'from_user_id': self.owner.pk, 'to_user_id': self.other.pk, 'amount': '5'})):
+            self.assertEqual(self.post(path, data).status_code, 401)
+        self.assertEqual(self.balance(self.owner), Decimal('10.00'))
+
+    def test_other_users_account(self):
+        response = self.post('/api/withdraw/', {'user_id': self.other.pk, 'amount': '5'}, self.owner)
+        self.assertEqual(response.status_code, 403)
+        response = self.post('/api/deposit/', {'user_id': self.owner.pk, 'amount': '5'}, self.owner)
+        self.assertEqual(response.status_code, 403)
+        response = self.post(
+            '/api/transfer/', {'from_user_id': self.other.pk, 'to_user_id': self.owner.pk, 'amount': '5'}, self.owner)
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual((self.balance(self.owner), self.balance(self.other)), (Decimal('10.00'), Decimal('10.00')))
+
+    def test_transfer_from_own_account(self):
+        response = self.post('/api/transfer/', {'to_user_id': self.other.pk, 'amount': '2.50'}, self.owner)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((self.balance(self.owner), self.balance(self.other)), (Decimal('7.50'), Decimal('12.50')))
+
+    def test_staff_withdraw(self):
+        response = self.post('/api/withdraw/', {'user_id': self.other.pk, 'amount': '4'}, self.staff)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.balance(self.other), Decimal('6.00'))
+
+    def test_deposit_changes_the_shop_etag(self):
+        # Shops embed their vendor's balance
+        Shop.objects.create(user=self.owner, name='Balance shop')
+        headers = {'authorization': 'Token %s' % Token.objects.get_or_create(user=self.owner)[0].key}
+        etag = self.client.get('/api/shop-detail/', headers=headers)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post('/api/deposit/', {'user_id': self.owner.pk, 'amount': '5'}, self.staff)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get('/api/shop-detail/', headers=dict(headers, if_none_match=etag))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['user']['acc_balance'], '15.00')
+
+
+class TokenRevocationTests(TestCase):
+    """Logout and deactivation refuse the token on the very next request, cached or not."""
+
+    def setUp(self):
+        self.user = User.objects.create(username='token-owner')
+        self.token = Token.objects.create(user=self.user).key
+        cache.clear()
+
+    def get(self):
+        return self.client.get('/api/auth/authenticated', headers={'authorization': 'Token %s' % self.token})
+
+    def assertRevokedBy(self, revoke):
+        self.assertEqual(self.get().status_code, 200)
+        self.assertEqual(self.get().status_code, 200)
+        revoke()
+        self.assertEqual(self.get().status_code, 401)
+
+    def logout(self):
+        response = self.client.post('/api/auth/logout', headers={'authorization': 'Token %s' % self.token})
+        self.assertEqual(response.json(), {'success': 'Loggout Out'})
+
+    def deactivate(self):
+        # update() sends no post_save, as when another worker's cache was not cleared
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+
+    def test_process_local_cache_is_not_used(self):
+        self.assertEqual(self.get().status_code, 200)
+        self.assertIsNone(cache.get(token_cache_key(self.token)))
+
+    def test_logout(self):
+        self.assertRevokedBy(self.logout)
+
+    def test_deactivation(self):
+        self.assertRevokedBy(self.deactivate)
+
+    def test_logout_with_a_shared_cache(self):
+        with mock.patch('Auth.authentication.is_shared', return_value=True):
+            self.assertRevokedBy(self.logout)
+
+    def test_deactivation_with_a_shared_cache(self):
+        with mock.patch('Auth.authentication.is_shared', return_value=True):
+            self.assertRevokedBy(self.deactivate)
+            self.assertEqual(cache.get(token_cache_key(self.token)), self.user.pk)
 
-# Create your tests here.
+    def test_deletion_with_a_shared_cache(self):
+        with mock.patch('Auth.authentication.is_shared', return_value=True):
+            self.assertRevokedBy(lambda: User.objects.filter(pk=self.user.pk).delete())
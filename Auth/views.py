@@ -4,13 +4,14 @@ from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.response import Response
 from .serializers import UserSerializer, SignupSerializer
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from .models import User
 from store.models import Shop
 from rest_framework.views import APIView
 from rest_framework.pagination import PageNumberPagination
 from rest_framework import status
-from decimal import Decimal
+from . import ledger
+from .authentication import invalidate_token, invalidate_user_tokens
 
 
 class CheckAuthenticatedView(APIView):
@@ -100,8 +101,7 @@ class UserListView(generics.ListAPIView):
 class UserDetailView(APIView):
     def get(self, request, format=None):
         user=request.user
-        queryset = User.objects.get(id=user.id)
-        serializer = UserSerializer(queryset)
+        serializer = UserSerializer(user)
         return Response( serializer.data)
     
 class UserDetailView2(APIView):
@@ -125,6 +125,7 @@ class ChangePasswordView(APIView):
         # Set the new password and save the user
         user.set_password(new_password)
         user.save()
+        invalidate_user_tokens(user.id)
 
         return Response({'message': 'Password successfully changed.'}, status=status.HTTP_200_OK)
     
@@ -133,6 +134,7 @@ class LogoutView(APIView):
         try:
             # auth.logout(request)
             request.auth.delete()
+            invalidate_token(request.auth.key)
             return Response({ 'success': 'Loggout Out' })
         except:
             return Response({ 'error': 'Something went wrong when logging out' })
@@ -142,6 +144,7 @@ class DeleteAccountView(APIView):
         user = self.request.user
 
         try:
+            invalidate_user_tokens(user.id)
             User.objects.filter(id=user.id).delete()
 
             return Response({ 'success': 'User deleted successfully' })
@@ -150,55 +153,58 @@ class DeleteAccountView(APIView):
 
 
 class DepositView(APIView):
+    # Staff top up any account
+    permission_classes = (IsAdminUser, )
+
     def post(self, request):
-        amount = request.data.get('amount')
-        user_id = request.data.get('user_id')
-        user = User.objects.get(id=user_id)
         try:
-            amount = Decimal(amount)
-        except ValueError:
-            return Response({'error': 'Invalid amount'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        user.acc_balance += amount
-        user.save()
+            amount = ledger.to_amount(request.data.get('amount'))
+            ledger.credit(request.data.get('user_id'), amount)
+        except ledger.UnknownAccount as e:
+            return Response({'error': e.message}, status=status.HTTP_404_NOT_FOUND)
+        except ledger.LedgerError as e:
+            return Response({'error': e.message}, status=status.HTTP_400_BAD_REQUEST)
+        except (TypeError, ValueError):
+            return Response({'error': 'Invalid account'}, status=status.HTTP_400_BAD_REQUEST)
         # serializer = UserSerializer(user)
         return Response({'success': 'Successfully credited the account'})
         # return Response(serializer.data)
 
 class WithdrawView(APIView):
-    def post(self, request):
-        amount = request.data.get('amount')
-        user_id = request.data.get('user_id')
-        user = User.objects.get(id=user_id)
+    # Staff pay out of any account
+    permission_classes = (IsAdminUser, )
 
+    def post(self, request):
         try:
-            amount = Decimal(amount)
-        except ValueError:
-            return Response({'error': 'Invalid amount'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        if amount > user.acc_balance:
-            return Response({'error': 'Insufficient balance'}, status=status.HTTP_400_BAD_REQUEST)
-        user.acc_balance -= amount
-        user.save()
+            amount = ledger.to_amount(request.data.get('amount'))
+            ledger.debit(request.data.get('user_id'), amount)
+        except ledger.UnknownAccount as e:
+            return Response({'error': e.message}, status=status.HTTP_404_NOT_FOUND)
+        except ledger.LedgerError as e:
+            return Response({'error': e.message}, status=status.HTTP_400_BAD_REQUEST)
+        except (TypeError, ValueError):
+            return Response({'error': 'Invalid account'}, status=status.HTTP_400_BAD_REQUEST)
         # serializer = UserSerializer(user)
         # return Response(serializer.data)
         return Response({'success': 'Successfully withdraw from the account'})
 
 class TransferView(APIView):
+    # Users can only transfer out of their own account
+    permission_classes = (IsAuthenticated, )
+
     def post(self, request):
-        amount = request.data.get('amount')
-        to_user_id = request.data.get('to_user_id')
         from_user_id = request.data.get('from_user_id')
-        from_account = User.objects.get(id=from_user_id)
-        to_account = User.objects.get(user_id=to_user_id)
-        
-        if amount > from_account.balance:
-            return Response({'error': 'Insufficient balance'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        from_account.balance -= amount
-        to_account.balance += amount
-        
-        from_account.save()
-        to_account.save()
+        if from_user_id is not None and str(from_user_id) != str(request.user.pk):
+            return Response({'error': 'You can only transfer from your own account'},
+                            status=status.HTTP_403_FORBIDDEN)
+        try:
+            amount = ledger.to_amount(request.data.get('amount'))
+            ledger.transfer(request.user.pk, request.data.get('to_user_id'), amount)
+        except ledger.UnknownAccount as e:
+            return Response({'error': e.message}, status=status.HTTP_404_NOT_FOUND)
+        except ledger.LedgerError as e:
+            return Response({'error': e.message}, status=status.HTTP_400_BAD_REQUEST)
+        except (TypeError, ValueError):
+            return Response({'error': 'Invalid account'}, status=status.HTTP_400_BAD_REQUEST)
         
         return Response({'message': 'Transfer successful'})
@@ -0,0 +1,127 @@
+"""
+Resized WebP/JPEG derivatives of uploaded images.
+
+Models opt in with an `image` ImageField, an `image_variants` JSONField and
+register(Model). Saving a new image queues generate_variants() as a
+background job (see jobs, run by manage.py run_worker); it writes one file per
+size and format next to the original (item_images/shoe.jpg ->
+item_images/shoe.320.webp) and records their names in image_variants.
+Serializers pick one with variant_url().
+"""
+import os
+from io import BytesIO
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db.models.signals import post_save
+from PIL import Image, ImageOps
+
+from jobs.queue import task
+
+FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+
+
+def variant_name(source_name, size, fmt):
+    stem, _ = os.path.splitext(source_name)
+    return '%s.%d.%s' % (stem, size, 'jpg' if fmt == 'jpeg' else fmt)
+
+
+def render(image, size, fmt):
+    copy = image.copy()
+    copy.thumbnail((size, size), Image.LANCZOS)
+    if fmt == 'jpeg' and copy.mode != 'RGB':
+        copy = copy.convert('RGB')
+    buffer = BytesIO()
+    copy.save(buffer, FORMATS[fmt], quality=settings.IMAGE_QUALITY, optimize=fmt == 'jpeg')
+    return buffer.getvalue()
+
+
+def generate_variants(model, pk, source_name):
+    """
+    Builds every size in IMAGE_VARIANTS in every format for the image
+    currently stored on model pk, unless it has been replaced by source_name
+    changing in the meantime, and deletes the derivatives of the previous
+    image.
+    """
+    instance = model._default_manager.filter(pk=pk).first()
+    if instance is None or instance.image.name != source_name:
+        return None
+
+    storage = instance.image.storage
+    with storage.open(source_name, 'rb') as source:
+        image = ImageOps.exif_transpose(Image.open(source))
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+
+    variants = {'source': source_name}
+    for label, size in settings.IMAGE_VARIANTS.items():
+        for fmt in FORMATS:
+            name = storage.save(variant_name(source_name, size, fmt), ContentFile(render(image, size, fmt)))
+            variants['%s.%s' % (label, fmt)] = name
+
+    previous = instance.image_variants or {}
+    # Only store them if the image is still the same one
+    updated_fields = ['image_variants'] + [field.name for field in model._meta.concrete_fields
+                                           if getattr(field, 'auto_now', False)]
+    instance.refresh_from_db(fields=['image'])
+    if instance.image.name != source_name:
+        return None
+    instance.image_variants = variants
+    # post_save invalidates whatever caches embed the instance
+    instance.save(update_fields=updated_fields)
+
+    stale = set(previous.values()) - set(variants.values()) - {source_name, previous.get('source')}
+    for name in stale:
+        storage.delete(name)
+    return variants
+
+
+@task(max_attempts=3, backoff=30)
+def build_variants(model_label, pk, source_name):
+    variants = generate_variants(apps.get_model(model_label), pk, source_name)
+    return {'variants': len(variants) - 1 if variants else 0}
+
+
+def schedule(instance):
+    build_variants.delay(instance._meta.label, instance.pk, instance.image.name)
+
+
+def needs_variants(instance):
+    variants = instance.image_variants or {}
+    return bool(instance.image) and variants.get('source') != instance.image.name
+
+
+def _schedule_on_save(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'image' not in update_fields:
+        return
+    if needs_variants(instance):
+        schedule(instance)
+
+
+def register(model):
+    post_save.connect(_schedule_on_save, sender=model, dispatch_uid='image-variants-%s' % model._meta.label)
+
+
+def variant_params(context):
+    # (size, format) asked for by the request in context, as variant_url() reads them
+    request = context.get('request')
+    params = request.GET if request is not None else {}
+    size = params.get('image_size', context.get('image_size', settings.IMAGE_DEFAULT_VARIANT))
+    return size, params.get('image_format', 'webp')
+
+
+def variant_url(field_file, variants, context):
+    """
+    URL of the derivative asked for with ?image_size= (a key of
+    IMAGE_VARIANTS) and ?image_format=webp|jpeg, or of the original until
+    the derivatives exist. Absolute when there is a request in context.
+    """
+    if not field_file:
+        return None
+    request = context.get('request')
+    size, fmt = variant_params(context)
+    name = (variants or {}).get('%s.%s' % (size, fmt))
+    url = field_file.storage.url(name) if name else field_file.url
+    return request.build_absolute_uri(url) if request is not None else url
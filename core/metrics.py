@@ -0,0 +1,136 @@
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.db import connection
+
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open.
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+_lock = threading.Lock()
+_views = {}
+
+
+class QueryTimer:
+    """connection.execute_wrapper() hook counting and timing every query."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+def _install(timer):
+    connection.execute_wrappers.append(timer)
+
+
+def _remove(timer):
+    connection.execute_wrappers.remove(timer)
+
+
+def record(view, total_ms, db_ms, queries):
+    with _lock:
+        stats = _views.get(view)
+        if stats is None:
+            stats = _views[view] = {
+                'requests': 0,
+                'total_ms': 0.0,
+                'db_ms': 0.0,
+                'queries': 0,
+                'max_queries': 0,
+                'buckets': [0] * (len(LATENCY_BUCKETS_MS) + 1),
+            }
+        stats['requests'] += 1
+        stats['total_ms'] += total_ms
+        stats['db_ms'] += db_ms
+        stats['queries'] += queries
+        stats['max_queries'] = max(stats['max_queries'], queries)
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if total_ms <= bound:
+                stats['buckets'][i] += 1
+                break
+        else:
+            stats['buckets'][-1] += 1
+
+
+def snapshot():
+    with _lock:
+        views = {view: dict(stats, buckets=list(stats['buckets'])) for view, stats in _views.items()}
+    labels = ['<=%d' % bound for bound in LATENCY_BUCKETS_MS] + ['>%d' % LATENCY_BUCKETS_MS[-1]]
+    result = {}
+    for view, stats in views.items():
+        requests = stats['requests']
+        result[view] = {
+            'requests': requests,
+            'mean_ms': round(stats['total_ms'] / requests, 2),
+            'mean_db_ms': round(stats['db_ms'] / requests, 2),
+            'mean_queries': round(stats['queries'] / requests, 2),
+            'max_queries': stats['max_queries'],
+            'latency_ms': dict(zip(labels, stats['buckets'])),
+        }
+    return result
+
+
+def reset():
+    with _lock:
+        _views.clear()
+
+
+class RequestMetricsMiddleware:
+    """
+    Times every request and the queries it runs, adds the numbers as a
+    Server-Timing header and aggregates them per view for MetricsView.
+
+    Statistics live in process memory, so each worker reports its own.
+    Queries run while a StreamingHttpResponse is being consumed happen after
+    the middleware returns and aren't counted.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timer = QueryTimer()
+        start = time.perf_counter()
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+        return self.finish(request, response, timer, start)
+
+    async def __acall__(self, request):
+        # Under ASGI the ORM runs in the request's sync_to_async thread, so the
+        # wrapper has to go on that thread's connection.
+        timer = QueryTimer()
+        start = time.perf_counter()
+        await sync_to_async(_install)(timer)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(_remove)(timer)
+        return self.finish(request, response, timer, start)
+
+    def finish(self, request, response, timer, start):
+        total_ms = (time.perf_counter() - start) * 1000
+        db_ms = timer.duration * 1000
+
+        response['Server-Timing'] = 'db;dur=%.1f;desc="%d queries", app;dur=%.1f' % (
+            db_ms, timer.count, total_ms)
+
+        match = getattr(request, 'resolver_match', None)
+        view = '%s %s' % (request.method, match.view_name if match else 'unresolved')
+        record(view, total_ms, db_ms, timer.count)
+        return response
@@ -45,10 +45,12 @@ INSTALLED_APPS = [
 
     'Auth',
     'store',
+    'jobs',
 ]
 
 MIDDLEWARE = [
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'core.middleware.AsyncWhiteNoiseMiddleware',
+    'core.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     "corsheaders.middleware.CorsMiddleware",
@@ -105,6 +107,58 @@ else:
 
 AUTH_USER_MODEL = 'Auth.User'
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    }
+}
+
+# locmem is per process; with several gunicorn workers use a shared cache so
+# invalidations reach every worker:
+# CACHES = {
+#     'default': {
+#         'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+#         'LOCATION': 'redis://127.0.0.1:6379',
+#     }
+# }
+
+ORDER_COUNTERS_CACHE_TIMEOUT = 60
+CATALOGUE_CACHE_TIMEOUT = 300
+TOKEN_CACHE_TIMEOUT = 300
+# Cell size of the in-process dispatch grid (store.dispatch), ~2km of latitude
+DISPATCH_GRID_DEGREES = 0.02
+# Longest the index is kept up to date from published changes before it is
+# rebuilt from the database anyway
+DISPATCH_INDEX_MAX_AGE = 300
+# ShopListView ?near= search
+NEARBY_SHOPS_RADIUS_KM = 5
+NEARBY_SHOPS_MAX_RADIUS_KM = 50
+# Vendor sales analytics (store.analytics): default and longest date range
+ANALYTICS_DEFAULT_DAYS = 30
+ANALYTICS_MAX_DAYS = 366
+
+# Resized copies of Item, Shop and User images (core.images): longest side in
+# px per size, served as ?image_size=<name>&image_format=webp|jpeg
+IMAGE_VARIANTS = {
+    'thumb': 160,
+    'small': 320,
+    'medium': 640,
+    'large': 1280,
+}
+IMAGE_DEFAULT_VARIANT = 'small'
+IMAGE_QUALITY = 80
+
+# Receipts are sent from the background worker (manage.py run_worker); point
+# this at SMTP in production.
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'no-reply@fiscaliaycontraloria.com')
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -173,7 +227,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'Auth.authentication.CachingTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
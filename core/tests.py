@@ -0,0 +1,125 @@
+import re
+import shutil
+import tempfile
+from io import BytesIO
+
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.authtoken.models import Token
+
+from Auth.models import User
+from core import metrics
+from jobs import queue
+from jobs.models import FAILED, QUEUED, Job
+from store.models import Item, Shop
+
+
+class RequestMetricsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        vendor = User.objects.create(username='metrics-vendor', is_vendor=True)
+        Item.objects.create(shop=Shop.objects.create(user=vendor, name='Metrics shop'), name='Metered', price=1)
+        cls.staff_token = Token.objects.create(user=User.objects.create(username='metrics-staff', is_staff=True)).key
+        cls.user_token = Token.objects.create(user=User.objects.create(username='metrics-user')).key
+
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+    def get_metrics(self, token=None):
+        headers = {'authorization': 'Token %s' % token} if token else {}
+        return self.client.get('/api/metrics/', headers=headers)
+
+    def test_records_queries_and_timing(self):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get('/api/products/?PageSize=5')
+        match = re.fullmatch(r'db;dur=[\d.]+;desc="(\d+) queries", app;dur=([\d.]+)', response['Server-Timing'])
+        self.assertIsNotNone(match)
+        queries = len(captured)
+        self.assertGreater(queries, 0)
+        self.assertEqual(int(match.group(1)), queries)
+
+        stats = self.get_metrics(self.staff_token).json()['GET store.views.ItemListView']
+        self.assertEqual(stats['requests'], 1)
+        self.assertEqual(stats['mean_queries'], queries)
+        self.assertEqual(stats['max_queries'], queries)
+        self.assertGreater(stats['mean_ms'], 0)
+        self.assertEqual(sum(stats['latency_ms'].values()), 1)
+
+    def test_not_public(self):
+        self.assertEqual(self.get_metrics().status_code, 401)
+        self.assertEqual(self.get_metrics(self.user_token).status_code, 403)
+        response = self.client.delete('/api/metrics/', headers={'authorization': 'Token %s' % self.user_token})
+        self.assertEqual(response.status_code, 403)
+
+    def test_reset(self):
+        self.client.get('/api/products/')
+        response = self.client.delete('/api/metrics/', headers={'authorization': 'Token %s' % self.staff_token})
+        self.assertEqual(response.status_code, 200)
+        # Only the reset request itself has been recorded since
+        self.assertEqual(list(metrics.snapshot()), ['DELETE core.views.MetricsView'])
+
+
+class ImageVariantTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        vendor = User.objects.create(username='variants-vendor', is_vendor=True)
+        cls.shop = Shop.objects.create(user=vendor, name='Variants shop')
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(
+            DEFAULT_FILE_STORAGE='django.core.files.storage.FileSystemStorage', MEDIA_ROOT=media_root,
+            IMAGE_VARIANTS={'thumb': 160, 'large': 1280})
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def upload(self, name, content):
+        return Item.objects.create(shop=self.shop, name='Pictured', price=1, image=SimpleUploadedFile(name, content))
+
+    def run_job(self):
+        job = queue.claim('test-worker', 1)[0]
+        return queue.run(job), Job.objects.get(pk=job.pk)
+
+    def test_upload_builds_the_variants(self):
+        buffer = BytesIO()
+        Image.new('RGB', (400, 200), 'red').save(buffer, 'PNG')
+        item = self.upload('red.png', buffer.getvalue())
+        job = Job.objects.get()
+        self.assertEqual((job.name, job.args, job.status),
+                         ('core.images.build_variants', ['store.Item', item.pk, item.image.name], QUEUED))
+
+        ok, job = self.run_job()
+        self.assertTrue(ok)
+        self.assertEqual(job.result, {'variants': 4})
+        item.refresh_from_db()
+        self.assertEqual(set(item.image_variants), {'source', 'thumb.webp', 'thumb.jpeg', 'large.webp', 'large.jpeg'})
+        self.assertEqual(item.image_variants['source'], item.image.name)
+        sizes = {}
+        for key in ('thumb.webp', 'thumb.jpeg', 'large.webp'):
+            with default_storage.open(item.image_variants[key]) as f:
+                image = Image.open(f)
+                sizes[key] = (image.format, image.size)
+        # Never scaled up past the original
+        self.assertEqual(sizes, {'thumb.webp': ('WEBP', (160, 80)), 'thumb.jpeg': ('JPEG', (160, 80)),
+                                 'large.webp': ('WEBP', (400, 200))})
+        # Storing the variants doesn't queue another job
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_corrupt_image(self):
+        item = self.upload('broken.jpg', b'not an image')
+        for _ in range(3):
+            # Due now instead of after the retry backoff
+            Job.objects.update(run_at=timezone.now())
+            ok, job = self.run_job()
+            self.assertFalse(ok)
+        self.assertEqual((job.status, job.attempts), (FAILED, 3))
+        self.assertIn('UnidentifiedImageError', job.last_error)
+        item.refresh_from_db()
+        self.assertEqual(item.image_variants, {})
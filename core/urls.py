@@ -2,9 +2,12 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
+from .views import MetricsView
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('api/metrics/', MetricsView.as_view()),
+    path('api/', include('jobs.urls')),
     path('', include('Auth.urls')),
     path('api/', include('store.urls')),
 ]
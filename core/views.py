@@ -0,0 +1,16 @@
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from . import metrics
+
+
+class MetricsView(APIView):
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request, format=None):
+        return Response(metrics.snapshot())
+
+    def delete(self, request, format=None):
+        metrics.reset()
+        return Response({'success': 'Metrics reset'})
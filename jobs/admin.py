@@ -0,0 +1,12 @@
+from django.contrib import admin
+
+from .models import Job
+
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'status', 'attempts', 'run_at', 'locked_by', 'finished_at']
+    list_filter = ['status', 'name']
+    search_fields = ['name']
+
+
+admin.site.register(Job, JobAdmin)
@@ -0,0 +1,75 @@
+import signal
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from jobs import queue
+
+
+class Command(BaseCommand):
+    help = 'Runs queued background jobs on a thread pool until stopped (SIGTERM/SIGINT finish the current batch).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument('--poll', type=float, default=1.0, help='Seconds to sleep when the queue is empty.')
+        parser.add_argument('--stale-after', type=int, default=600,
+                            help='Seconds after which a running job is assumed lost and requeued.')
+        parser.add_argument('--keep-done', type=int, default=7, help='Days to keep finished jobs.')
+        parser.add_argument('--once', action='store_true', help='Exit once no job is due.')
+
+    def handle(self, *args, **options):
+        worker = queue.worker_id()
+        stale_after = timedelta(seconds=options['stale_after'])
+        keep_done = timedelta(days=options['keep_done'])
+        stopping = []
+
+        def stop(signum, frame):
+            stopping.append(signum)
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        def execute(job):
+            close_old_connections()
+            try:
+                return queue.run(job)
+            finally:
+                close_old_connections()
+
+        self.stdout.write('worker %s: %d threads' % (worker, options['threads']))
+        housekeeping = 0
+        in_flight = {}
+        with ThreadPoolExecutor(max_workers=options['threads'], thread_name_prefix='jobs') as pool:
+            while in_flight or not stopping:
+                if time.monotonic() >= housekeeping:
+                    housekeeping = time.monotonic() + 60
+                    try:
+                        queue.requeue_stale(stale_after)
+                        queue.purge(keep_done)
+                    except Exception as e:
+                        self.stderr.write('housekeeping failed: %r' % e)
+
+                # Keep every thread busy without claiming more than can start now
+                free = options['threads'] - len(in_flight)
+                if free and not stopping:
+                    for job in queue.claim(worker, free):
+                        in_flight[pool.submit(execute, job)] = job
+
+                if not in_flight:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll'])
+                    continue
+                done, _ = wait(in_flight, timeout=options['poll'], return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = in_flight.pop(future)
+                    try:
+                        ok = future.result()
+                    except Exception as e:
+                        # Recording the outcome failed; requeue_stale() picks the job up later
+                        self.stderr.write('%s: %r' % (job, e))
+                        continue
+                    self.stdout.write('%s %s (attempt %d)' % ('done' if ok else 'error', job, job.attempts))
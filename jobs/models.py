@@ -0,0 +1,66 @@
+from django.db import models
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+
+QUEUED = 'Q'
+RUNNING = 'R'
+DONE = 'D'
+FAILED = 'F'
+
+STATUS_CHOICES = (
+    (QUEUED, 'Queued'),
+    (RUNNING, 'Running'),
+    (DONE, 'Done'),
+    (FAILED, 'Failed'),
+)
+
+
+class JobQuerySet(models.QuerySet):
+    def due(self):
+        return self.filter(status=QUEUED, run_at__lte=timezone.now())
+
+    def depth(self):
+        # Queue-depth gauges in one aggregate plus the queued count per task
+        now = timezone.now()
+        stats = self.aggregate(
+            queued=Count('id', filter=Q(status=QUEUED)),
+            due=Count('id', filter=Q(status=QUEUED, run_at__lte=now)),
+            running=Count('id', filter=Q(status=RUNNING)),
+            failed=Count('id', filter=Q(status=FAILED)),
+            oldest_due=Min('run_at', filter=Q(status=QUEUED, run_at__lte=now)),
+        )
+        oldest_due = stats.pop('oldest_due')
+        stats['oldest_due_seconds'] = round((now - oldest_due).total_seconds(), 1) if oldest_due else 0.0
+        stats['queued_by_task'] = dict(
+            self.filter(status=QUEUED).values_list('name').annotate(count=Count('id')).order_by('name')
+        )
+        return stats
+
+
+class Job(models.Model):
+    name = models.CharField(max_length=100)
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=1, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True, null=True)
+    locked_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True, null=True)
+    result = models.JSONField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    objects = JobQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # The worker's claim query
+            models.Index(fields=['run_at'], condition=Q(status=QUEUED), name='job_due_idx'),
+            models.Index(fields=['locked_at'], condition=Q(status=RUNNING), name='job_running_idx'),
+            models.Index(fields=['status', 'finished_at'], name='job_status_finished_idx'),
+        ]
+
+    def __str__(self):
+        return '%s #%s' % (self.name, self.pk)
@@ -0,0 +1,124 @@
+import os
+import random
+import socket
+import traceback
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import DONE, FAILED, QUEUED, RUNNING, Job
+
+
+class UnknownTask(Exception):
+    pass
+
+
+_registry = {}
+
+
+class Task:
+    def __init__(self, fn, name, max_attempts, backoff):
+        self.fn = fn
+        self.name = name
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+
+    def __call__(self, *args, **kwargs):
+        return self.fn(*args, **kwargs)
+
+    def delay(self, *args, **kwargs):
+        return enqueue(self.name, args, kwargs)
+
+    def retry_delay(self, attempts):
+        # Exponential backoff with jitter, capped at an hour
+        return min(3600, self.backoff * 2 ** (attempts - 1)) + random.uniform(0, self.backoff)
+
+
+def task(name=None, max_attempts=5, backoff=10):
+    """
+    Registers a function as a background task. Call it normally to run it
+    inline or with .delay(*args, **kwargs) to queue it; arguments must be
+    JSON-serializable.
+    """
+    def decorator(fn):
+        wrapped = Task(fn, name or '%s.%s' % (fn.__module__, fn.__name__), max_attempts, backoff)
+        _registry[wrapped.name] = wrapped
+        return wrapped
+    return decorator
+
+
+def get_task(name):
+    try:
+        return _registry[name]
+    except KeyError:
+        raise UnknownTask(name)
+
+
+def enqueue(name, args=(), kwargs=None, run_at=None):
+    """
+    Queues task `name`. The job row is written in the caller's transaction,
+    so it is only picked up once that commits and disappears if it rolls
+    back.
+    """
+    return Job.objects.create(
+        name=name, args=list(args), kwargs=kwargs or {},
+        max_attempts=get_task(name).max_attempts, run_at=run_at or timezone.now(),
+    )
+
+
+def worker_id():
+    return '%s:%s' % (socket.gethostname(), os.getpid())
+
+
+def claim(worker, limit):
+    """Marks up to limit due jobs as running for worker and returns them."""
+    with transaction.atomic():
+        ids = list(
+            Job.objects.due().select_for_update(skip_locked=True).order_by('run_at').values_list('id', flat=True)[:limit]
+        )
+        if not ids:
+            return []
+        Job.objects.filter(id__in=ids).update(
+            status=RUNNING, locked_by=worker, locked_at=timezone.now(), attempts=F('attempts') + 1
+        )
+    return list(Job.objects.filter(id__in=ids, locked_by=worker).order_by('run_at'))
+
+
+def requeue_stale(older_than):
+    """
+    Puts back jobs whose worker died mid-run; that run counts as an attempt.
+    A job that has used up its attempts, say one that keeps killing its
+    worker, is closed as failed instead. Returns the number requeued.
+    """
+    stale = Job.objects.filter(status=RUNNING, locked_at__lt=timezone.now() - older_than)
+    stale.filter(attempts__gte=F('max_attempts')).update(
+        status=FAILED, locked_by=None, last_error='Worker died while running the job.', finished_at=timezone.now()
+    )
+    return stale.update(status=QUEUED, locked_by=None, locked_at=None, run_at=timezone.now())
+
+
+def run(job):
+    """Runs a claimed job, then records its result or schedules the retry."""
+    # Only the worker still holding the job may record the outcome
+    claimed = Job.objects.filter(pk=job.pk, status=RUNNING, locked_by=job.locked_by)
+    try:
+        handler = get_task(job.name)
+        result = handler(*job.args, **job.kwargs)
+    except Exception as e:
+        error = traceback.format_exc()
+        retry = not isinstance(e, UnknownTask) and job.attempts < job.max_attempts
+        if retry:
+            claimed.update(status=QUEUED, locked_by=None, locked_at=None, last_error=error,
+                           run_at=timezone.now() + timedelta(seconds=handler.retry_delay(job.attempts)))
+        else:
+            claimed.update(status=FAILED, locked_by=None, last_error=error, finished_at=timezone.now())
+        return False
+    claimed.update(status=DONE, locked_by=None, result=result, finished_at=timezone.now())
+    return True
+
+
+def purge(older_than):
+    """Deletes jobs that finished successfully more than older_than ago."""
+    return Job.objects.filter(status=DONE, finished_at__lt=timezone.now() - older_than).delete()[0]
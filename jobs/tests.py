@@ -0,0 +1,73 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from jobs import queue
+from jobs.models import DONE, FAILED, QUEUED, Job
+
+calls = []
+
+
+@queue.task(name='jobs.tests.flaky', max_attempts=2, backoff=10)
+def flaky(fail=True):
+    calls.append(fail)
+    if fail:
+        raise RuntimeError('flaky failed')
+    return {'ok': True}
+
+
+class QueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def run_next(self):
+        jobs = queue.claim('test-worker', 1)
+        self.assertEqual(len(jobs), 1)
+        return queue.run(jobs[0]), Job.objects.get(pk=jobs[0].pk)
+
+    def test_success(self):
+        flaky.delay(fail=False)
+        ok, job = self.run_next()
+        self.assertTrue(ok)
+        self.assertEqual((job.status, job.result, job.attempts), (DONE, {'ok': True}, 1))
+
+    def test_retry_then_fail(self):
+        flaky.delay()
+        ok, job = self.run_next()
+        self.assertFalse(ok)
+        self.assertEqual((job.status, job.attempts, job.locked_by), (QUEUED, 1, None))
+        self.assertIn('flaky failed', job.last_error)
+        self.assertGreater(job.run_at, timezone.now())
+
+        # Due again: the second attempt is the last one
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now())
+        ok, job = self.run_next()
+        self.assertEqual((job.status, job.attempts), (FAILED, 2))
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(calls, [True, True])
+
+    def test_unknown_task_is_not_retried(self):
+        Job.objects.create(name='jobs.tests.missing', max_attempts=5, run_at=timezone.now())
+        ok, job = self.run_next()
+        self.assertEqual((ok, job.status), (False, FAILED))
+
+    def test_requeue_stale(self):
+        flaky.delay()
+        stale = queue.claim('dead-worker', 1)[0]
+        Job.objects.update(locked_at=timezone.now() - timedelta(hours=1))
+
+        self.assertEqual(queue.requeue_stale(timedelta(minutes=5)), 1)
+        stale.refresh_from_db()
+        self.assertEqual((stale.status, stale.locked_by, stale.attempts), (QUEUED, None, 1))
+
+    def test_requeue_stale_gives_up_after_max_attempts(self):
+        flaky.delay()
+        for attempt in (1, 2):
+            job = queue.claim('dead-worker', 1)[0]
+            Job.objects.update(locked_at=timezone.now() - timedelta(hours=1))
+            self.assertEqual(queue.requeue_stale(timedelta(minutes=5)), 1 if attempt == 1 else 0)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.locked_by), (FAILED, 2, None))
+        self.assertIsNotNone(job.finished_at)
+        self.assertEqual(queue.claim('test-worker', 1), [])
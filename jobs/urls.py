@@ -0,0 +1,8 @@
+from django.urls import path
+
+from .views import JobDetailView, QueueMetricsView
+
+urlpatterns = [
+    path('metrics/jobs/', QueueMetricsView.as_view()),
+    path('jobs/<pk>/', JobDetailView.as_view()),
+]
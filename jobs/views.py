@@ -0,0 +1,30 @@
+from django.shortcuts import get_object_or_404
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .models import Job
+
+
+class QueueMetricsView(APIView):
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request, format=None):
+        return Response(Job.objects.depth())
+
+
+class JobDetailView(APIView):
+    # Polled by clients that queued an export
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request, pk, format=None):
+        job = get_object_or_404(Job, pk=pk)
+        return Response({
+            'id': job.id,
+            'name': job.name,
+            'status': job.get_status_display().lower(),
+            'attempts': job.attempts,
+            'result': job.result,
+            'created_at': job.created_at,
+            'finished_at': job.finished_at,
+        })
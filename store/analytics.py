@@ -0,0 +1,210 @@
+"""
+Per-shop sales rollups: revenue, orders and units per day (ShopDailySales),
+units and revenue per item per day (ItemDailySales) and the number of orders
+in each status (ShopOrderStatus).
+
+checkout() records each sale and the dispatch transitions move orders
+between statuses inside their own transactions, so the rollups commit or
+roll back with the order. Reports read them in O(days) instead of scanning
+orders. Edits made outside those paths (the admin, deleted orders) are not
+tracked; rebuild() (manage.py rebuild_sales_rollups) recomputes everything
+from the orders.
+"""
+import datetime
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, DecimalField, F, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import ItemDailySales, Order, ShopDailySales, ShopOrderStatus
+from .pricing import ZERO, item_price, money, price_line
+
+
+def order_status(order):
+    # The same buckets as OrderQuerySet.status_counts()
+    if not order.ordered:
+        return None
+    if order.received:
+        return 'received'
+    if order.being_delivered:
+        return 'being_delivered'
+    return 'new'
+
+
+def _increment(model, lookup, defaults=None, **deltas):
+    # UPDATE ... SET x = x + n, or create the row (with defaults). The unique
+    # constraints make a concurrent create fail, in which case the row now
+    # exists.
+    updates = {field: F(field) + value for field, value in deltas.items()}
+    if model.objects.filter(**lookup).update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **(defaults or {}), **deltas)
+    except IntegrityError:
+        model.objects.filter(**lookup).update(**updates)
+
+
+def _sale_date(prefix=''):
+    # The day an order was paid for; ordered_date for orders from before payments
+    return TruncDate(Coalesce(prefix + 'payment__timestamp', prefix + 'ordered_date'))
+
+
+def _increment_items(date, totals):
+    # Two statements whatever the number of items: insert the missing rows
+    # (a row created concurrently is skipped by the unique constraint), then
+    # add every item's units and revenue in one UPDATE ... CASE.
+    ItemDailySales.objects.bulk_create(
+        [ItemDailySales(item_id=item_id, shop_id=row['shop_id'], date=date) for item_id, row in totals.items()],
+        ignore_conflicts=True)
+
+    def delta(field, output_field):
+        return F(field) + Case(
+            *[When(item_id=item_id, then=Value(row[field])) for item_id, row in totals.items()],
+            output_field=output_field)
+
+    ItemDailySales.objects.filter(date=date, item_id__in=totals).update(
+        units=delta('units', IntegerField()),
+        revenue=delta('revenue', DecimalField(max_digits=14, decimal_places=2)))
+
+
+def record_checkout(order, amount, order_items):
+    """
+    Adds a just paid order to the rollups. amount is what was charged for
+    it, coupon included, and order_items its lines as priced by
+    pricing.price_items(). Call inside the checkout transaction; it takes
+    the same number of queries for any number of lines.
+    """
+    date = timezone.localdate(order.payment.timestamp) if order.payment_id else timezone.localdate()
+    totals = {}
+    for order_item in order_items:
+        row = totals.setdefault(order_item.item_id, {'shop_id': order_item.item.shop_id, 'units': 0, 'revenue': ZERO})
+        row['units'] += order_item.quantity
+        row['revenue'] += item_price(order_item).final_price
+    if totals:
+        _increment_items(date, totals)
+    if order.shop_id is not None:
+        units = sum(row['units'] for row in totals.values())
+        _increment(ShopDailySales, {'shop_id': order.shop_id, 'date': date},
+                   orders=1, units=units, revenue=amount)
+        _increment(ShopOrderStatus, {'shop_id': order.shop_id, 'status': order_status(order)}, count=1)
+
+
+def record_transition(order, previous):
+    """Moves order from status previous to its current one. Call in the transaction that saved it."""
+    current = order_status(order)
+    if order.shop_id is None or previous == current:
+        return
+    if previous is not None:
+        _increment(ShopOrderStatus, {'shop_id': order.shop_id, 'status': previous}, count=-1)
+    if current is not None:
+        _increment(ShopOrderStatus, {'shop_id': order.shop_id, 'status': current}, count=1)
+
+
+def rebuild(shop_id=None):
+    """
+    Recomputes the rollups of one shop, or of every shop, from the paid
+    orders. Shop revenue is what each order's payment charged. Order items
+    don't keep the price they were sold at, so item revenue, and the
+    revenue of orders from before payments, is only an approximation at
+    today's prices. Returns the number of rows of each rollup written.
+    """
+    orders = Order.objects.filter(ordered=True, shop__isnull=False)
+    lines = Order.items.through.objects.filter(order__ordered=True)
+    if shop_id is not None:
+        orders = orders.filter(shop_id=shop_id)
+        lines = lines.filter(Q(order__shop_id=shop_id) | Q(orderitem__item__shop_id=shop_id))
+
+    # Lines are priced as checkout prices them (pricing.order_total()): each
+    # line rounded, then added up per order.
+    subtotals = defaultdict(lambda: ZERO)
+    item_days = defaultdict(lambda: {'units': 0, 'revenue': ZERO})
+    lines = lines.annotate(date=_sale_date('order__')).values_list(
+        'order_id', 'orderitem__item_id', 'orderitem__item__shop_id', 'orderitem__quantity',
+        'orderitem__item__price', 'orderitem__item__discount_price', 'date')
+    for order_id, item_id, item_shop_id, quantity, price, discount_price, date in lines.iterator(chunk_size=2000):
+        final_price = price_line(price, discount_price, quantity).final_price
+        subtotals[order_id] += final_price
+        if shop_id is not None and item_shop_id != shop_id:
+            continue
+        row = item_days[item_id, item_shop_id, date]
+        row['units'] += quantity
+        row['revenue'] += final_price
+
+    shop_days = defaultdict(lambda: {'orders': 0, 'units': 0, 'revenue': ZERO})
+    statuses = defaultdict(int)
+    for order in orders.annotate(
+            date=_sale_date(),
+            units=Coalesce(Sum('items__quantity'), 0),
+            coupon_amount=F('coupon__amount'),
+            amount=F('payment__amount'),
+    ).only('id', 'shop_id', 'ordered', 'being_delivered', 'received').iterator(chunk_size=2000):
+        row = shop_days[order.shop_id, order.date]
+        row['orders'] += 1
+        row['units'] += order.units
+        if order.amount is not None:
+            row['revenue'] += money(order.amount)
+        else:
+            # As pricing.order_total() would have charged it
+            revenue = subtotals.get(order.id, ZERO)
+            if order.coupon_amount is not None:
+                revenue -= money(order.coupon_amount)
+            row['revenue'] += max(revenue, ZERO)
+        statuses[order.shop_id, order_status(order)] += 1
+
+    with transaction.atomic():
+        scopes = [ShopDailySales.objects.all(), ItemDailySales.objects.all(), ShopOrderStatus.objects.all()]
+        for queryset in scopes:
+            (queryset if shop_id is None else queryset.filter(shop_id=shop_id)).delete()
+        ShopDailySales.objects.bulk_create(
+            [ShopDailySales(shop_id=shop, date=date, **row) for (shop, date), row in shop_days.items()],
+            batch_size=1000)
+        ItemDailySales.objects.bulk_create(
+            [ItemDailySales(item_id=item, shop_id=shop, date=date, **row)
+             for (item, shop, date), row in item_days.items()],
+            batch_size=1000)
+        ShopOrderStatus.objects.bulk_create(
+            [ShopOrderStatus(shop_id=shop, status=status, count=count)
+             for (shop, status), count in statuses.items()],
+            batch_size=1000)
+    return {'days': len(shop_days), 'item_days': len(item_days), 'statuses': len(statuses)}
+
+
+def daily_sales(shop_id, start, end):
+    """Orders, units and revenue for every day from start to end, zeros included, and their totals."""
+    rows = {
+        row['date']: row for row in ShopDailySales.objects.filter(
+            shop_id=shop_id, date__range=(start, end)).values('date', 'orders', 'units', 'revenue')
+    }
+    days = []
+    totals = {'orders': 0, 'units': 0, 'revenue': ZERO}
+    date = start
+    while date <= end:
+        row = rows.get(date, {'date': date, 'orders': 0, 'units': 0, 'revenue': ZERO})
+        days.append(row)
+        for field in totals:
+            totals[field] += row[field]
+        date += datetime.timedelta(days=1)
+    return {'days': days, 'totals': totals}
+
+
+def item_sales(shop_id, start, end, limit=10):
+    """The shop's best selling items by revenue between start and end."""
+    return list(
+        ItemDailySales.objects.filter(shop_id=shop_id, date__range=(start, end))
+        .values('item_id', name=F('item__name'))
+        .annotate(units=Sum('units'), revenue=Sum('revenue'))
+        .order_by('-revenue', 'item_id')[:limit]
+    )
+
+
+def status_counts(shop_id):
+    # Same keys as the OrderListView counters
+    counts = dict(ShopOrderStatus.objects.filter(shop_id=shop_id).values_list('status', 'count'))
+    return {
+        'being_delivered': counts.get('being_delivered', 0),
+        'received': counts.get('received', 0),
+        'newOrder': counts.get('new', 0),
+    }
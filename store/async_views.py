@@ -0,0 +1,157 @@
+"""
+Async versions of the hottest read endpoints, mounted under api/async/.
+
+They return the same payloads as their DRF counterparts in store.views but
+await the database instead of blocking, so under ASGI (see core/asgi.py) a
+worker keeps serving other requests during every Postgres round trip.
+Serialization reuses the DRF serializers over fully prefetched rows and
+never touches the database itself.
+"""
+import math
+
+from django.http import JsonResponse
+from django.views import View
+from rest_framework import exceptions
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from Auth.authentication import aauthenticate
+from .cache import CATALOGUE_CATEGORIES, CATALOGUE_SHOPS, catalogue_item_key, catalogue_list_key, get_catalogue, set_catalogue
+from .conditional import aqueryset_validators, not_modified, set_validators, validators
+from .models import Item, Order
+from .serializers import ItemDetailSerializer, ItemSerializer, OrderSerializer, ShopSerializer
+from .views import item_list_queryset, shop_list_queryset
+
+
+def json_response(data, status=200):
+    # Same encoding as DRF's JSONRenderer
+    return JsonResponse(data, status=status, safe=False, encoder=JSONEncoder,
+                        json_dumps_params={'ensure_ascii': False, 'separators': (',', ':')})
+
+
+def _positive_int(value):
+    value = int(value)
+    if value <= 0:
+        raise ValueError(value)
+    return value
+
+
+async def apaginate(request, queryset, serialize):
+    """
+    Async equivalent of CustomPagination: pages of ?PageSize= rows selected
+    with ?page=, or every row when PageSize is missing or invalid.
+    """
+    try:
+        page_size = _positive_int(request.GET.get('PageSize'))
+    except (TypeError, ValueError):
+        return serialize([obj async for obj in queryset])
+
+    count = await queryset.acount()
+    num_pages = max(1, math.ceil(count / page_size))
+    page = request.GET.get('page', 1)
+    try:
+        page = num_pages if page == 'last' else _positive_int(page)
+    except ValueError:
+        raise exceptions.NotFound('Invalid page.')
+    if page > num_pages:
+        raise exceptions.NotFound('Invalid page.')
+
+    offset = (page - 1) * page_size
+    rows = [obj async for obj in queryset[offset:offset + page_size]]
+    url = request.build_absolute_uri()
+    previous = None
+    if page > 1:
+        previous = remove_query_param(url, 'page') if page == 2 else replace_query_param(url, 'page', page - 1)
+    return {
+        'count': count,
+        'next': replace_query_param(url, 'page', page + 1) if page < num_pages else None,
+        'previous': previous,
+        'results': serialize(rows),
+    }
+
+
+class AsyncAPIView(View):
+    """
+    Token authentication and DRF-style error bodies for async views. The
+    authenticated user (or None) is available as self.user.
+    """
+    authentication_required = False
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            self.user = await aauthenticate(request)
+            if self.authentication_required and self.user is None:
+                raise exceptions.NotAuthenticated()
+            return await super().dispatch(request, *args, **kwargs)
+        except exceptions.APIException as e:
+            response = json_response({'detail': e.detail}, status=e.status_code)
+            if isinstance(e, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+                response['WWW-Authenticate'] = 'Token'
+            return response
+
+
+class AsyncItemListView(AsyncAPIView):
+    async def get(self, request, *args, **kwargs):
+        if 'cursor' in request.GET:
+            raise exceptions.ParseError('Cursor pagination is only available on /api/products/')
+        queryset = item_list_queryset(self.user, request.GET)
+
+        etag, last_modified = await aqueryset_validators(queryset, request, self.user, [CATALOGUE_SHOPS])
+        response = not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+
+        key = catalogue_list_key(request, self.user)
+        data = get_catalogue(key)
+        if data is None:
+            context = {'request': request, 'shop_cache': {}}
+            data = await apaginate(request, queryset, lambda rows: ItemSerializer(rows, many=True, context=context).data)
+            results = data['results'] if isinstance(data, dict) else data
+            set_catalogue(key, data, {item['shop']['id'] for item in results})
+        return set_validators(json_response(data), etag, last_modified)
+
+
+class AsyncItemDetailView(AsyncAPIView):
+    async def get(self, request, pk, *args, **kwargs):
+        updated_at = await Item.objects.filter(id=pk).values_list('updated_at', flat=True).afirst()
+        if updated_at is None:
+            raise exceptions.NotFound()
+        etag, last_modified = validators([pk, updated_at], updated_at, [CATALOGUE_CATEGORIES])
+        response = not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+
+        key = catalogue_item_key(pk)
+        data = get_catalogue(key)
+        if data is None:
+            try:
+                instance = await Item.objects.select_related('category').aget(id=pk)
+            except Item.DoesNotExist:
+                raise exceptions.NotFound()
+            data = ItemDetailSerializer(instance).data
+            set_catalogue(key, data, [instance.shop_id])
+        return set_validators(json_response(data), etag, last_modified)
+
+
+class AsyncShopListView(AsyncAPIView):
+    async def get(self, request, *args, **kwargs):
+        queryset = shop_list_queryset(request.GET)
+        etag, last_modified = await aqueryset_validators(queryset, request, self.user, [CATALOGUE_SHOPS])
+        response = not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+
+        context = {'request': request}
+        data = await apaginate(request, queryset, lambda rows: ShopSerializer(rows, many=True, context=context).data)
+        return set_validators(json_response(data), etag, last_modified)
+
+
+class AsyncOrderDetailView(AsyncAPIView):
+    authentication_required = True
+
+    async def get(self, request, *args, **kwargs):
+        try:
+            order = await Order.objects.with_summary().aget(user=self.user, ordered=False)
+        except Order.DoesNotExist:
+            raise exceptions.NotFound()
+        return json_response(OrderSerializer(order, context={'request': request}).data)
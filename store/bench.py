@@ -0,0 +1,230 @@
+"""
+Helpers shared by the benchmark management commands.
+
+Benchmarks never touch the configured database: they run against a
+throwaway test database created from the current migrations, so they are
+safe to point at a production settings module. Numbers taken on SQLite are
+only useful for query counts; throughput and latency should be measured
+against Postgres.
+"""
+import random
+import statistics
+import threading
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+from django.utils import timezone
+
+from Auth.models import User
+from .models import Address, Item, Order, OrderItem, Shop
+
+
+@contextmanager
+def throwaway_database(keepdb=False):
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False, keepdb=keepdb)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keepdb)
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+def count_queries(captured):
+    """Number of statements in a CaptureQueriesContext, ignoring transaction control."""
+    control = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+    return sum(1 for query in captured.captured_queries if not query['sql'].upper().startswith(control))
+
+
+class BenchResult:
+    def __init__(self, elapsed, latencies, errors):
+        self.elapsed = elapsed
+        self.latencies = latencies
+        self.errors = errors
+
+    @property
+    def calls(self):
+        return len(self.latencies)
+
+    @property
+    def throughput(self):
+        return self.calls / self.elapsed if self.elapsed else 0.0
+
+    def summary(self):
+        ms = [latency * 1000 for latency in self.latencies]
+        return {
+            'calls': self.calls,
+            'errors': len(self.errors),
+            'throughput': round(self.throughput, 1),
+            'mean_ms': round(statistics.mean(ms), 2) if ms else 0.0,
+            'p50_ms': round(percentile(ms, 50), 2),
+            'p95_ms': round(percentile(ms, 95), 2),
+            'p99_ms': round(percentile(ms, 99), 2),
+        }
+
+
+def run_concurrently(fn, jobs, clients):
+    """
+    Calls fn(*args) for every args tuple in jobs, spread over `clients`
+    threads, and returns a BenchResult with per-call latencies.
+    """
+    jobs = iter(list(jobs))
+    lock = threading.Lock()
+    latencies = []
+    errors = []
+
+    def worker():
+        try:
+            while True:
+                with lock:
+                    args = next(jobs, None)
+                if args is None:
+                    return
+                start = time.perf_counter()
+                try:
+                    fn(*args)
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                elapsed = time.perf_counter() - start
+                with lock:
+                    latencies.append(elapsed)
+        finally:
+            # Every thread gets its own connection; don't leak them.
+            connection.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return BenchResult(time.perf_counter() - start, latencies, errors)
+
+
+def seed_catalogue(shops, items_per_shop):
+    vendors = User.objects.bulk_create([
+        User(username='bench-vendor-%d' % i, is_vendor=True) for i in range(shops)
+    ])
+    shop_objs = Shop.objects.bulk_create([
+        Shop(user=vendor, name='Bench shop %d' % i) for i, vendor in enumerate(vendors)
+    ])
+    Address.objects.bulk_create([
+        Address(user=vendor, address='Bench street %d' % i, lat=6.25 + (i % 100) * 0.001,
+                lng=-75.56 + (i // 100) * 0.001, address_type='S', default=True)
+        for i, vendor in enumerate(vendors)
+    ])
+    Item.objects.bulk_create([
+        Item(shop=shop, name='Bench item %d-%d' % (i, j), slug='bench-item-%d-%d' % (i, j),
+             price=10 + j % 50, discount_price=(8 + j % 50) if j % 3 == 0 else None)
+        for i, shop in enumerate(shop_objs) for j in range(items_per_shop)
+    ])
+    return shop_objs
+
+
+def seed_located_shops(count, start=0, rng=None, batch_size=5000):
+    """
+    Creates count vendors, each with a shop and one default address spread
+    uniformly over a ~110 x 110 km area. start offsets the usernames so
+    repeated calls keep adding shops.
+    """
+    rng = rng or random.Random(0)
+    for offset in range(start, start + count, batch_size):
+        size = min(batch_size, start + count - offset)
+        vendors = User.objects.bulk_create([
+            User(username='bench-located-%d' % (offset + i), is_vendor=True) for i in range(size)
+        ])
+        Shop.objects.bulk_create([Shop(user=vendor, name='Located shop %d' % vendor.pk) for vendor in vendors])
+        Address.objects.bulk_create([
+            Address(user=vendor, lat=rng.uniform(6.0, 7.0), lng=rng.uniform(-76.0, -75.0),
+                    address_type='S', default=True)
+            for vendor in vendors
+        ])
+
+
+def seed_customers(count, balance=0, prefix='bench-client'):
+    return User.objects.bulk_create([
+        User(username='%s-%d' % (prefix, i), is_client=True, acc_balance=balance)
+        for i in range(count)
+    ])
+
+
+def seed_open_orders(customers, items, items_per_order=3):
+    """Gives every customer an open cart holding items_per_order items."""
+    items = list(items)
+    orders = Order.objects.bulk_create([
+        Order(user=customer, shop_id=items[0].shop_id, ordered_date=timezone.now())
+        for customer in customers
+    ])
+    order_items = OrderItem.objects.bulk_create([
+        OrderItem(user=customer, item=items[(i + j) % len(items)], quantity=1 + j)
+        for i, customer in enumerate(customers) for j in range(items_per_order)
+    ])
+    Order.items.through.objects.bulk_create([
+        Order.items.through(order_id=order.id, orderitem_id=order_items[i * items_per_order + j].id)
+        for i, order in enumerate(orders) for j in range(items_per_order)
+    ])
+    return orders
+
+
+def seed_order_history(customers, items, orders_per_customer, items_per_order=2):
+    """
+    Creates paid orders spread over the new / being delivered / received
+    states, plus one open cart per customer.
+    """
+    items = list(items)
+    now = timezone.now()
+    orders = []
+    for i, customer in enumerate(customers):
+        for j in range(orders_per_customer):
+            state = (i + j) % 3
+            orders.append(Order(
+                user=customer, shop_id=items[(i + j) % len(items)].shop_id, ordered_date=now,
+                ordered=True, being_delivered=state == 1, received=state == 2,
+                ref_code='bench%015d' % len(orders),
+            ))
+        orders.append(Order(user=customer, shop_id=items[i % len(items)].shop_id, ordered_date=now))
+    orders = Order.objects.bulk_create(orders, batch_size=2000)
+
+    order_items = OrderItem.objects.bulk_create([
+        OrderItem(user=order.user, item=items[(i * items_per_order + j) % len(items)],
+                  quantity=1 + j, ordered=order.ordered)
+        for i, order in enumerate(orders) for j in range(items_per_order)
+    ], batch_size=2000)
+    Order.items.through.objects.bulk_create([
+        Order.items.through(order_id=order.id, orderitem_id=order_items[i * items_per_order + j].id)
+        for i, order in enumerate(orders) for j in range(items_per_order)
+    ], batch_size=2000)
+    return orders
+
+
+def seed_store(customers=200, shops=20, items_per_shop=50, orders_per_customer=5, balance=100000):
+    """
+    A small but realistic store: shops with their vendors, addresses and
+    catalogue, customers with a shipping address, an auth token, an order
+    history across every status and an open cart, and enough balance to
+    pay for it. Returns the customers, their tokens and the items.
+    """
+    from rest_framework.authtoken.models import Token
+
+    seed_catalogue(shops=shops, items_per_shop=items_per_shop)
+    items = list(Item.objects.order_by('id'))
+    clients = seed_customers(customers, balance=balance)
+    Address.objects.bulk_create([
+        Address(user=customer, address='Bench avenue %d' % i, lat=6.2 + (i % 50) * 0.002,
+                lng=-75.6 + (i // 50) * 0.002, address_type='S', default=True)
+        for i, customer in enumerate(clients)
+    ], batch_size=2000)
+    tokens = Token.objects.bulk_create([
+        Token(key=Token.generate_key(), user=customer) for customer in clients
+    ], batch_size=2000)
+    seed_order_history(clients, items, orders_per_customer)
+    return clients, [token.key for token in tokens], items
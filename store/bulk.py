@@ -0,0 +1,108 @@
+import csv
+import time
+from itertools import islice
+
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .cache import CATALOGUE_ITEMS, bump_on_commit, shop_namespace
+from .models import Item
+from .serializers import ItemImportSerializer
+
+
+CHUNK_SIZE = 500
+MAX_REPORTED_ERRORS = 100
+
+EXPORT_FIELDS = ['slug', 'name', 'description', 'price', 'discount_price', 'inventory']
+
+
+class ImportParseError(Exception):
+    """The rows stopped parsing part way; stats covers the chunks committed before that."""
+
+    def __init__(self, error, stats):
+        super().__init__(str(error))
+        self.message = 'Could not parse the file: %s' % error
+        self.stats = stats
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def import_items(shop, rows):
+    """
+    Creates or updates the shop's items from an iterable of dicts, keyed on
+    slug. Rows are validated with ItemImportSerializer and written
+    CHUNK_SIZE at a time with bulk_create/bulk_update, one transaction per
+    chunk; invalid rows are reported and skipped. If rows raises a parse
+    error, the chunks already written stay committed and ImportParseError
+    carries their stats.
+    """
+    serializer = ItemImportSerializer()
+    fields = [name for name, field in serializer.fields.items() if not field.read_only and name != 'slug']
+    stats = {'rows': 0, 'created': 0, 'updated': 0, 'invalid': 0, 'errors': []}
+    start = time.perf_counter()
+
+    for chunk in chunked(_parsed(rows, stats, start), CHUNK_SIZE):
+        valid = {}
+        for row in chunk:
+            stats['rows'] += 1
+            try:
+                data = serializer.run_validation(row)
+            except ValidationError as e:
+                stats['invalid'] += 1
+                if len(stats['errors']) < MAX_REPORTED_ERRORS:
+                    stats['errors'].append({'row': stats['rows'], 'errors': e.detail})
+                continue
+            # A slug repeated within the chunk: the last row wins
+            valid[data['slug']] = data
+
+        existing = {item.slug: item for item in Item.objects.filter(shop=shop, slug__in=list(valid))}
+        now = timezone.now()
+        to_create, to_update = [], []
+        for slug, data in valid.items():
+            item = existing.get(slug)
+            if item is None:
+                to_create.append(Item(shop=shop, **data))
+            else:
+                for name in fields:
+                    if name in data:
+                        setattr(item, name, data[name])
+                # bulk_update() skips auto_now
+                item.updated_at = now
+                to_update.append(item)
+
+        with transaction.atomic():
+            Item.objects.bulk_create(to_create)
+            Item.objects.bulk_update(to_update, fields + ['updated_at'])
+            # Bulk writes don't send post_save, so invalidate the catalogue
+            # with every chunk that commits
+            if to_create or to_update:
+                bump_on_commit(CATALOGUE_ITEMS, shop_namespace(shop.id))
+        stats['created'] += len(to_create)
+        stats['updated'] += len(to_update)
+    return _timed(stats, start)
+
+
+def _parsed(rows, stats, start):
+    # Rows are parsed as they are read, so parse errors surface here
+    try:
+        yield from rows
+    except (ValueError, csv.Error) as e:
+        raise ImportParseError(e, _timed(stats, start)) from e
+
+
+def _timed(stats, start):
+    stats['seconds'] = round(time.perf_counter() - start, 3)
+    stats['rows_per_second'] = round(stats['rows'] / stats['seconds'], 1) if stats['seconds'] else None
+    return stats
+
+
+def export_items(shop):
+    return Item.objects.filter(shop=shop).order_by('id').values_list(*EXPORT_FIELDS).iterator(chunk_size=2000)
@@ -0,0 +1,138 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+# Backends whose entries and deletes stay in the process that made them
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+CATALOGUE_ITEMS = 'catalogue:items'
+CATALOGUE_SHOPS = 'catalogue:shops'
+CATALOGUE_CATEGORIES = 'catalogue:categories'
+
+
+def is_shared():
+    # Whether an invalidation made by one worker reaches the others
+    return settings.CACHES.get('default', {}).get('BACKEND') not in PROCESS_LOCAL_CACHES
+
+
+def shop_namespace(shop_id):
+    return 'catalogue:shop:%s' % shop_id
+
+
+def get_version(namespace):
+    key = 'version:%s' % namespace
+    version = cache.get(key)
+    if version is None:
+        # Start from the clock rather than 1 so an evicted counter can never
+        # come back at a value that older cache entries were stored under.
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(namespace):
+    key = 'version:%s' % namespace
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, int(time.time() * 1000), None)
+    cache.set('changed:%s' % namespace, time.time(), None)
+
+
+def last_changed(namespace):
+    # Timestamp of the last bump_version(namespace). When unknown, assume it
+    # just happened: clients revalidate once rather than keep stale bodies.
+    key = 'changed:%s' % namespace
+    changed = cache.get(key)
+    if changed is None:
+        cache.add(key, time.time(), None)
+        changed = cache.get(key)
+    return changed
+
+
+def bump_on_commit(*namespaces):
+    # Bump now so nothing is served from the old version during the write's
+    # transaction, and again once it commits so a reader that cached the
+    # pre-commit rows in between is invalidated too.
+    for namespace in namespaces:
+        bump_version(namespace)
+    transaction.on_commit(lambda: [bump_version(namespace) for namespace in namespaces])
+
+
+def bump_user_shops(user_id):
+    # Shops embed their vendor and the vendor's addresses
+    from .models import Shop
+
+    shop_ids = list(Shop.objects.filter(user_id=user_id).values_list('id', flat=True))
+    if shop_ids:
+        bump_on_commit(CATALOGUE_SHOPS, *[shop_namespace(shop_id) for shop_id in shop_ids])
+
+
+def params_key(params, exclude=()):
+    items = sorted((k, v) for k, v in params.lists() if k not in exclude)
+    return hashlib.md5(repr(items).encode()).hexdigest()
+
+
+def order_counters(queryset, params):
+    # The counters only depend on the filters, not on the page being read,
+    # and are invalidated by the Order signals in store.signals.
+    key = 'order-counters:%s:%s' % (
+        get_version('orders'),
+        params_key(params, exclude=('page', 'PageSize', 'cursor'))
+    )
+    counters = cache.get(key)
+    if counters is None:
+        counters = queryset.status_counts()
+        cache.set(key, counters, getattr(settings, 'ORDER_COUNTERS_CACHE_TIMEOUT', 60))
+    return counters
+
+
+def get_catalogue(key):
+    """
+    Returns the cached catalogue payload stored under key, or None when it
+    is missing or any shop it was built from has changed since.
+    """
+    entry = cache.get(key)
+    if entry is None:
+        return None
+    version_keys = {'version:%s' % shop_namespace(shop_id): version
+                    for shop_id, version in entry['shops'].items()}
+    current = cache.get_many(list(version_keys))
+    for version_key, version in version_keys.items():
+        if current.get(version_key) != version:
+            return None
+    return entry['data']
+
+
+def set_catalogue(key, data, shop_ids):
+    entry = {
+        'data': data,
+        'shops': {shop_id: get_version(shop_namespace(shop_id)) for shop_id in shop_ids},
+    }
+    cache.set(key, entry, getattr(settings, 'CATALOGUE_CACHE_TIMEOUT', 300))
+
+
+def catalogue_list_key(request, user):
+    # Lists filtered to one shop only change with that shop; anything else can
+    # gain or lose rows whenever any item changes.
+    shop_id = request.GET.get('shop_id')
+    if shop_id:
+        scope = get_version(shop_namespace(shop_id))
+    else:
+        scope = get_version(CATALOGUE_ITEMS)
+    # ItemListView restricts vendors to their own shop
+    vendor = user.id if getattr(user, 'is_vendor', False) else ''
+    return 'catalogue:list:%s:%s:%s' % (
+        scope, vendor, hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+    )
+
+
+def catalogue_item_key(pk):
+    return 'catalogue:item:%s:%s' % (get_version(CATALOGUE_CATEGORIES), pk)
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+from .cache import is_shared
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    # store.dispatch publishes index changes to the other processes through
+    # the cache, and the catalogue caches are invalidated through it; with a
+    # per-process cache the other processes never see either. Token
+    # authentication doesn't cache at all then (Auth.authentication).
+    if not is_shared():
+        return [Warning(
+            'The default cache (%s) is not shared between processes, so the dispatch index and '
+            'cache invalidations of one worker never reach the others, and token lookups are not '
+            'cached.' % settings.CACHES.get('default', {}).get('BACKEND'),
+            hint='Configure a shared cache such as RedisCache or PyMemcacheCache.',
+            id='store.W001',
+        )]
+    return []
@@ -0,0 +1,51 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .cache import get_version, last_changed
+
+
+def validators(parts, last_modified, namespaces=()):
+    """
+    Builds an (etag, last_modified) pair from the given parts plus the
+    version of each namespace. last_modified is a unix timestamp, pushed
+    forward to the latest change of any namespace, since nested data (shop
+    addresses, vendors, categories) doesn't touch the rows' updated_at.
+    """
+    parts = list(parts) + [get_version(namespace) for namespace in namespaces]
+    etag = hashlib.md5(repr(parts).encode()).hexdigest()
+    timestamps = [last_changed(namespace) for namespace in namespaces]
+    if last_modified is not None:
+        timestamps.append(last_modified.timestamp())
+    return etag, int(max(timestamps)) if timestamps else None
+
+
+def _list_validators(stats, request, user, namespaces):
+    vendor = user.id if getattr(user, 'is_vendor', False) else None
+    parts = [request.get_full_path(), vendor, stats['count'], stats['last_modified']]
+    return validators(parts, stats['last_modified'], namespaces)
+
+
+def queryset_validators(queryset, request, namespaces=()):
+    # One indexed aggregate instead of serializing the page
+    stats = queryset.order_by().aggregate(last_modified=Max('updated_at'), count=Count('id'))
+    return _list_validators(stats, request, request.user, namespaces)
+
+
+async def aqueryset_validators(queryset, request, user, namespaces=()):
+    stats = await queryset.order_by().aaggregate(last_modified=Max('updated_at'), count=Count('id'))
+    return _list_validators(stats, request, user, namespaces)
+
+
+def not_modified(request, etag, last_modified):
+    """Returns a 304 response when the client's copy is still current, else None."""
+    return get_conditional_response(request, etag=quote_etag(etag), last_modified=last_modified)
+
+
+def set_validators(response, etag, last_modified):
+    response['ETag'] = quote_etag(etag)
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
@@ -0,0 +1,429 @@
+import heapq
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+from Auth.models import User
+from . import analytics
+from .geo import EARTH_RADIUS_KM, KM_PER_DEGREE, haversine_km
+from .models import Address, Order
+
+
+# Paid for, not yet picked up by a rider and not delivered
+AVAILABLE = Q(ordered=True, rider__isnull=True, received=False)
+
+
+class DispatchError(Exception):
+    message = 'Dispatch failed'
+
+
+class OrderUnavailable(DispatchError):
+    message = 'This order is no longer available'
+
+
+class OrderNotFound(DispatchError):
+    message = 'Order not found'
+
+
+class NoOrderNearby(DispatchError):
+    message = 'There are no orders available near you'
+
+
+class GridIndex:
+    """
+    In-process spatial index bucketing points into cells of cell_degrees
+    latitude by cell_degrees longitude.
+
+    nearest() scans rings of cells outwards from the query point and stops
+    as soon as no unscanned cell can hold anything closer than what it has
+    already found, so a lookup only touches the cells around the answer.
+    """
+
+    def __init__(self, cell_degrees):
+        self.cell_degrees = cell_degrees
+        self.rows = int(math.ceil(180 / cell_degrees))
+        self.columns = int(math.ceil(360 / cell_degrees))
+        # Only occupied cells are kept: {cell: {key: (lat, lng)}}
+        self.cells = {}
+        self.positions = {}
+
+    @property
+    def size(self):
+        return len(self.positions)
+
+    def _cell(self, lat, lng):
+        row = min(self.rows - 1, int((lat + 90) // self.cell_degrees))
+        return row, int((lng + 180) // self.cell_degrees) % self.columns
+
+    def add(self, key, lat, lng):
+        """Adds key at (lat, lng), moving it if it is already indexed."""
+        self.remove(key)
+        cell = self._cell(lat, lng)
+        self.cells.setdefault(cell, {})[key] = (lat, lng)
+        self.positions[key] = cell
+
+    def remove(self, key):
+        cell = self.positions.pop(key, None)
+        if cell is not None:
+            points = self.cells[cell]
+            del points[key]
+            if not points:
+                del self.cells[cell]
+
+    def _ring(self, row, column, ring):
+        if ring == 0:
+            yield row, column
+            return
+        for i in range(row - ring, row + ring + 1):
+            if not 0 <= i < self.rows:
+                continue
+            if i in (row - ring, row + ring):
+                offsets = range(-ring, ring + 1)
+            else:
+                offsets = (-ring, ring)
+            for offset in offsets:
+                yield i, (column + offset) % self.columns
+
+    def _lower_bound(self, lat, ring):
+        # Anything outside the first `ring` rings is at least ring cells away
+        # in latitude, or at least ring cells away in longitude at a latitude
+        # no further from the equator than max_lat.
+        span = ring * self.cell_degrees
+        by_lat = span * KM_PER_DEGREE
+        max_lat = min(90.0, abs(lat) + span + self.cell_degrees)
+        by_lng = 2 * EARTH_RADIUS_KM * math.asin(
+            math.cos(math.radians(max_lat)) * math.sin(math.radians(min(180.0, span)) / 2)
+        )
+        return min(by_lat, by_lng)
+
+    def nearest(self, lat, lng, limit, max_km=None):
+        """Returns up to limit (distance_km, key) pairs, closest first."""
+        if not self.size or limit <= 0:
+            return []
+        row, column = self._cell(lat, lng)
+        best = []  # max-heap on distance of the closest `limit` so far
+
+        def visit(cell):
+            for key, (point_lat, point_lng) in self.cells.get(cell, {}).items():
+                distance = haversine_km(lat, lng, point_lat, point_lng)
+                if max_km is not None and distance > max_km:
+                    continue
+                if len(best) < limit:
+                    heapq.heappush(best, (-distance, key))
+                elif distance < -best[0][0]:
+                    heapq.heapreplace(best, (-distance, key))
+
+        ring = 0
+        while True:
+            for cell in self._ring(row, column, ring):
+                visit(cell)
+            bound = self._lower_bound(lat, ring)
+            if len(best) == limit and -best[0][0] <= bound:
+                break
+            if max_km is not None and bound > max_km:
+                break
+            ring += 1
+            # Once the next ring has more cells than are occupied (sparse data,
+            # or near the poles where the bound grows slowly) finish by
+            # checking the remaining occupied cells directly.
+            if 8 * ring >= len(self.cells) or 2 * ring + 1 >= self.columns:
+                for cell in list(self.cells):
+                    column_distance = abs(cell[1] - column)
+                    column_distance = min(column_distance, self.columns - column_distance)
+                    if abs(cell[0] - row) >= ring or column_distance >= ring:
+                        visit(cell)
+                break
+        return sorted((-distance, key) for distance, key in best)
+
+
+def _positions(addresses):
+    # First address with coordinates per user, the default one if set
+    positions = {}
+    for user_id, lat, lng in addresses.filter(
+            lat__isnull=False, lng__isnull=False).default_first().values_list('user_id', 'lat', 'lng'):
+        positions.setdefault(user_id, (lat, lng))
+    return positions
+
+
+def _order_points(orders):
+    # {order id: pickup/dropoff points, or None when it has no position}
+    rows = list(orders.values_list(
+        'id', 'shop_id', 'shop__user_id', 'shipping_address__lat', 'shipping_address__lng'))
+    shops = _positions(Address.objects.filter(user_id__in={row[2] for row in rows if row[2]}))
+    points = {}
+    for order_id, shop_id, vendor_id, lat, lng in rows:
+        dropoff = (lat, lng) if lat is not None and lng is not None else None
+        pickup = shops.get(vendor_id, dropoff)
+        points[order_id] = {'shop': shop_id, 'pickup': pickup, 'dropoff': dropoff} if pickup else None
+    return points
+
+
+def _rider_positions(riders):
+    return _positions(Address.objects.filter(user__in=riders, user__is_rider=True, user__is_active=True))
+
+
+# Changes to the index are published through the cache as a numbered log:
+# CHANGE_SEQ counts them and change_key(n) holds the nth, so every process
+# applies the same changes to its own index instead of rebuilding it.
+CHANGE_SEQ = 'dispatch:seq'
+CHANGE_TIMEOUT = 3600
+
+
+def change_key(seq):
+    return 'dispatch:change:%d' % seq
+
+
+def current_seq():
+    seq = cache.get(CHANGE_SEQ)
+    if seq is None:
+        # Start from the clock, like store.cache.get_version(), so a lost
+        # counter never comes back at a number that was already used.
+        cache.add(CHANGE_SEQ, int(time.time() * 1000), None)
+        seq = cache.get(CHANGE_SEQ)
+    return seq
+
+
+def publish(changes):
+    for change in changes:
+        try:
+            seq = cache.incr(CHANGE_SEQ)
+        except ValueError:
+            current_seq()
+            seq = cache.incr(CHANGE_SEQ)
+        cache.set(change_key(seq), change, CHANGE_TIMEOUT)
+
+
+# The functions below publish once the current transaction commits, reading
+# the committed state; positions are absolute, so replaying one twice is
+# harmless.
+
+def order_changed(order_id):
+    """Publishes the order's pickup point, or its removal when it is no longer available."""
+    def send():
+        points = _order_points(Order.objects.filter(AVAILABLE, pk=order_id))
+        publish([('order', order_id, points.get(order_id))])
+    transaction.on_commit(send)
+
+
+def order_removed(order_id):
+    transaction.on_commit(lambda: publish([('order', order_id, None)]))
+
+
+def rider_changed(user_id):
+    """Publishes the user's position as a rider, or their removal when they aren't an active one."""
+    def send():
+        position = _rider_positions(User.objects.filter(pk=user_id)).get(user_id)
+        publish([('rider', user_id, position)])
+    transaction.on_commit(send)
+
+
+def user_moved(user_id):
+    """
+    Publishes what a change to user_id's addresses moves: their position
+    if they are a rider, and the available orders picked up from their shop
+    or delivered to them.
+    """
+    rider_changed(user_id)
+
+    def send():
+        orders = Order.objects.filter(AVAILABLE).filter(
+            Q(shop__user_id=user_id) | Q(shipping_address__user_id=user_id))
+        publish([('order', order_id, points) for order_id, points in _order_points(orders).items()])
+    transaction.on_commit(send)
+
+
+class DispatchIndex:
+    """
+    Grid indexes over the pickup point of every available order (the shop's
+    address, or the shipping address for orders without one) and the
+    position of every active rider (their default address).
+
+    Built once from the database, then kept current by applying the
+    published changes (see store.signals) up to seq.
+    """
+
+    def __init__(self):
+        cell_degrees = getattr(settings, 'DISPATCH_GRID_DEGREES', 0.02)
+        # Read first: changes committed while building are applied again later
+        self.seq = current_seq()
+        self.built_at = time.monotonic()
+        self.orders = GridIndex(cell_degrees)
+        self.riders = GridIndex(cell_degrees)
+        self.order_points = {}
+
+        for order_id, points in _order_points(Order.objects.filter(AVAILABLE)).items():
+            self.apply(('order', order_id, points))
+        for rider_id, position in _rider_positions(User.objects.all()).items():
+            self.apply(('rider', rider_id, position))
+
+    def apply(self, change):
+        kind, key, value = change
+        if kind == 'order':
+            if value is None:
+                self.orders.remove(key)
+                self.order_points.pop(key, None)
+            else:
+                self.orders.add(key, *value['pickup'])
+                self.order_points[key] = value
+        elif value is None:
+            self.riders.remove(key)
+        else:
+            self.riders.add(key, *value)
+
+    def catch_up(self, seq):
+        """Applies changes up to seq; False when some are no longer in the cache."""
+        if seq < self.seq or seq - self.seq > getattr(settings, 'DISPATCH_MAX_REPLAY', 1000):
+            return False
+        keys = [change_key(n) for n in range(self.seq + 1, seq + 1)]
+        changes = cache.get_many(keys)
+        if len(changes) != len(keys):
+            return False
+        for key in keys:
+            self.apply(changes[key])
+        self.seq = seq
+        return True
+
+
+_index = None
+# Held while the index is read or changed
+_index_lock = threading.RLock()
+
+
+def get_index():
+    """
+    Returns the process-wide DispatchIndex after applying the changes
+    published since it was last used. It is rebuilt from the database when
+    changes have been lost from the cache and at least every
+    DISPATCH_INDEX_MAX_AGE seconds. Call with _index_lock held.
+    """
+    global _index
+    seq = current_seq()
+    max_age = getattr(settings, 'DISPATCH_INDEX_MAX_AGE', 300)
+    if _index is None or time.monotonic() - _index.built_at > max_age:
+        _index = DispatchIndex()
+    elif seq != _index.seq and not _index.catch_up(seq):
+        _index = DispatchIndex()
+    return _index
+
+
+def _nearest_available(grid, lat, lng, limit, radius_km, available):
+    # The index can be a moment behind the database, so candidates are
+    # re-checked there; fetch more when too many have gone.
+    wanted = limit * 2
+    while True:
+        with _index_lock:
+            candidates = grid.nearest(lat, lng, wanted, radius_km)
+        keys = available([key for _, key in candidates])
+        found = [(distance, key) for distance, key in candidates if key in keys]
+        if len(found) >= limit or len(candidates) < wanted:
+            return found[:limit]
+        wanted *= 2
+
+
+def rider_position(rider):
+    return _positions(Address.objects.filter(user=rider)).get(rider.pk)
+
+
+def order_position(order):
+    if order.shop_id is not None:
+        positions = _positions(Address.objects.filter(user__products=order.shop_id))
+        if positions:
+            return next(iter(positions.values()))
+    if order.shipping_address_id is not None:
+        address = order.shipping_address
+        if address.lat is not None and address.lng is not None:
+            return address.lat, address.lng
+    return None
+
+
+def nearest_orders(lat, lng, limit=10, radius_km=None):
+    """Returns the available orders closest to (lat, lng) by pickup distance."""
+    with _index_lock:
+        index = get_index()
+
+    def available(order_ids):
+        return set(Order.objects.filter(AVAILABLE, pk__in=order_ids).values_list('id', flat=True))
+
+    results = []
+    for distance, order_id in _nearest_available(index.orders, lat, lng, limit, radius_km, available):
+        with _index_lock:
+            points = index.order_points.get(order_id)
+        if points is None:
+            continue
+        pickup, dropoff = points['pickup'], points['dropoff']
+        results.append({
+            'id': order_id,
+            'shop': points['shop'],
+            'distance_km': round(distance, 3),
+            'pickup': {'lat': pickup[0], 'lng': pickup[1]},
+            'dropoff': {'lat': dropoff[0], 'lng': dropoff[1]} if dropoff else None,
+        })
+    return results
+
+
+def nearest_riders(order, limit=10, radius_km=None):
+    """Returns the riders closest to the order's pickup point who are not out on a delivery."""
+    position = order_position(order)
+    if position is None:
+        return []
+    with _index_lock:
+        index = get_index()
+
+    def available(rider_ids):
+        active = set(User.objects.filter(
+            pk__in=rider_ids, is_rider=True, is_active=True).values_list('id', flat=True))
+        busy = set(Order.objects.filter(
+            rider_id__in=active, being_delivered=True).values_list('rider_id', flat=True))
+        return active - busy
+
+    return [
+        {'id': rider_id, 'distance_km': round(distance, 3)}
+        for distance, rider_id in _nearest_available(index.riders, *position, limit, radius_km, available)
+    ]
+
+
+def assign(order_id, rider):
+    """
+    Hands an available order to rider. The order row is locked with SKIP
+    LOCKED, so of two riders racing for the same order one gets it and the
+    other gets OrderUnavailable straight away instead of waiting.
+    """
+    with transaction.atomic():
+        order = Order.objects.select_for_update(skip_locked=True).filter(AVAILABLE, pk=order_id).first()
+        if order is None:
+            raise OrderUnavailable()
+        previous = analytics.order_status(order)
+        order.rider = rider
+        order.being_delivered = True
+        order.save(update_fields=['rider', 'being_delivered'])
+        analytics.record_transition(order, previous)
+    return order
+
+
+def complete(order_id):
+    """Marks an order as delivered."""
+    with transaction.atomic():
+        order = Order.objects.select_for_update().filter(pk=order_id).first()
+        if order is None:
+            raise OrderNotFound()
+        previous = analytics.order_status(order)
+        order.being_delivered = False
+        order.received = True
+        order.save()
+        analytics.record_transition(order, previous)
+    return order
+
+
+def claim_nearest(rider, lat, lng, radius_km=None, attempts=10):
+    """Assigns the closest available order to rider, skipping any another rider is taking."""
+    for candidate in nearest_orders(lat, lng, attempts, radius_km):
+        try:
+            return assign(candidate['id'], rider)
+        except OrderUnavailable:
+            continue
+    raise NoOrderNearby()
@@ -0,0 +1,96 @@
+from django.db.models import F
+from django.utils.dateparse import parse_date
+
+from .models import Order, Payment
+from .pricing import money, price_line
+
+
+CHUNK_SIZE = 2000
+
+ORDER_FIELDS = [
+    'id', 'ref_code', 'user_id', 'user__username', 'shop_id', 'ordered_date',
+    'being_delivered', 'received', 'refund_requested', 'refund_granted',
+    'coupon__code', 'payment_id', 'total',
+]
+ORDER_ITEM_FIELDS = [
+    'order_id', 'orderitem_id', 'orderitem__item_id', 'orderitem__item__name',
+    'orderitem__quantity', 'orderitem__item__price', 'orderitem__item__discount_price', 'final_price',
+]
+ITEM_ROW_FIELDS = ORDER_ITEM_FIELDS[:-1]
+PAYMENT_FIELDS = ['id', 'user_id', 'user__username', 'amount', 'timestamp', 'order__id']
+
+
+def export_dates(**values):
+    """
+    Parses the non-empty start/end values to dates, raising ValueError
+    ("Invalid start date") for malformed ones and impossible ones like
+    2024-13-45, which parse_date() itself raises on.
+    """
+    dates = {}
+    for name, value in values.items():
+        if not value:
+            continue
+        try:
+            dates[name] = parse_date(value)
+        except ValueError:
+            dates[name] = None
+        if dates[name] is None:
+            raise ValueError('Invalid %s date' % name)
+    return dates
+
+
+def order_export(kind, start=None, end=None):
+    """
+    Returns (header, rows) for the paid orders, their order items or the
+    payments between start and end (inclusive dates). rows is a lazy
+    iterator: on Postgres it reads through a server-side cursor CHUNK_SIZE
+    rows at a time, so memory doesn't grow with the date range.
+
+    Amounts follow store.pricing, as Decimal cents: an order's total is
+    what its payment charged and an item's final_price is priced as
+    checkout prices it.
+    """
+    if kind == 'payments':
+        queryset = Payment.objects.all()
+        if start:
+            queryset = queryset.filter(timestamp__date__gte=start)
+        if end:
+            queryset = queryset.filter(timestamp__date__lte=end)
+        fields = PAYMENT_FIELDS
+        queryset = queryset.order_by('id')
+        amount = 'amount'
+    elif kind == 'items':
+        queryset = Order.items.through.objects.filter(order__ordered=True)
+        if start:
+            queryset = queryset.filter(order__ordered_date__date__gte=start)
+        if end:
+            queryset = queryset.filter(order__ordered_date__date__lte=end)
+        rows = queryset.order_by('order_id', 'orderitem_id').values_list(*ITEM_ROW_FIELDS)
+        return ORDER_ITEM_FIELDS, _priced(rows.iterator(chunk_size=CHUNK_SIZE))
+    else:
+        queryset = Order.objects.filter(ordered=True)
+        if start:
+            queryset = queryset.filter(ordered_date__date__gte=start)
+        if end:
+            queryset = queryset.filter(ordered_date__date__lte=end)
+        # Payment.amount holds what checkout charged (pricing.order_total())
+        queryset = queryset.annotate(total=F('payment__amount')).order_by('id')
+        fields = ORDER_FIELDS
+        amount = 'total'
+    rows = queryset.values_list(*fields).iterator(chunk_size=CHUNK_SIZE)
+    return fields, _in_cents(rows, fields.index(amount))
+
+
+def _in_cents(rows, column):
+    # Payment amounts are stored as floats; export them as the Decimal charged
+    for row in rows:
+        if row[column] is not None:
+            row = row[:column] + (money(row[column]),) + row[column + 1:]
+        yield row
+
+
+def _priced(rows):
+    # Appends final_price to each order item row
+    for row in rows:
+        quantity, price, discount_price = row[-3:]
+        yield row + (price_line(price, discount_price, quantity).final_price,)
@@ -0,0 +1,50 @@
+import math
+
+from django.db.models import FloatField, Value
+from django.db.models.functions import ASin, Cos, Least, Power, Radians, Sin, Sqrt
+
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(lat, lng, radius_km):
+    """
+    Returns (min_lat, max_lat, min_lng, max_lng) enclosing every point within
+    radius_km of (lat, lng). The box is widened to all longitudes near the
+    poles and is not split at the antimeridian, so callers should still check
+    the exact distance.
+    """
+    delta_lat = radius_km / KM_PER_DEGREE
+    min_lat, max_lat = max(-90.0, lat - delta_lat), min(90.0, lat + delta_lat)
+    if min_lat == -90.0 or max_lat == 90.0:
+        return min_lat, max_lat, -180.0, 180.0
+    delta_lng = math.degrees(math.asin(min(1.0, math.sin(radius_km / EARTH_RADIUS_KM) / math.cos(math.radians(lat)))))
+    return min_lat, max_lat, max(-180.0, lng - delta_lng), min(180.0, lng + delta_lng)
+
+
+def parse_point(value):
+    """Parses 'lat,lng' into a pair of floats, raising ValueError when invalid."""
+    lat, lng = (float(part) for part in value.split(','))
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError('%r is not a valid lat,lng pair' % value)
+    return lat, lng
+
+
+def haversine_expression(lat, lng, lat_field='lat', lng_field='lng'):
+    """
+    Database expression for the distance in km from (lat, lng) to the point
+    stored in lat_field/lng_field, so candidates are ranked in the same query
+    that selects them.
+    """
+    half_lat = (Radians(lat_field) - Value(math.radians(lat))) / 2
+    half_lng = (Radians(lng_field) - Value(math.radians(lng))) / 2
+    a = Power(Sin(half_lat), 2) + Value(math.cos(math.radians(lat))) * Cos(Radians(lat_field)) * Power(Sin(half_lng), 2)
+    return Value(2 * EARTH_RADIUS_KM) * ASin(Sqrt(Least(Value(1.0), a)), output_field=FloatField())
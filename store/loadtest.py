@@ -0,0 +1,162 @@
+"""
+Load test of the store API: drives the real DRF endpoints in process with
+concurrent clients over data seeded by bench.seed_store(), and compares
+the results with a stored baseline.
+
+Used by manage.py loadtest and by the query budget tests in store.tests.
+BASELINE_PATH only holds queries per request, which are the same on every
+machine; throughput and latency baselines are recorded with
+loadtest --save-baseline on the machine they are compared on.
+"""
+import json
+import os
+import random
+import statistics
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+from Auth.authentication import CachingTokenAuthentication
+from .bench import BenchResult, count_queries, run_concurrently
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'loadtest_baseline.json')
+
+# name: (method, path, expected status). {item} is filled per request.
+ENDPOINTS = {
+    'products': ('get', '/api/products/?PageSize=20', 200),
+    'shops': ('get', '/api/shops/?PageSize=20', 200),
+    'order-list': ('get', '/api/order-list/?PageSize=20', 200),
+    'add-to-cart': ('post', '/api/add-to-cart/{item}/', 200),
+    'checkout': ('post', '/api/checkout/', 200),
+}
+WRITES = {'add-to-cart', 'checkout'}
+
+
+class UnexpectedStatus(Exception):
+    pass
+
+
+def warm_tokens(tokens):
+    # Measure the steady state, where the token -> user id lookup is cached
+    # (when the cache is shared, see CachingTokenAuthentication)
+    authentication = CachingTokenAuthentication()
+    for token in tokens:
+        authentication.authenticate_credentials(token)
+
+
+def jobs_for(name, tokens, items, requests, rng):
+    """
+    (token, item id) per request. Every checkout pays a different
+    customer's open cart, so there are at most as many as customers.
+    """
+    if name == 'checkout':
+        return [(token, None) for token in tokens[:requests]]
+    return [(rng.choice(tokens), rng.choice(items).pk) for _ in range(requests)]
+
+
+def drive(name, jobs, clients):
+    """
+    Sends one request per job to endpoint name from `clients` threads and
+    returns (BenchResult, queries per request). With one client the
+    requests run in the calling thread, inside its transaction.
+    """
+    method, path, expected = ENDPOINTS[name]
+    queries = []
+    lock = threading.Lock()
+
+    def call(token, item):
+        client = APIClient()
+        with CaptureQueriesContext(connection) as captured:
+            response = getattr(client, method)(path.format(item=item), HTTP_AUTHORIZATION='Token %s' % token)
+        with lock:
+            queries.append(count_queries(captured))
+        if response.status_code != expected:
+            raise UnexpectedStatus('%s %s: %s' % (method.upper(), path, response.status_code))
+
+    if clients > 1:
+        return run_concurrently(call, jobs, clients), queries
+
+    latencies, errors = [], []
+    start = time.perf_counter()
+    for job in jobs:
+        call_start = time.perf_counter()
+        try:
+            call(*job)
+        except Exception as e:
+            errors.append(e)
+            continue
+        latencies.append(time.perf_counter() - call_start)
+    return BenchResult(time.perf_counter() - start, latencies, errors), queries
+
+
+def summarize(result, queries):
+    # The median is the cached steady state; the max is what a cache miss
+    # costs, which is where a per-row query would show up.
+    summary = result.summary()
+    summary['queries'] = statistics.median(queries) if queries else 0
+    summary['max_queries'] = max(queries) if queries else 0
+    return summary
+
+
+def run(tokens, items, endpoints=None, requests=200, clients=8, seed=0):
+    """
+    Drives every endpoint in turn and returns {name: summary}. SQLite locks
+    whole tables on write, so there the writes are sent one at a time.
+    """
+    rng = random.Random(seed)
+    results = {}
+    warm_tokens(tokens)
+    # APIClient sends Host: testserver, which the project's settings don't allow
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+        for name in endpoints or ENDPOINTS:
+            writers = 1 if connection.vendor == 'sqlite' and name in WRITES else clients
+            result, queries = drive(name, jobs_for(name, tokens, items, requests, rng), writers)
+            results[name] = summarize(result, queries)
+            results[name]['clients'] = writers
+            results[name]['first_error'] = repr(result.errors[0]) if result.errors else None
+    return results
+
+
+def load_baseline(path=BASELINE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(results, path=BASELINE_PATH):
+    fields = ('queries', 'max_queries', 'throughput', 'p50_ms', 'p95_ms', 'p99_ms')
+    with open(path, 'w') as f:
+        json.dump({name: {field: summary[field] for field in fields} for name, summary in results.items()},
+                  f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def regressions(results, baseline, tolerance=0.2):
+    """
+    Describes every way results are worse than baseline: any error, more
+    queries per request (median or max), or (when the baseline has them) throughput or
+    latency more than tolerance worse.
+    """
+    found = []
+    for name, summary in results.items():
+        if summary['errors']:
+            found.append('%s: %d errors, first %s' % (name, summary['errors'], summary['first_error']))
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        if summary['queries'] > expected['queries']:
+            found.append('%s: %s queries per request, baseline %s' % (name, summary['queries'], expected['queries']))
+        if 'max_queries' in expected and summary['max_queries'] > expected['max_queries']:
+            found.append('%s: at most %s queries per request, baseline %s' % (
+                name, summary['max_queries'], expected['max_queries']))
+        if 'throughput' in expected and summary['throughput'] < expected['throughput'] / (1 + tolerance):
+            found.append('%s: %s requests/second, baseline %s' % (name, summary['throughput'], expected['throughput']))
+        for field in ('p50_ms', 'p95_ms', 'p99_ms'):
+            if field in expected and summary[field] > expected[field] * (1 + tolerance):
+                found.append('%s: %s %s, baseline %s' % (name, field, summary[field], expected[field]))
+    return found
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from store.bench import count_queries, run_concurrently, seed_catalogue, seed_customers, throwaway_database
+from store.models import Item, Order, OrderItem
+from store.services import add_to_cart
+
+
+class Command(BaseCommand):
+    help = 'Hammers a single cart with concurrent add-to-cart calls and checks nothing is lost or duplicated.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=16)
+        parser.add_argument('--clicks', type=int, default=1000)
+        parser.add_argument('--items', type=int, default=3)
+        parser.add_argument('--keepdb', action='store_true')
+
+    def handle(self, *args, **options):
+        clients = options['clients']
+        if connection.vendor == 'sqlite' and clients > 1:
+            # SQLite locks the whole database on write, so concurrent clients
+            # fail with "database is locked"
+            self.stderr.write('SQLite allows one writer at a time, running with 1 client; '
+                              'measure concurrency against Postgres.')
+            clients = 1
+
+        with throwaway_database(keepdb=options['keepdb']):
+            seed_catalogue(shops=1, items_per_shop=options['items'])
+            customer = seed_customers(1)[0]
+            items = list(Item.objects.only('id', 'shop_id'))
+
+            with CaptureQueriesContext(connection) as first:
+                add_to_cart(customer, items[0])
+            with CaptureQueriesContext(connection) as repeat:
+                add_to_cart(customer, items[0])
+
+            jobs = [(customer, items[i % len(items)]) for i in range(options['clicks'])]
+            result = run_concurrently(add_to_cart, jobs, clients)
+            if result.errors:
+                raise CommandError('%d clicks failed, first error: %r' % (len(result.errors), result.errors[0]))
+
+            if Order.objects.filter(user=customer, ordered=False).count() != 1:
+                raise CommandError('More than one open order was created')
+            order_items = OrderItem.objects.filter(user=customer, ordered=False)
+            if order_items.count() != len(items):
+                raise CommandError('Expected %d order items, found %d' % (len(items), order_items.count()))
+            quantity = sum(order_item.quantity for order_item in order_items)
+            if quantity != options['clicks'] + 2:
+                raise CommandError('Expected a total quantity of %d, found %d' % (options['clicks'] + 2, quantity))
+
+            summary = result.summary()
+            self.stdout.write('queries: %d for a new item, %d for an item already in the cart' % (
+                count_queries(first), count_queries(repeat)))
+            self.stdout.write('clients: %d, clicks: %d' % (clients, summary['calls']))
+            self.stdout.write('adds/second: %s' % summary['throughput'])
+            self.stdout.write('latency ms: p50 %(p50_ms)s  p95 %(p95_ms)s  p99 %(p99_ms)s' % summary)
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from Auth.models import User
+from store.bench import run_concurrently, seed_catalogue, seed_customers, seed_open_orders, throwaway_database
+from store.models import Item, Order, Payment
+from store.services import NoActiveOrder, checkout
+
+
+class Command(BaseCommand):
+    help = 'Measures checkouts/second of store.services.checkout under parallel clients.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=8)
+        parser.add_argument('--checkouts', type=int, default=500)
+        parser.add_argument('--keepdb', action='store_true')
+
+    def handle(self, *args, **options):
+        clients = options['clients']
+        if connection.vendor == 'sqlite' and clients > 1:
+            # SQLite locks the whole database on write, so concurrent clients
+            # fail with "database is locked"
+            self.stderr.write('SQLite allows one writer at a time, running with 1 client; '
+                              'measure concurrency against Postgres.')
+            clients = 1
+
+        with throwaway_database(keepdb=options['keepdb']):
+            seed_catalogue(shops=1, items_per_shop=20)
+            customers = seed_customers(options['checkouts'], balance=10000)
+            seed_open_orders(customers, Item.objects.all())
+
+            # Every customer is submitted twice to check that double submits
+            # don't pay twice.
+            jobs = [(customer,) for customer in customers] * 2
+            result = run_concurrently(checkout, jobs, clients)
+
+            unexpected = [e for e in result.errors if not isinstance(e, NoActiveOrder)]
+            if unexpected:
+                raise CommandError('%d checkouts failed, first error: %r' % (len(unexpected), unexpected[0]))
+
+            paid = Order.objects.filter(ordered=True).count()
+            if paid != len(customers) or Payment.objects.count() != len(customers):
+                raise CommandError('Expected %d paid orders, found %d' % (len(customers), paid))
+            charged = User.objects.filter(is_client=True, acc_balance__lt=10000).count()
+            if charged != len(customers):
+                raise CommandError('Expected %d debited customers, found %d' % (len(customers), charged))
+
+            summary = result.summary()
+            self.stdout.write('clients: %d' % clients)
+            self.stdout.write('checkouts: %d (%d rejected duplicates)' % (paid, summary['errors']))
+            self.stdout.write('checkouts/second: %s' % round(paid / result.elapsed, 1))
+            self.stdout.write('latency ms: p50 %(p50_ms)s  p95 %(p95_ms)s  p99 %(p99_ms)s' % summary)
@@ -0,0 +1,59 @@
+import urllib.error
+import urllib.request
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store.bench import run_concurrently
+
+
+DEFAULT_PATHS = ['products/?PageSize=20', 'products/{item}/', 'shops/?PageSize=20', 'order-summary/']
+
+
+class Command(BaseCommand):
+    help = ('Load-tests running deployments over HTTP and reports requests/second and latency per '
+            'endpoint, e.g. the WSGI views against their async variants under ASGI:\n'
+            '  gunicorn core.wsgi -w 4 -b :8000\n'
+            '  gunicorn core.asgi -w 4 -k uvicorn.workers.UvicornWorker -b :8001\n'
+            '  manage.py bench_http --target wsgi=http://127.0.0.1:8000/api/ '
+            '--target asgi=http://127.0.0.1:8001/api/async/ --token <key>')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', action='append', required=True,
+                            help='name=base URL; repeat to compare deployments.')
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='Path below each base URL; defaults to the hot read endpoints.')
+        parser.add_argument('--item', type=int, default=1, help='Product id for products/{item}/.')
+        parser.add_argument('--token', help='Auth token, needed for order-summary/.')
+        parser.add_argument('--clients', type=int, default=32)
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--timeout', type=float, default=30)
+
+    def handle(self, *args, **options):
+        targets = []
+        for target in options['target']:
+            name, sep, url = target.partition('=')
+            if not sep:
+                raise CommandError('--target must look like name=http://host/api/')
+            targets.append((name, url if url.endswith('/') else url + '/'))
+        paths = [path.format(item=options['item']) for path in options['paths'] or DEFAULT_PATHS]
+        headers = {'Authorization': 'Token %s' % options['token']} if options['token'] else {}
+
+        def fetch(url):
+            request = urllib.request.Request(url, headers=headers)
+            with urllib.request.urlopen(request, timeout=options['timeout']) as response:
+                response.read()
+
+        self.stdout.write('%-8s %-28s %10s %9s %9s %9s %7s' % (
+            'target', 'path', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'errors'))
+        for path in paths:
+            for name, base in targets:
+                url = base + path
+                try:
+                    fetch(url)
+                except (urllib.error.URLError, OSError) as e:
+                    raise CommandError('%s: %s' % (url, e))
+                result = run_concurrently(fetch, [(url,)] * options['requests'], options['clients'])
+                summary = result.summary()
+                self.stdout.write('%-8s %-28s %10s %9s %9s %9s %7s' % (
+                    name, path, summary['throughput'], summary['p50_ms'], summary['p95_ms'],
+                    summary['p99_ms'], summary['errors']))
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from store.bench import seed_catalogue, throwaway_database
+from store.bulk import EXPORT_FIELDS, export_items, import_items
+from store.streaming import csv_lines
+
+
+class Command(BaseCommand):
+    help = 'Measures bulk product import and export throughput in rows/second.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000)
+        parser.add_argument('--keepdb', action='store_true')
+
+    def handle(self, *args, **options):
+        with throwaway_database(keepdb=options['keepdb']):
+            shop = seed_catalogue(shops=1, items_per_shop=0)[0]
+            rows = options['rows']
+
+            def generate(suffix):
+                for i in range(rows):
+                    yield {'slug': 'sku-%d' % i, 'name': 'Product %d %s' % (i, suffix),
+                           'price': str(10 + i % 90), 'discount_price': None, 'inventory': str(i % 7)}
+
+            created = import_items(shop, generate('a'))
+            self.stdout.write('create: %(rows)d rows in %(seconds)ss, %(rows_per_second)s rows/second' % created)
+            updated = import_items(shop, generate('b'))
+            self.stdout.write('update: %(rows)d rows in %(seconds)ss, %(rows_per_second)s rows/second' % updated)
+
+            start = time.perf_counter()
+            size = sum(len(chunk) for chunk in csv_lines(EXPORT_FIELDS, export_items(shop)))
+            elapsed = time.perf_counter() - start
+            self.stdout.write('export: %d rows (%d bytes) in %.3fs, %.1f rows/second' % (
+                rows, size, elapsed, rows / elapsed))
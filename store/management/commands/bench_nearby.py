@@ -0,0 +1,60 @@
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+
+from store.bench import run_concurrently, seed_located_shops, throwaway_database
+from store.geo import haversine_expression
+from store.models import Shop
+
+
+class Command(BaseCommand):
+    help = ('Compares the ?near= shop search (bounding box + distance ranking) against ranking '
+            'every shop by distance, as the address table grows.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+        parser.add_argument('--queries', type=int, default=50)
+        parser.add_argument('--radius', type=float, default=2.0)
+        parser.add_argument('--page-size', type=int, default=20)
+        parser.add_argument('--skip-full-scan', action='store_true',
+                            help='Only time the bounding-box search (the full scan gets slow at 1M rows).')
+        parser.add_argument('--keepdb', action='store_true')
+
+    def handle(self, *args, **options):
+        radius, page_size = options['radius'], options['page_size']
+        rng = random.Random(1)
+        points = [(rng.uniform(6.0, 7.0), rng.uniform(-76.0, -75.0)) for _ in range(options['queries'])]
+
+        def nearby(lat, lng):
+            return list(Shop.objects.near(lat, lng, radius).values_list('id', flat=True)[:page_size])
+
+        def full_scan(lat, lng):
+            return list(
+                Shop.objects.annotate(
+                    distance=Min(haversine_expression(lat, lng, 'user__address__lat', 'user__address__lng'))
+                ).filter(distance__lte=radius).order_by('distance', 'id').values_list('id', flat=True)[:page_size]
+            )
+
+        with throwaway_database(keepdb=options['keepdb']):
+            seeded = 0
+            for size in sorted(options['sizes']):
+                seed_located_shops(size - seeded, start=seeded)
+                seeded = size
+
+                results = [('near', run_concurrently(nearby, points, 1))]
+                if not options['skip_full_scan']:
+                    for lat, lng in points[:5]:
+                        if nearby(lat, lng) != full_scan(lat, lng):
+                            raise CommandError('Results differ from the full scan at %s,%s' % (lat, lng))
+                    results.append(('full scan', run_concurrently(full_scan, points, 1)))
+
+                for label, result in results:
+                    if result.errors:
+                        raise CommandError('%s failed: %r' % (label, result.errors[0]))
+                    summary = result.summary()
+                    summary.update(label=label, size=size)
+                    self.stdout.write(
+                        '%(size)8d addresses  %(label)-9s  p50 %(p50_ms)8s ms  p95 %(p95_ms)8s ms  '
+                        '%(throughput)s queries/second' % summary
+                    )
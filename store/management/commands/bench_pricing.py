@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store.bench import seed_catalogue, seed_customers, seed_open_orders, throwaway_database
+from store.models import Item, OrderItem
+from store.pricing import money, price_items
+
+
+def per_object(order_items):
+    # What the serializers used to do: the float methods, one item at a time
+    for order_item in order_items:
+        order_item.get_total_item_price()
+        if order_item.item.discount_price:
+            order_item.get_total_discount_item_price()
+            order_item.get_amount_saved()
+        order_item.get_final_price()
+
+
+def best_of(fn, order_items, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(order_items)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+class Command(BaseCommand):
+    help = ('Compares pricing a batch of order items with store.pricing.price_items() against the '
+            'per-object OrderItem price methods.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000])
+        parser.add_argument('--items', type=int, default=200, help='Distinct catalogue items.')
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--keepdb', action='store_true')
+
+    def handle(self, *args, **options):
+        with throwaway_database(keepdb=options['keepdb']):
+            seed_catalogue(shops=1, items_per_shop=options['items'])
+            items = list(Item.objects.order_by('id'))
+            seeded = 0
+            for size in sorted(options['sizes']):
+                # Five order items per cart
+                customers = seed_customers((size - seeded) // 5, prefix='bench-pricing-%d' % size)
+                seed_open_orders(customers, items, items_per_order=5)
+                seeded = size
+
+                order_items = list(OrderItem.objects.select_related('item').order_by('id'))
+                for order_item in price_items(order_items):
+                    if order_item.pricing.final_price != money(order_item.get_final_price()):
+                        raise CommandError('Order item %d prices differ: %s != %s' % (
+                            order_item.pk, order_item.pricing.final_price, order_item.get_final_price()))
+
+                old = best_of(per_object, order_items, options['repeat'])
+                new = best_of(price_items, order_items, options['repeat'])
+                self.stdout.write('%8d order items  per-object %8.2f ms  batch %8.2f ms  (%.1fx)' % (
+                    len(order_items), old * 1000, new * 1000, old / new if new else 0))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from Auth.models import User
+from core.images import generate_variants, needs_variants
+from store.models import Item, Shop
+
+
+class Command(BaseCommand):
+    help = 'Builds the resized copies of Item, Shop and User images that are missing or out of date.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Rebuild every image, not just stale ones.')
+
+    def handle(self, *args, **options):
+        for model in (Item, Shop, User):
+            built = failed = 0
+            queryset = model.objects.exclude(image='').exclude(image__isnull=True).only('pk', 'image', 'image_variants')
+            for instance in queryset.iterator(chunk_size=500):
+                if not options['force'] and not needs_variants(instance):
+                    continue
+                try:
+                    generate_variants(model, instance.pk, instance.image.name)
+                    built += 1
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write('%s %s: %s' % (model._meta.label, instance.pk, e))
+            self.stdout.write('%s: %d built, %d failed' % (model._meta.label, built, failed))
@@ -0,0 +1,88 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Q
+
+from Auth.models import User
+from store.bench import seed_catalogue, seed_customers, seed_order_history, throwaway_database
+from store.models import Address, Item, Order, OrderItem
+
+
+class Command(BaseCommand):
+    help = ('Seeds a throwaway database and prints the query plans and timings of the '
+            'store filter patterns without and with the store indexes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=2000)
+        parser.add_argument('--orders-per-customer', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=200)
+        parser.add_argument('--keepdb', action='store_true')
+
+    def handle(self, *args, **options):
+        with throwaway_database(keepdb=options['keepdb']):
+            self.stdout.write('Seeding...')
+            seed_catalogue(shops=20, items_per_shop=50)
+            customers = seed_customers(options['customers'])
+            items = list(Item.objects.all())
+            seed_order_history(customers, items, options['orders_per_customer'])
+            # Orders out for delivery or delivered have a rider, as dispatch assigns them
+            riders = User.objects.bulk_create([
+                User(username='bench-rider-%d' % i, is_rider=True) for i in range(50)
+            ])
+            delivered = list(Order.objects.filter(Q(being_delivered=True) | Q(received=True)).values_list('id', flat=True))
+            for i, rider in enumerate(riders):
+                Order.objects.filter(id__in=delivered[i::len(riders)]).update(rider=rider)
+            Address.objects.bulk_create([
+                Address(user=customer, address_type='SB'[i % 2], default=i % 4 < 2)
+                for customer in customers[:500] for i in range(4)
+            ])
+
+            customer = customers[len(customers) // 2]
+            item = OrderItem.objects.filter(user=customer, ordered=False).first().item
+            patterns = [
+                ('open cart', Order.objects.filter(user=customer, ordered=False)),
+                ('cart item', OrderItem.objects.filter(item=item, user=customer, ordered=False)),
+                ('new orders', Order.objects.filter(ordered=True, received=False, being_delivered=False)
+                    .order_by('-id')[:20]),
+                ('rider orders', Order.objects.filter(rider=riders[0])),
+                ('default address', Address.objects.filter(user=customer, address_type='S', default=True)),
+            ]
+
+            indexes = [
+                (model, index)
+                for model in (Order, OrderItem, Address)
+                for index in model._meta.indexes
+            ]
+            with connection.schema_editor() as editor:
+                for model, index in indexes:
+                    editor.remove_index(model, index)
+            self.analyze()
+            self.stdout.write(self.style.MIGRATE_HEADING('\nWithout store indexes'))
+            before = self.report(patterns, options['repeat'])
+
+            with connection.schema_editor() as editor:
+                for model, index in indexes:
+                    editor.add_index(model, index)
+            self.analyze()
+            self.stdout.write(self.style.MIGRATE_HEADING('\nWith store indexes'))
+            after = self.report(patterns, options['repeat'])
+
+            self.stdout.write(self.style.MIGRATE_HEADING('\nSummary (mean ms per query)'))
+            for label, _ in patterns:
+                self.stdout.write('%-16s %8.3f -> %8.3f' % (label, before[label], after[label]))
+
+    def analyze(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def report(self, patterns, repeat):
+        timings = {}
+        for label, queryset in patterns:
+            self.stdout.write(self.style.SQL_KEYWORD('-- %s' % label))
+            self.stdout.write(queryset.explain())
+            start = time.perf_counter()
+            for _ in range(repeat):
+                list(queryset.all())
+            timings[label] = (time.perf_counter() - start) * 1000 / repeat
+        return timings
@@ -0,0 +1,62 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store import loadtest
+from store.bench import seed_store, throwaway_database
+
+
+class Command(BaseCommand):
+    help = ('Seeds a throwaway database (SQLite or Postgres, whichever is configured), drives the '
+            'products/, shops/, order-list/, add-to-cart/ and checkout/ endpoints with concurrent '
+            'clients and fails when one of them regresses against the stored baseline.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=200)
+        parser.add_argument('--shops', type=int, default=20)
+        parser.add_argument('--items-per-shop', type=int, default=50)
+        parser.add_argument('--orders-per-customer', type=int, default=5)
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint.')
+        parser.add_argument('--clients', type=int, default=8)
+        parser.add_argument('--endpoint', action='append', dest='endpoints', choices=list(loadtest.ENDPOINTS),
+                            help='Only drive this endpoint; repeat for several.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--baseline', default=loadtest.BASELINE_PATH)
+        parser.add_argument('--save-baseline', action='store_true',
+                            help='Write this run as the new baseline instead of comparing against it.')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='How much worse throughput and latency may get, as a fraction.')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON.')
+        parser.add_argument('--keepdb', action='store_true')
+
+    def handle(self, *args, **options):
+        with throwaway_database(keepdb=options['keepdb']):
+            customers, tokens, items = seed_store(
+                customers=options['customers'], shops=options['shops'],
+                items_per_shop=options['items_per_shop'], orders_per_customer=options['orders_per_customer'])
+            results = loadtest.run(tokens, items, options['endpoints'], options['requests'],
+                                   options['clients'], options['seed'])
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            self.stdout.write('%-12s %8s %8s %10s %9s %9s %9s %8s %8s %7s' % (
+                'endpoint', 'clients', 'requests', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'queries', 'max q', 'errors'))
+            for name, summary in results.items():
+                self.stdout.write('%-12s %8s %8s %10s %9s %9s %9s %8s %8s %7s' % (
+                    name, summary['clients'], summary['calls'] + summary['errors'], summary['throughput'], summary['p50_ms'],
+                    summary['p95_ms'], summary['p99_ms'], summary['queries'], summary['max_queries'], summary['errors']))
+
+        failed = ['%s: %d errors, first %s' % (name, summary['errors'], summary['first_error'])
+                  for name, summary in results.items() if summary['errors']]
+        if failed:
+            raise CommandError('Requests failed:\n  %s' % '\n  '.join(failed))
+
+        if options['save_baseline']:
+            loadtest.save_baseline(results, options['baseline'])
+            self.stdout.write('Baseline written to %s' % options['baseline'])
+            return
+        found = loadtest.regressions(results, loadtest.load_baseline(options['baseline']), options['tolerance'])
+        if found:
+            raise CommandError('Regressions against %s:\n  %s' % (options['baseline'], '\n  '.join(found)))
+        self.stdout.write('No regressions against %s' % options['baseline'])
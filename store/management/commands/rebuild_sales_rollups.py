@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from store.analytics import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the per-shop sales rollups (store.analytics) from the paid orders.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shop', type=int, help='Only rebuild this shop.')
+
+    def handle(self, *args, **options):
+        written = rebuild(options['shop'])
+        self.stdout.write('%(days)d shop days, %(item_days)d item days, %(statuses)d status counters' % written)
@@ -0,0 +1,38 @@
+from django.db import migrations
+
+
+TRIGRAM_INDEXES = (
+    ('store_item_name_trgm', 'store_item'),
+    ('store_shop_name_trgm', 'store_shop'),
+)
+
+
+def create_trigram_indexes(apps, schema_editor):
+    # pg_trgm only exists on Postgres; other backends keep scanning.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for name, table in TRIGRAM_INDEXES:
+        # Django compiles icontains to UPPER(name) LIKE UPPER(%term%), so the
+        # index has to be on the same expression to be usable.
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS %s ON %s USING gin (UPPER(name) gin_trgm_ops)' % (name, table)
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for name, table in TRIGRAM_INDEXES:
+        schema_editor.execute('DROP INDEX IF EXISTS %s' % name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0018_alter_shop_user'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.10 on 2026-10-18 14:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0019_name_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('ordered', False)), fields=['user'], name='order_open_cart_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('being_delivered', False), ('ordered', True), ('received', False)), fields=['-id'], name='order_new_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(fields=['item', 'user', 'ordered'], name='orderitem_item_user_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.10 on 2026-10-18 14:21
+
+from django.db import migrations, models
+
+
+def keep_latest_default(apps, schema_editor):
+    # Addresses created or updated with default=True could leave several
+    # defaults per user and type; keep the most recent one of each.
+    Address = apps.get_model('store', 'Address')
+    seen = set()
+    demote = []
+    for pk, user_id, address_type in (
+        Address.objects.filter(default=True).order_by('-id').values_list('id', 'user_id', 'address_type')
+    ):
+        key = (user_id, address_type)
+        if user_id is not None and address_type is not None and key in seen:
+            demote.append(pk)
+        seen.add(key)
+    Address.objects.filter(pk__in=demote).update(default=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0020_store_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(keep_latest_default, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='address',
+            constraint=models.UniqueConstraint(condition=models.Q(('default', True)), fields=('user', 'address_type'), name='address_one_default_per_type'),
+        ),
+    ]
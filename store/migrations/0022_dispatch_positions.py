@@ -0,0 +1,25 @@
+# Generated by Django 4.2.10 on 2026-10-18 14:25
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('store', '0021_address_one_default_per_type'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='rider',
+            field=models.ForeignKey(blank=True, limit_choices_to={'is_rider': True}, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='rider', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='address',
+            index=models.Index(fields=['lat', 'lng'], name='address_lat_lng_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.10 on 2026-10-18 14:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0022_dispatch_positions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='shop',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
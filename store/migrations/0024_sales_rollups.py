@@ -0,0 +1,61 @@
+# Generated by Django 4.2.10 on 2026-10-18 14:39
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0023_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShopOrderStatus',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('new', 'New'), ('being_delivered', 'Being delivered'), ('received', 'Received')], max_length=20)),
+                ('count', models.IntegerField(default=0)),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='order_statuses', to='store.shop')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ShopDailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('orders', models.IntegerField(default=0)),
+                ('units', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='store.shop')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ItemDailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('units', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='store.item')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='item_daily_sales', to='store.shop')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='shoporderstatus',
+            constraint=models.UniqueConstraint(fields=('shop', 'status'), name='shop_order_status_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='shopdailysales',
+            constraint=models.UniqueConstraint(fields=('shop', 'date'), name='shop_daily_sales_unique'),
+        ),
+        migrations.AddIndex(
+            model_name='itemdailysales',
+            index=models.Index(fields=['shop', 'date'], name='item_daily_sales_shop_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='itemdailysales',
+            constraint=models.UniqueConstraint(fields=('item', 'date'), name='item_daily_sales_unique'),
+        ),
+    ]
@@ -1,5 +1,9 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, Min, Q
 from Auth.models import User
+from .cache import bump_user_shops
+from .geo import bounding_box, haversine_expression
+from .pricing import order_total
 
 # Create your models here.
 ADDRESS_CHOICES = (
@@ -15,20 +19,59 @@ class Category(models.Model):
     def __str__(self):
         return self.name
 
+class ShopQuerySet(models.QuerySet):
+    def with_profile(self):
+        # Loads the vendor and all of their addresses in two batched queries,
+        # so ShopSerializer doesn't hit the database once per shop.
+        return self.select_related('user').prefetch_related(
+            models.Prefetch(
+                'user__address_set',
+                queryset=Address.objects.default_first(),
+                to_attr='address_list'
+            )
+        )
+
+    def near(self, lat, lng, radius_km):
+        # The bounding box is served by address_lat_lng_idx; only the rows
+        # inside it get the exact distance, and a shop is as close as its
+        # closest address.
+        min_lat, max_lat, min_lng, max_lng = bounding_box(lat, lng, radius_km)
+        return self.filter(
+            user__address__lat__range=(min_lat, max_lat),
+            user__address__lng__range=(min_lng, max_lng),
+        ).annotate(
+            distance=Min(haversine_expression(lat, lng, 'user__address__lat', 'user__address__lng'))
+        ).filter(distance__lte=radius_km).order_by('distance', 'id')
+
 class Shop(models.Model):
     user = models.OneToOneField(User, related_name='products', on_delete=models.CASCADE, blank=True, null=True, limit_choices_to={'is_vendor': True})
     name = models.CharField(max_length=255, blank=True, null=True)
     image = models.ImageField(upload_to='shop_images/', blank=True, null=True)
+    # Resized copies of image, see core.images
+    image_variants = models.JSONField(default=dict, blank=True)
     description = models.TextField(blank=True, null=True)
     stars = models.IntegerField(blank=True, null=True)
     reviews = models.CharField(max_length=255, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ShopQuerySet.as_manager()
+
     def __str__(self):
         return self.name
     
 
+class ItemQuerySet(models.QuerySet):
+    def with_shop(self):
+        # Same batching as Shop.objects.with_profile(), one level down.
+        return self.select_related('shop__user').prefetch_related(
+            models.Prefetch(
+                'shop__user__address_set',
+                queryset=Address.objects.default_first(),
+                to_attr='address_list'
+            )
+        )
+
 class Item(models.Model):
     shop = models.ForeignKey(Shop, on_delete=models.CASCADE)
     category = models.ForeignKey(Category, blank=True, null=True, on_delete=models.CASCADE)
@@ -39,19 +82,41 @@ class Item(models.Model):
     price = models.FloatField()
     discount_price = models.FloatField(blank=True, null=True)
     image = models.ImageField(upload_to='item_images/', blank=True, null=True)
+    image_variants = models.JSONField(default=dict, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ItemQuerySet.as_manager()
+
     def __str__(self):
         return self.name
 
 
+class OrderItemQuerySet(models.QuerySet):
+    def with_item(self):
+        # Everything OrderItemSerializer reads, see Item.objects.with_shop()
+        return self.select_related('item__shop__user').prefetch_related(
+            models.Prefetch(
+                'item__shop__user__address_set',
+                queryset=Address.objects.default_first(),
+                to_attr='address_list'
+            )
+        )
+
 class OrderItem(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     ordered = models.BooleanField(default=False)
     item = models.ForeignKey(Item, on_delete=models.CASCADE)
     quantity = models.IntegerField(default=1)
 
+    objects = OrderItemQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Cart lookups in AddToCartView / OrderQuantityUpdateView
+            models.Index(fields=['item', 'user', 'ordered'], name='orderitem_item_user_idx'),
+        ]
+
     def __str__(self):
         return f"{self.quantity} of {self.item.name}"
     
@@ -69,8 +134,34 @@ class OrderItem(models.Model):
             return self.get_total_discount_item_price()
         return self.get_total_item_price()
 
+class OrderQuerySet(models.QuerySet):
+    def with_summary(self):
+        # Everything OrderSerializer reads, in a fixed number of queries
+        return self.select_related('user', 'coupon').prefetch_related(
+            models.Prefetch('items', queryset=OrderItem.objects.select_related('item__shop__user').prefetch_related(
+                models.Prefetch(
+                    'item__shop__user__address_set',
+                    queryset=Address.objects.default_first(),
+                    to_attr='address_list'
+                )
+            ))
+        )
+
+    def status_counts(self):
+        # All of the dashboard counters in a single conditional aggregate
+        counts = self.aggregate(
+            being_delivered_count=Count('id', filter=Q(being_delivered=True)),
+            received_count=Count('id', filter=Q(received=True)),
+            new_order_count=Count('id', filter=Q(ordered=True, received=False, being_delivered=False)),
+        )
+        return {
+            'being_delivered': counts['being_delivered_count'],
+            'received': counts['received_count'],
+            'newOrder': counts['new_order_count'],
+        }
+
 class Order(models.Model):
-    rider = models.OneToOneField(User, related_name='rider', on_delete=models.SET_NULL, blank=True, null=True, limit_choices_to={'is_rider': True})
+    rider = models.ForeignKey(User, related_name='rider', on_delete=models.SET_NULL, blank=True, null=True, limit_choices_to={'is_rider': True})
     user = models.ForeignKey(User, on_delete=models.CASCADE, limit_choices_to={'is_client': True})
     shop = models.ForeignKey(Shop, on_delete=models.CASCADE, blank=True, null=True)
     ref_code = models.CharField(max_length=20, blank=True, null=True)
@@ -91,16 +182,53 @@ class Order(models.Model):
     refund_requested = models.BooleanField(default=False)
     refund_granted = models.BooleanField(default=False)
 
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Every cart/checkout view looks up the user's single open order
+            models.Index(fields=['user'], condition=Q(ordered=False), name='order_open_cart_idx'),
+            # OrderListView ?ordered=, newest first. The flags are too
+            # unselective for a plain composite index to be used.
+            models.Index(fields=['-id'], condition=Q(ordered=True, received=False, being_delivered=False),
+                         name='order_new_idx'),
+        ]
+
     def __str__(self):
         return self.user.username
     
     def get_total(self):
-        total = 0
-        for order_item in self.items.all():
-            total += order_item.get_final_price()
-        if self.coupon:
-            total -= self.coupon.amount
-        return total
+        # The same Decimal total checkout charges
+        return order_total(self)
+
+class AddressQuerySet(models.QuerySet):
+    def default_first(self):
+        return self.order_by('-default', 'id')
+
+    def clear_default(self, user_id, address_type, exclude_pk=None):
+        # Call inside the transaction that sets the new default. Default
+        # switches for a user are serialised on their User row, as cart
+        # changes are, so two concurrent switches can't both clear and then
+        # both set a default. Then one UPDATE touching only the current
+        # default, if there is one.
+        User.objects.select_for_update().filter(pk=user_id).exists()
+        queryset = self.filter(user_id=user_id, address_type=address_type, default=True)
+        if exclude_pk is not None:
+            queryset = queryset.exclude(pk=exclude_pk)
+        return queryset.update(default=False)
+
+    def make_default(self, address):
+        # Clear first: the partial unique constraint allows one default per
+        # user and address_type at any moment.
+        with transaction.atomic():
+            self.clear_default(address.user_id, address.address_type, exclude_pk=address.pk)
+            self.filter(pk=address.pk).update(default=True)
+            # update() sends no post_save
+            from .dispatch import user_moved
+            bump_user_shops(address.user_id)
+            user_moved(address.user_id)
+        address.default = True
+        return address
 
 class Address(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, blank=True, null=True)
@@ -111,6 +239,30 @@ class Address(models.Model):
     address_type = models.CharField(max_length=1, choices=ADDRESS_CHOICES, blank=True, null=True)
     default = models.BooleanField(default=False)
 
+    objects = AddressQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets store.signals tell whether a save moved the address
+        instance._loaded_position = instance.position_state()
+        return instance
+
+    def position_state(self):
+        return (self.__dict__.get('user_id'), self.__dict__.get('lat'),
+                self.__dict__.get('lng'), self.__dict__.get('default'))
+
+    class Meta:
+        indexes = [
+            # Bounding-box prefilters on position
+            models.Index(fields=['lat', 'lng'], name='address_lat_lng_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'address_type'], condition=Q(default=True), name='address_one_default_per_type'
+            ),
+        ]
+
     def __str__(self):
         return self.user.username
 
@@ -138,3 +290,59 @@ class Refund(models.Model):
 
     def __str__(self):
         return f"{self.pk}"
+
+
+# Sales rollups, maintained by store.analytics at checkout and on delivery
+# transitions and rebuilt from the orders by manage.py rebuild_sales_rollups.
+ORDER_STATUS_CHOICES = (
+    ('new', 'New'),
+    ('being_delivered', 'Being delivered'),
+    ('received', 'Received'),
+)
+
+class ShopDailySales(models.Model):
+    shop = models.ForeignKey(Shop, related_name='daily_sales', on_delete=models.CASCADE)
+    date = models.DateField()
+    orders = models.IntegerField(default=0)
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['shop', 'date'], name='shop_daily_sales_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.shop_id} {self.date}"
+
+class ItemDailySales(models.Model):
+    item = models.ForeignKey(Item, related_name='daily_sales', on_delete=models.CASCADE)
+    shop = models.ForeignKey(Shop, related_name='item_daily_sales', on_delete=models.CASCADE)
+    date = models.DateField()
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['item', 'date'], name='item_daily_sales_unique'),
+        ]
+        indexes = [
+            # Best sellers of a shop over a date range
+            models.Index(fields=['shop', 'date'], name='item_daily_sales_shop_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.item_id} {self.date}"
+
+class ShopOrderStatus(models.Model):
+    shop = models.ForeignKey(Shop, related_name='order_statuses', on_delete=models.CASCADE)
+    status = models.CharField(max_length=20, choices=ORDER_STATUS_CHOICES)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['shop', 'status'], name='shop_order_status_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.shop_id} {self.status}"
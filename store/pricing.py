@@ -0,0 +1,77 @@
+"""
+Order pricing in Decimal.
+
+Item prices are stored as floats; every amount here is converted through
+its shortest repr (10.1 -> Decimal('10.1'), not 10.0999...) and rounded to
+cents with ROUND_HALF_UP, the same rounding the ledger charges with.
+
+price_items() prices a whole batch of order items in one pass over rows
+that are already loaded, computing each distinct (price, discount_price,
+quantity) combination once, so serializers never price an item per field
+or per object. These are the Decimal counterparts of
+OrderItem.get_final_price() and friends. Every order total that is
+charged, shown or exported goes through order_total(), which rounds each
+line before adding them up; Order.get_total() returns it too.
+"""
+from collections import namedtuple
+from decimal import Decimal, ROUND_HALF_UP
+
+CENT = Decimal('0.01')
+ZERO = Decimal('0.00')
+
+
+def money(value):
+    return Decimal(str(value)).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+LinePrice = namedtuple('LinePrice', ['unit_price', 'total_price', 'total_discount_price', 'amount_saved', 'final_price'])
+
+
+def price_line(price, discount_price, quantity):
+    total = money(Decimal(str(price)) * quantity)
+    # A zero discount_price means no discount, as in OrderItem.get_final_price()
+    if not discount_price:
+        return LinePrice(money(price), total, None, ZERO, total)
+    discounted = money(Decimal(str(discount_price)) * quantity)
+    return LinePrice(money(discount_price), total, discounted, total - discounted, discounted)
+
+
+def price_items(order_items):
+    """
+    Sets .pricing (a LinePrice) on every order item and returns them as a
+    list. Load them with select_related('item') to keep it query free.
+    """
+    order_items = list(order_items)
+    lines = {}
+    for order_item in order_items:
+        key = (order_item.item.price, order_item.item.discount_price, order_item.quantity)
+        line = lines.get(key)
+        if line is None:
+            line = lines[key] = price_line(*key)
+        order_item.pricing = line
+    return order_items
+
+
+def item_price(order_item):
+    # Uses the price set by price_items() when there is one
+    pricing = getattr(order_item, 'pricing', None)
+    if pricing is None:
+        pricing = order_item.pricing = price_line(
+            order_item.item.price, order_item.item.discount_price, order_item.quantity)
+    return pricing
+
+
+def order_total(order, order_items=None):
+    """
+    The order's total: its lines' rounded final prices less the coupon,
+    taken off once and never below zero. This is the one rule for order totals; checkout charges
+    it and the order views show it. order_items defaults to the items
+    prefetched by Order.objects.with_summary(), else they are loaded.
+    """
+    if order_items is None:
+        prefetched = getattr(order, '_prefetched_objects_cache', {})
+        order_items = prefetched['items'] if 'items' in prefetched else order.items.select_related('item')
+    subtotal = sum((item_price(order_item).final_price for order_item in order_items), ZERO)
+    if order.coupon_id is not None:
+        subtotal -= money(order.coupon.amount)
+    return max(subtotal, ZERO)
@@ -0,0 +1,26 @@
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db import connections
+from django.db.models import Case, IntegerField, Value, When
+
+
+def search_by_name(queryset, term):
+    """
+    Filters queryset to rows whose name contains term and orders them by
+    relevance, most recent first among equally relevant rows.
+
+    On Postgres the icontains filter is served by the pg_trgm GIN indexes on
+    UPPER(name) (see migration 0019) and relevance is the trigram word
+    similarity. Other backends (SQLite in tests) fall back to a scan ranked
+    exact match > prefix match > substring match.
+    """
+    queryset = queryset.filter(name__icontains=term)
+    if connections[queryset.db].vendor == 'postgresql':
+        relevance = TrigramWordSimilarity(term, 'name')
+    else:
+        relevance = Case(
+            When(name__iexact=term, then=Value(2)),
+            When(name__istartswith=term, then=Value(1)),
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+    return queryset.annotate(relevance=relevance).order_by('-relevance', '-id')
@@ -1,6 +1,9 @@
 # from django_countries.serializer_fields import CountryField
+from django.db import models, transaction
 from rest_framework import serializers
 from Auth.serializers import UserSerializer
+from core.images import variant_params, variant_url
+from .pricing import item_price, order_total, price_items
 from .models import (
     Address, Item, Order, OrderItem, Coupon, Payment, Shop, Category
 )
@@ -18,49 +21,101 @@ class CouponSerializer(serializers.ModelSerializer):
 
 class ItemSerializer(serializers.ModelSerializer):
     shop = serializers.SerializerMethodField()
+    thumbnail = serializers.SerializerMethodField()
 
     class Meta:
         model = Item
-        fields = ['id', 'name', 'description', 'price', 'inventory', 'discount_price', 'image', 'shop']
+        fields = ['id', 'name', 'description', 'price', 'inventory', 'discount_price', 'image', 'thumbnail', 'shop']
+
+    def get_thumbnail(self, obj):
+        return variant_url(obj.image, obj.image_variants, self.context)
 
     def get_shop(self, obj):
-        return ShopSerializer(obj.shop).data
+        # When the view passes a 'shop_cache' dict in the context, each distinct
+        # shop is serialized once per response and reused for its other items.
+        # Thumbnails depend on the image params, so they are part of the key.
+        shop_cache = self.context.get('shop_cache')
+        if shop_cache is None:
+            return ShopSerializer(obj.shop, context=self.context).data
+        key = (obj.shop_id,) + variant_params(self.context)
+        if key not in shop_cache:
+            shop_cache[key] = ShopSerializer(obj.shop, context=self.context).data
+        return shop_cache[key]
+
+class ItemImportSerializer(ItemSerializer):
+    # Rows are keyed on slug and always imported into the vendor's own shop
+    shop = None
+    thumbnail = None
+    slug = serializers.SlugField()
+
+    class Meta:
+        model = Item
+        fields = ['slug', 'name', 'description', 'price', 'inventory', 'discount_price']
 
 class ShopSerializer(serializers.ModelSerializer):
     address = serializers.SerializerMethodField()
     user = serializers.SerializerMethodField()
+    thumbnail = serializers.SerializerMethodField()
 
     class Meta:
         model = Shop
-        fields = ['id', 'user', 'name', 'image', 'description', 'stars', 'reviews', 'address']
+        fields = ['id', 'user', 'name', 'image', 'thumbnail', 'description', 'stars', 'reviews', 'address']
+
+    def get_thumbnail(self, obj):
+        return variant_url(obj.image, obj.image_variants, self.context)
 
     def get_user(self, obj):
-        return UserSerializer(obj.user).data
+        return UserSerializer(obj.user, context=self.context).data
     
     def get_address(self, obj):
-        user_addresses = Address.objects.filter(user=obj.user)
+        # Use the addresses prefetched by Shop.objects.with_profile() when
+        # available; a shop without a vendor has none.
+        if obj.user is None:
+            return []
+        if hasattr(obj.user, 'address_list'):
+            user_addresses = obj.user.address_list
+        else:
+            user_addresses = Address.objects.filter(user=obj.user).default_first()
         serializer = AddressSerializer(instance=user_addresses, many=True)
         return serializer.data
 
+    def to_representation(self, obj):
+        data = super().to_representation(obj)
+        # Set by Shop.objects.near()
+        if getattr(obj, 'distance', None) is not None:
+            data['distance_km'] = round(obj.distance, 3)
+        return data
         
+class OrderItemListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        # Price the whole batch up front instead of item by item
+        order_items = data.all() if isinstance(data, models.Manager) else data
+        return super().to_representation(price_items(order_items))
+
 class OrderItemSerializer(serializers.ModelSerializer):
     item = serializers.SerializerMethodField()
     final_price = serializers.SerializerMethodField()
+    amount_saved = serializers.SerializerMethodField()
 
     class Meta:
         model = OrderItem
+        list_serializer_class = OrderItemListSerializer
         fields = (
             'id',
             'item',
             'quantity',
-            'final_price'
+            'final_price',
+            'amount_saved'
         )
 
     def get_item(self, obj):
-        return ItemSerializer(obj.item).data
+        return ItemSerializer(obj.item, context=self.context).data
 
     def get_final_price(self, obj):
-        return obj.get_final_price()
+        return item_price(obj).final_price
+
+    def get_amount_saved(self, obj):
+        return item_price(obj).amount_saved
 
 
 class OrderSerializer(serializers.ModelSerializer):
@@ -85,18 +140,18 @@ class OrderSerializer(serializers.ModelSerializer):
         )
 
     def get_order_items(self, obj):
-        return OrderItemSerializer(obj.items.all(), many=True).data
+        return OrderItemSerializer(obj.items.all(), many=True, context=self.context).data
 
     def get_total(self, obj):
-        return obj.get_total()
+        return order_total(obj)
 
     def get_coupon(self, obj):
         if obj.coupon is not None:
-            return CouponSerializer(obj.coupon).data
+            return CouponSerializer(obj.coupon, context=self.context).data
         return None
     
     def get_user(self, obj):
-        return UserSerializer(obj.user).data
+        return UserSerializer(obj.user, context=self.context).data
 
 
 class ItemDetailSerializer(serializers.ModelSerializer):
@@ -118,7 +173,7 @@ class ItemDetailSerializer(serializers.ModelSerializer):
     #     return obj.get_category_display()
     
     def get_category(self, obj):
-        return CategorySerializer(obj.category).data
+        return CategorySerializer(obj.category, context=self.context).data
 
 
     def get_label(self, obj):
@@ -140,6 +195,23 @@ class AddressSerializer(serializers.ModelSerializer):
             'default'
         )
 
+    # Saving a new default demotes the previous one first, which the unique
+    # constraint on (user, address_type) WHERE default requires.
+    def create(self, validated_data):
+        with transaction.atomic():
+            if validated_data.get('default') and validated_data.get('user') is not None:
+                Address.objects.clear_default(validated_data['user'].id, validated_data.get('address_type'))
+            return super().create(validated_data)
+
+    def update(self, instance, validated_data):
+        with transaction.atomic():
+            if validated_data.get('default', instance.default):
+                user = validated_data.get('user', instance.user)
+                address_type = validated_data.get('address_type', instance.address_type)
+                if user is not None:
+                    Address.objects.clear_default(user.id, address_type, exclude_pk=instance.pk)
+            return super().update(instance, validated_data)
+
 
 class PaymentSerializer(serializers.ModelSerializer):
     class Meta:
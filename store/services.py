@@ -0,0 +1,97 @@
+import random
+import string
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from Auth import ledger
+from Auth.models import User
+from . import analytics
+from .models import Order, OrderItem, Payment
+from .pricing import order_total, price_items
+from .tasks import send_order_receipt
+
+
+class CheckoutError(Exception):
+    message = 'Checkout failed'
+
+
+class NoActiveOrder(CheckoutError):
+    message = 'You do not have an active order'
+
+
+class InsufficientBalance(CheckoutError):
+    message = 'Insufficient balance'
+
+
+def create_ref_code():
+    return ''.join(random.choices(string.ascii_lowercase + string.digits, k=20))
+
+
+def add_to_cart(user, item):
+    """
+    Adds one unit of item to the user's open order, creating the order and
+    the order item as needed.
+
+    Cart mutations for a user are serialised on their User row, so
+    concurrent clicks increment the same OrderItem instead of creating
+    duplicates. An item already in the cart costs three queries.
+    """
+    with transaction.atomic():
+        User.objects.select_for_update().only('id').get(pk=user.pk)
+
+        order = Order.objects.filter(user=user, ordered=False).first()
+        if order is None:
+            order = Order.objects.create(user=user, ordered_date=timezone.now(), shop_id=item.shop_id)
+            updated = 0
+        else:
+            updated = OrderItem.objects.filter(
+                order=order, item=item, user=user, ordered=False
+            ).update(quantity=F('quantity') + 1)
+
+        if not updated:
+            order_item = OrderItem.objects.create(item=item, user=user, ordered=False)
+            Order.items.through.objects.create(order_id=order.id, orderitem_id=order_item.id)
+
+    return order
+
+
+def checkout(user):
+    """
+    Pays for the user's open order out of their account balance.
+
+    Everything runs in one transaction: the open order row is locked so a
+    double submit can't pay twice, the total is priced once by
+    store.pricing (the same figure the order views show) and the balance is
+    debited through the ledger's conditional UPDATE instead of a
+    read-modify-write.
+    """
+    with transaction.atomic():
+        order = Order.objects.select_for_update().filter(user=user, ordered=False).first()
+        if order is None:
+            raise NoActiveOrder()
+
+        order_items = price_items(order.items.select_related('item'))
+        amount = order_total(order, order_items)
+
+        # A coupon can cover the whole order, leaving nothing to debit
+        if amount > 0:
+            try:
+                ledger.debit(user.pk, amount, kind='P')
+            except ledger.InsufficientBalance:
+                raise InsufficientBalance()
+
+        payment = Payment.objects.create(user=user, amount=amount)
+        order.items.update(ordered=True)
+
+        order.ordered = True
+        order.payment = payment
+        order.ref_code = create_ref_code()
+        order.save(update_fields=['ordered', 'payment', 'ref_code'])
+        analytics.record_checkout(order, amount, order_items)
+
+        # Queued with the payment: it only runs if the checkout commits
+        send_order_receipt.delay(order.pk)
+
+    return order
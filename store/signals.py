@@ -0,0 +1,86 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from Auth.models import User
+from core import images
+from .cache import (
+    CATALOGUE_CATEGORIES, CATALOGUE_ITEMS, CATALOGUE_SHOPS, bump_on_commit, bump_user_shops, shop_namespace
+)
+from .dispatch import order_changed, order_removed, rider_changed, user_moved
+from .models import Address, Category, Item, Order, Shop
+
+
+# Saves touching none of these can't change whether or where an order is available
+DISPATCH_ORDER_FIELDS = {'ordered', 'rider', 'received', 'shop', 'shipping_address'}
+
+
+@receiver([post_save, post_delete], sender=Order)
+def invalidate_order_counters(sender, instance, **kwargs):
+    bump_on_commit('orders')
+
+
+@receiver(post_save, sender=Order)
+def update_dispatch_order(sender, instance, update_fields=None, **kwargs):
+    # Open carts never show up in dispatch
+    if not instance.ordered:
+        return
+    if update_fields is None or DISPATCH_ORDER_FIELDS.intersection(update_fields):
+        order_changed(instance.pk)
+
+
+@receiver(post_delete, sender=Order)
+def remove_dispatch_order(sender, instance, **kwargs):
+    if instance.ordered:
+        order_removed(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=Item)
+def invalidate_item(sender, instance, **kwargs):
+    bump_on_commit(CATALOGUE_ITEMS, shop_namespace(instance.shop_id))
+
+
+@receiver([post_save, post_delete], sender=Shop)
+def invalidate_shop(sender, instance, **kwargs):
+    bump_on_commit(CATALOGUE_SHOPS, shop_namespace(instance.id))
+
+
+@receiver([post_save, post_delete], sender=Address)
+def invalidate_shop_address(sender, instance, **kwargs):
+    if instance.user_id is not None:
+        bump_user_shops(instance.user_id)
+
+
+@receiver(post_save, sender=Address)
+def update_dispatch_address(sender, instance, created, **kwargs):
+    # Only when the address was added, moved or changed owner or default
+    loaded = getattr(instance, '_loaded_position', None)
+    position = instance.position_state()
+    if created or loaded != position:
+        for user_id in {instance.user_id, loaded[0] if loaded else None} - {None}:
+            user_moved(user_id)
+    instance._loaded_position = position
+
+
+@receiver(post_delete, sender=Address)
+def remove_dispatch_address(sender, instance, **kwargs):
+    if instance.user_id is not None:
+        user_moved(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def invalidate_shop_vendor(sender, instance, update_fields=None, **kwargs):
+    if instance.is_vendor:
+        bump_user_shops(instance.id)
+    # e.g. not for the last_login updates made on every login
+    if instance.is_rider and (update_fields is None or {'is_rider', 'is_active'}.intersection(update_fields)):
+        rider_changed(instance.id)
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_category(sender, instance, **kwargs):
+    bump_on_commit(CATALOGUE_CATEGORIES)
+
+
+# Resized copies of uploaded images
+images.register(Item)
+images.register(Shop)
@@ -0,0 +1,43 @@
+import tempfile
+import time
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.mail import send_mail
+
+from jobs.queue import task
+from .exports import export_dates, order_export
+from .models import Order
+from .pricing import money, order_total, price_items
+from .streaming import csv_lines, ndjson_lines
+
+
+@task()
+def send_order_receipt(order_id):
+    order = Order.objects.select_related('user', 'coupon').get(pk=order_id)
+    if not order.user.email:
+        return {'sent': False}
+    lines = ['Order %s' % order.ref_code, '']
+    order_items = price_items(order.items.select_related('item'))
+    for order_item in order_items:
+        lines.append('%s x %s  %s' % (order_item.quantity, order_item.item.name, order_item.pricing.final_price))
+    if order.coupon is not None:
+        lines.append('Coupon %s  -%s' % (order.coupon.code, money(order.coupon.amount)))
+    lines += ['', 'Total: %s' % order_total(order, order_items)]
+    send_mail('Your order %s' % order.ref_code, '\n'.join(lines), None, [order.user.email])
+    return {'sent': True}
+
+
+@task(max_attempts=3, backoff=60)
+def export_orders(kind, start=None, end=None, output='csv'):
+    """Writes an order export to the default storage and returns where."""
+    dates = export_dates(start=start, end=end)
+    header, rows = order_export(kind, **dates)
+    lines = ndjson_lines(header, rows) if output == 'ndjson' else csv_lines(header, rows)
+    with tempfile.TemporaryFile() as spool:
+        for chunk in lines:
+            spool.write(chunk.encode('utf-8'))
+        size = spool.tell()
+        spool.seek(0)
+        name = default_storage.save('exports/order-%s-%d.%s' % (kind, time.time(), output), File(spool))
+    return {'name': name, 'url': default_storage.url(name), 'bytes': size}
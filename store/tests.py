@@ -1,3 +1,626 @@
-from django.test import TestCase
+import random
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from Auth import ledger
+from Auth.models import BalanceTransaction, User
+from jobs.models import Job
+from store import analytics, dispatch, exports, loadtest, search, services, tasks
+from store.bench import (
+    count_queries, seed_catalogue, seed_customers, seed_open_orders, seed_order_history, seed_store
+)
+from store.cache import get_version, shop_namespace
+from store.models import Address, Category, Coupon, Item, ItemDailySales, Order, Payment, Shop, ShopDailySales
+
+
+class EndpointQueryBudgetTests(TestCase):
+    """
+    Every endpoint driven by manage.py loadtest stays within the queries
+    per request recorded in loadtest_baseline.json. The full load test,
+    with throughput and latency, is manage.py loadtest.
+    """
+    requests = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.customers, cls.tokens, cls.items = seed_store(
+            customers=20, shops=4, items_per_shop=10, orders_per_customer=3)
+        cls.baseline = loadtest.load_baseline()
+
+    def setUp(self):
+        # Start from a cold catalogue cache, so max_queries covers a miss
+        cache.clear()
+        loadtest.warm_tokens(self.tokens)
+
+    def drive(self, name):
+        jobs = loadtest.jobs_for(name, self.tokens, self.items, self.requests, random.Random(0))
+        result, queries = loadtest.drive(name, jobs, clients=1)
+        self.assertEqual(result.errors, [])
+        self.assertEqual(len(queries), self.requests)
+        return loadtest.summarize(result, queries)
+
+    def assertWithinBudget(self, name):
+        summary = self.drive(name)
+        self.assertLessEqual(summary['queries'], self.baseline[name]['queries'])
+        # Includes the requests that miss the catalogue cache
+        self.assertLessEqual(summary['max_queries'], self.baseline[name]['max_queries'])
+
+    def test_products(self):
+        self.assertWithinBudget('products')
+
+    def test_shops(self):
+        self.assertWithinBudget('shops')
+
+    def test_order_list(self):
+        self.assertWithinBudget('order-list')
+
+    def test_add_to_cart(self):
+        self.assertWithinBudget('add-to-cart')
+
+    def test_checkout(self):
+        self.assertWithinBudget('checkout')
+
+    def test_regressions(self):
+        summary = {'errors': 0, 'first_error': None, 'queries': 5, 'throughput': 50.0,
+                   'p50_ms': 10.0, 'p95_ms': 30.0, 'p99_ms': 40.0}
+        baseline = {'products': {'queries': 5, 'throughput': 100.0, 'p95_ms': 20.0}}
+        self.assertEqual(loadtest.regressions({'products': summary}, {'products': {'queries': 5}}), [])
+        found = loadtest.regressions({'products': summary}, baseline, tolerance=0.2)
+        self.assertEqual(len(found), 2)
+        self.assertIn('requests/second', found[0])
+        self.assertIn('p95_ms', found[1])
+        self.assertIn('queries', loadtest.regressions({'products': dict(summary, queries=6)}, baseline)[0])
+        found = loadtest.regressions(
+            {'products': dict(summary, max_queries=9)}, {'products': {'queries': 5, 'max_queries': 8}})
+        self.assertEqual(len(found), 1)
+        self.assertIn('at most 9 queries', found[0])
+
+
+class AsyncViewTests(TestCase):
+    """The api/async/ endpoints return what their DRF counterparts do."""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalogue(shops=2, items_per_shop=3)
+        # A shop whose vendor is gone has no address to serialize
+        Shop.objects.create(name='Orphan shop')
+        cls.customer = seed_customers(1)[0]
+        seed_open_orders([cls.customer], Item.objects.order_by('id'))
+        cls.token = Token.objects.create(user=cls.customer).key
+
+    async def assertSameAsSync(self, path, **headers):
+        response = await self.async_client.get('/api/async/' + path, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        expected = await self.async_client.get('/api/' + path, headers=headers)
+        data, expected = response.json(), expected.json()
+        if 'next' in data:
+            # Page links point at their own endpoint
+            for link in ('next', 'previous'):
+                data[link] = data[link] and data[link].replace('/api/async/', '/api/')
+        self.assertEqual(data, expected)
+        return data
+
+    async def test_shops(self):
+        data = await self.assertSameAsSync('shops/')
+        orphan = [shop for shop in data if shop['name'] == 'Orphan shop']
+        self.assertEqual(orphan[0]['address'], [])
+
+    async def test_shops_paginated(self):
+        data = await self.assertSameAsSync('shops/?PageSize=2')
+        self.assertEqual(data['count'], 3)
+
+    async def test_products(self):
+        data = await self.assertSameAsSync('products/?PageSize=4')
+        self.assertEqual(data['count'], 6)
+
+    async def test_product_detail(self):
+        item = await Item.objects.order_by('id').afirst()
+        await self.assertSameAsSync('products/%d/' % item.pk)
+        response = await self.async_client.get('/api/async/products/0/')
+        self.assertEqual(response.status_code, 404)
+
+    async def test_order_summary(self):
+        data = await self.assertSameAsSync('order-summary/', authorization='Token %s' % self.token)
+        self.assertEqual(len(data['order_items']), 3)
+        response = await self.async_client.get('/api/async/order-summary/')
+        self.assertEqual(response.status_code, 401)
+
+
+class OrderTotalTests(TestCase):
+    """Checkout charges the total the order views show, rounded per line."""
+
+    @classmethod
+    def setUpTestData(cls):
+        vendor = User.objects.create(username='pricing-vendor', is_vendor=True)
+        cls.shop = Shop.objects.create(user=vendor, name='Pricing shop')
+        cls.customer = User.objects.create(username='pricing-customer')
+        ledger.credit(cls.customer.pk, 100)
+        for name in ('a', 'b'):
+            item = Item.objects.create(shop=cls.shop, name=name, slug='pricing-%s' % name, price=1.005)
+            services.add_to_cart(cls.customer, item)
+        cls.token = Token.objects.create(user=cls.customer).key
+
+    def test_checkout_charges_the_listed_total(self):
+        response = self.client.get('/api/order-list/', headers={'authorization': 'Token %s' % self.token})
+        listed = response.json()['results'][0]['total']
+        self.assertEqual(listed, 2.02)
+        self.assertEqual(Order.objects.get(user=self.customer).get_total(), Decimal('2.02'))
+
+        order = services.checkout(self.customer)
+        self.assertEqual(order.get_total(), Decimal('2.02'))
+        self.assertEqual(User.objects.get(pk=self.customer.pk).acc_balance, Decimal('97.98'))
+        self.assertEqual(ShopDailySales.objects.get(shop=self.shop).revenue, Decimal('2.02'))
+
+        # rebuild() recomputes the same figures
+        analytics.rebuild(self.shop.pk)
+        self.assertEqual(ShopDailySales.objects.get(shop=self.shop).revenue, Decimal('2.02'))
+        self.assertEqual(
+            sorted(ItemDailySales.objects.values_list('revenue', flat=True)), [Decimal('1.01'), Decimal('1.01')])
+
+        # Shop revenue stays what was charged after a price change
+        Item.objects.filter(shop=self.shop).update(price=4.5)
+        analytics.rebuild(self.shop.pk)
+        self.assertEqual(ShopDailySales.objects.get(shop=self.shop).revenue, Decimal('2.02'))
+
+
+class ItemImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.vendor = User.objects.create(username='import-vendor', is_vendor=True)
+        cls.shop = Shop.objects.create(user=cls.vendor, name='Import shop')
+        cls.token = Token.objects.create(user=cls.vendor).key
+
+    def post(self, body, content_type='application/x-ndjson'):
+        return self.client.post('/api/products-import/', body, content_type=content_type,
+                                headers={'authorization': 'Token %s' % self.token})
+
+    def test_empty_body(self):
+        response = self.post('')
+        self.assertEqual(response.status_code, 400)
+
+    def test_parse_error_keeps_committed_chunks(self):
+        rows = ['{"slug": "item-%d", "name": "Item %d", "price": 1.5}' % (n, n) for n in range(3)]
+        version = get_version(shop_namespace(self.shop.pk))
+        with mock.patch('store.bulk.CHUNK_SIZE', 2):
+            response = self.post('\n'.join(rows + ['{"slug": ']))
+        self.assertEqual(response.status_code, 400)
+        data = response.json()
+        self.assertIn('Could not parse the file', data['message'])
+        self.assertEqual((data['rows'], data['created']), (2, 2))
+        self.assertEqual(Item.objects.filter(shop=self.shop).count(), 2)
+        # The committed chunk invalidated the shop's cached catalogue
+        self.assertNotEqual(get_version(shop_namespace(self.shop.pk)), version)
+
+
+class OrderExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        admin = User.objects.create(username='export-admin', is_staff=True)
+        cls.token = Token.objects.create(user=admin).key
+
+    def test_invalid_dates(self):
+        for query in ('start=2024-13-45', 'end=yesterday'):
+            for method in (self.client.get, self.client.post):
+                response = method('/api/orders-export/?' + query,
+                                  headers={'authorization': 'Token %s' % self.token})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['message'], 'Invalid %s date' % query.split('=')[0])
+
+    def test_totals_match_the_charge(self):
+        vendor = User.objects.create(username='export-vendor', is_vendor=True)
+        shop = Shop.objects.create(user=vendor, name='Export shop')
+        customer = User.objects.create(username='export-customer')
+        ledger.credit(customer.pk, 10)
+        for name, price in (('a', 1.005), ('b', 0.1), ('c', 0.2)):
+            services.add_to_cart(customer, Item.objects.create(shop=shop, name=name, slug='export-' + name, price=price))
+        order = services.checkout(customer)
+
+        header, rows = exports.order_export('orders')
+        self.assertEqual([dict(zip(header, row))['total'] for row in rows], [order.get_total()])
+        header, rows = exports.order_export('payments')
+        self.assertEqual([dict(zip(header, row))['amount'] for row in rows], [Decimal('1.31')])
+        header, rows = exports.order_export('items')
+        self.assertEqual(sum(dict(zip(header, row))['final_price'] for row in rows), order.get_total())
+
+    def test_task_rejects_invalid_dates(self):
+        with self.assertRaisesMessage(ValueError, 'Invalid start date'):
+            tasks.export_orders('orders', start='2024-13-45')
+
+
+@override_settings(DEFAULT_FILE_STORAGE='django.core.files.storage.FileSystemStorage', MEDIA_URL='/media/')
+class NestedImageTests(TestCase):
+    """Nested shops and vendors pick their thumbnails from the request's image params."""
+
+    @classmethod
+    def setUpTestData(cls):
+        vendor = User.objects.create(username='image-vendor', is_vendor=True)
+        shop = Shop.objects.create(user=vendor, name='Image shop')
+        Item.objects.create(shop=shop, name='Pictured', slug='pictured', price=3)
+        variants = {'source': 'images/a.jpg', 'thumb.jpeg': 'images/a.160.jpg', 'small.webp': 'images/a.320.webp'}
+        # update() skips the post_save hook that would queue real variants
+        Shop.objects.filter(pk=shop.pk).update(image='images/a.jpg', image_variants=variants)
+        User.objects.filter(pk=vendor.pk).update(image='images/a.jpg', image_variants=variants)
+
+    def shop(self, query=''):
+        data = self.client.get('/api/products/' + query).json()
+        return (data['results'] if isinstance(data, dict) else data)[0]['shop']
+
+    def test_image_params_reach_nested_serializers(self):
+        shop = self.shop('?image_size=thumb&image_format=jpeg')
+        self.assertEqual(shop['thumbnail'], 'http://testserver/media/images/a.160.jpg')
+        self.assertEqual(shop['user']['thumbnail'], 'http://testserver/media/images/a.160.jpg')
+        # And the defaults without them
+        shop = self.shop()
+        self.assertEqual(shop['thumbnail'], 'http://testserver/media/images/a.320.webp')
+
+
+class CheckoutTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalogue(shops=1, items_per_shop=2)
+        cls.customer = seed_customers(1, prefix='checkout')[0]
+        seed_open_orders([cls.customer], Item.objects.order_by('id'))
+
+    def test_insufficient_balance_rolls_back(self):
+        User.objects.filter(pk=self.customer.pk).update(acc_balance=Decimal('0.01'))
+        with self.assertRaises(services.InsufficientBalance):
+            services.checkout(self.customer)
+        order = Order.objects.get(user=self.customer)
+        self.assertFalse(order.ordered)
+        self.assertIsNone(order.payment_id)
+        self.assertFalse(order.items.filter(ordered=True).exists())
+        self.assertFalse(Payment.objects.exists())
+        self.assertFalse(ShopDailySales.objects.exists())
+        self.assertFalse(Job.objects.exists())
+        self.assertEqual(User.objects.get(pk=self.customer.pk).acc_balance, Decimal('0.01'))
+
+    def test_coupon_larger_than_the_order(self):
+        User.objects.filter(pk=self.customer.pk).update(acc_balance=Decimal('5.00'))
+        Order.objects.filter(user=self.customer).update(coupon=Coupon.objects.create(code='ALL', amount=10000))
+        order = services.checkout(self.customer)
+        self.assertEqual(order.get_total(), Decimal('0.00'))
+        self.assertEqual(Payment.objects.get().amount, 0)
+        self.assertEqual(User.objects.get(pk=self.customer.pk).acc_balance, Decimal('5.00'))
+        self.assertFalse(BalanceTransaction.objects.filter(user=self.customer).exists())
+        self.assertEqual(ShopDailySales.objects.get().revenue, Decimal('0.00'))
+        analytics.rebuild()
+        self.assertEqual(ShopDailySales.objects.get().revenue, Decimal('0.00'))
+
+    def test_no_active_order(self):
+        with self.assertRaises(services.NoActiveOrder):
+            services.checkout(User.objects.create(username='checkout-empty'))
+
+
+class CheckoutQueryTests(TestCase):
+    """Checkout costs the same number of queries whatever the size of the cart."""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalogue(shops=1, items_per_shop=10)
+        items = Item.objects.order_by('id')
+        cls.small, cls.large = seed_customers(2, balance=10000, prefix='checkout-size')
+        seed_open_orders([cls.small], items, items_per_order=1)
+        seed_open_orders([cls.large], items, items_per_order=10)
+        # The shop's daily row already exists, as it does after its first sale
+        warmup = seed_customers(1, balance=10000, prefix='checkout-warmup')[0]
+        seed_open_orders([warmup], items, items_per_order=1)
+        services.checkout(warmup)
+
+    def queries(self, customer):
+        with CaptureQueriesContext(connection) as captured:
+            services.checkout(customer)
+        return count_queries(captured)
+
+    def test_query_count(self):
+        self.assertEqual(self.queries(self.small), self.queries(self.large))
+        self.assertEqual(
+            dict(ItemDailySales.objects.values_list('item__name', 'units')),
+            {'Bench item 0-%d' % j: 1 + j + (j == 0) * 2 for j in range(10)})
+        self.assertEqual(ShopDailySales.objects.get().units, 1 + 1 + 55)
+
+
+class DispatchTests(TestCase):
+    """An order goes to one rider only, however many try to take it."""
+
+    @classmethod
+    def setUpTestData(cls):
+        vendor = User.objects.create(username='dispatch-vendor', is_vendor=True)
+        Address.objects.create(user=vendor, lat=6.2, lng=-75.5, address_type='S', default=True)
+        cls.shop = Shop.objects.create(user=vendor, name='Dispatch shop')
+        customer = User.objects.create(username='dispatch-customer')
+        cls.orders = [
+            Order.objects.create(user=customer, shop=cls.shop, ordered=True, ordered_date=timezone.now())
+            for _ in range(2)
+        ]
+        cls.riders = [User.objects.create(username='dispatch-rider-%d' % i, is_rider=True) for i in range(2)]
+        analytics.rebuild(cls.shop.pk)
+
+    def setUp(self):
+        # Build a fresh index from this test's data
+        patcher = mock.patch.object(dispatch, '_index', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_assign_twice(self):
+        order = self.orders[0]
+        dispatch.assign(order.pk, self.riders[0])
+        with self.assertRaises(dispatch.OrderUnavailable):
+            dispatch.assign(order.pk, self.riders[1])
+        order.refresh_from_db()
+        self.assertEqual((order.rider_id, order.being_delivered), (self.riders[0].pk, True))
+        self.assertEqual(analytics.status_counts(self.shop.pk), {'being_delivered': 1, 'received': 0, 'newOrder': 1})
+
+    def test_claim_nearest_skips_assigned_orders(self):
+        # Build the index while both orders are available
+        self.assertEqual(len(dispatch.nearest_orders(6.2, -75.5)), 2)
+        first = dispatch.claim_nearest(self.riders[0], 6.2, -75.5)
+        second = dispatch.claim_nearest(self.riders[1], 6.2, -75.5)
+        self.assertNotEqual(first.pk, second.pk)
+        with self.assertRaises(dispatch.NoOrderNearby):
+            dispatch.claim_nearest(self.riders[1], 6.2, -75.5)
+        self.assertEqual(
+            dict(Order.objects.filter(shop=self.shop).values_list('id', 'rider_id')),
+            {first.pk: self.riders[0].pk, second.pk: self.riders[1].pk})
+
+
+class ShopAnalyticsViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        vendor = User.objects.create(username='analytics-vendor', is_vendor=True)
+        Shop.objects.create(user=vendor, name='Analytics shop')
+        cls.token = Token.objects.create(user=vendor).key
+
+    def get(self, query):
+        return self.client.get('/api/analytics/items/' + query, headers={'authorization': 'Token %s' % self.token})
+
+    def test_item_sales_limit(self):
+        self.assertEqual(self.get('?limit=5').status_code, 200)
+        for limit in ('0', '-1', 'many'):
+            self.assertEqual(self.get('?limit=' + limit).status_code, 400)
+
+
+class ShopDetailViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        vendor = User.objects.create(username='detail-vendor', is_vendor=True)
+        Shop.objects.create(user=vendor, name='Detail shop')
+        cls.vendor_token = Token.objects.create(user=vendor).key
+        cls.customer_token = Token.objects.create(user=User.objects.create(username='detail-customer')).key
+
+    def get(self, token=None, **headers):
+        if token:
+            headers['authorization'] = 'Token %s' % token
+        return self.client.get('/api/shop-detail/', headers=headers)
+
+    def test_own_shop(self):
+        response = self.get(self.vendor_token)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['name'], 'Detail shop')
+        self.assertEqual(self.get(self.vendor_token, if_none_match=response['ETag']).status_code, 304)
+
+    def test_without_a_shop(self):
+        self.assertEqual(self.get(self.customer_token).status_code, 404)
+        self.assertEqual(self.get().status_code, 404)
+
+
+class AddressDefaultTests(TestCase):
+    def test_make_default_switches_the_default(self):
+        user = User.objects.create(username='address-owner')
+        first = Address.objects.create(user=user, address_type='S', default=True)
+        second = Address.objects.create(user=user, address_type='S')
+        Address.objects.make_default(second)
+        self.assertEqual(
+            dict(Address.objects.filter(user=user).values_list('pk', 'default')), {first.pk: False, second.pk: True})
+
+
+class CatalogueCacheTests(TestCase):
+    """Saving or deleting an item, shop or category invalidates the cached catalogue."""
+
+    def setUp(self):
+        cache.clear()
+        vendor = User.objects.create(username='catalogue-vendor', is_vendor=True)
+        self.shop = Shop.objects.create(user=vendor, name='Catalogue shop')
+        self.category = Category.objects.create(name='Old category')
+        self.item = Item.objects.create(shop=self.shop, category=self.category, name='Old', slug='old', price=2)
+
+    def products(self):
+        data = self.client.get('/api/products/').json()
+        return data['results'] if isinstance(data, dict) else data
+
+    def detail(self):
+        return self.client.get('/api/products/%d/' % self.item.pk).json()
+
+    def assertCachedUntil(self, change, read, stale, fresh):
+        self.assertEqual(read(), stale)
+        # update() sends no signal and the cached copy is still served
+        change(signal=False)
+        self.assertEqual(read(), stale)
+        change(signal=True)
+        self.assertEqual(read(), fresh)
+
+    def rename(self, obj, name):
+        def change(signal):
+            if signal:
+                obj.name = name
+                obj.save()
+            else:
+                type(obj).objects.filter(pk=obj.pk).update(name=name)
+        return change
+
+    def test_item_save(self):
+        self.assertCachedUntil(
+            self.rename(self.item, 'New'), lambda: [item['name'] for item in self.products()], ['Old'], ['New'])
+
+    def test_item_delete(self):
+        self.assertEqual(len(self.products()), 1)
+        self.item.delete()
+        self.assertEqual(self.products(), [])
+
+    def test_shop_save(self):
+        self.assertCachedUntil(
+            self.rename(self.shop, 'New shop'), lambda: self.products()[0]['shop']['name'], 'Catalogue shop', 'New shop')
+
+    def test_shop_delete(self):
+        self.assertEqual(len(self.products()), 1)
+        self.shop.delete()
+        self.assertEqual(self.products(), [])
+
+    def test_category_save(self):
+        self.assertCachedUntil(
+            self.rename(self.category, 'New category'), lambda: self.detail()['category']['name'],
+            'Old category', 'New category')
+
+    def test_category_delete(self):
+        self.assertEqual(self.detail()['category']['name'], 'Old category')
+        # Takes its items with it
+        self.category.delete()
+        self.assertEqual(self.client.get('/api/products/%d/' % self.item.pk).status_code, 404)
+        self.assertEqual(self.products(), [])
+
+
+class ItemListConditionalTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        vendor = User.objects.create(username='conditional-vendor', is_vendor=True)
+        shop = Shop.objects.create(user=vendor, name='Conditional shop')
+        cls.item = Item.objects.create(shop=shop, name='Conditional', slug='conditional', price=2)
+
+    def get(self, **headers):
+        return self.client.get('/api/products/', headers=headers)
+
+    def test_if_none_match(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        response = self.get(if_none_match=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_if_modified_since(self):
+        last_modified = self.get()['Last-Modified']
+        self.assertEqual(self.get(if_modified_since=last_modified).status_code, 304)
+
+    def test_item_update_changes_the_etag(self):
+        etag = self.get()['ETag']
+        self.item.price = 3
+        self.item.save()
+        response = self.get(if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.get(if_none_match=response['ETag']).status_code, 304)
+
+
+class NameSearchTests(TestCase):
+    """?name= on products and shops; these run the non-Postgres ranking."""
+
+    @classmethod
+    def setUpTestData(cls):
+        vendor = User.objects.create(username='search-vendor', is_vendor=True)
+        shop = Shop.objects.create(user=vendor, name='Apple store')
+        Shop.objects.create(user=User.objects.create(username='search-other', is_vendor=True), name='Pear shop')
+        for name in ('Green apple', 'Apple pie', 'Pear', 'apple', 'Red apple'):
+            Item.objects.create(shop=shop, name=name, slug=name.lower().replace(' ', '-'), price=1)
+
+    def setUp(self):
+        cache.clear()
+
+    def names(self, path):
+        data = self.client.get(path).json()
+        return [row['name'] for row in (data['results'] if isinstance(data, dict) else data)]
+
+    def test_products_ranked_exact_prefix_substring(self):
+        # Equally relevant rows newest first
+        self.assertEqual(self.names('/api/products/?name=APPLE'), ['apple', 'Apple pie', 'Red apple', 'Green apple'])
+
+    def test_no_match(self):
+        self.assertEqual(self.names('/api/products/?name=banana'), [])
+
+    def test_shops(self):
+        self.assertEqual(self.names('/api/shops/?name=shop'), ['Pear shop'])
+        self.assertEqual(self.names('/api/shops/?name=ap'), ['Apple store'])
+
+    def test_postgres_ranks_by_trigram_similarity(self):
+        with mock.patch('store.search.connections') as connections:
+            connections.__getitem__.return_value.vendor = 'postgresql'
+            queryset = search.search_by_name(Item.objects.all(), 'apple')
+        self.assertIsInstance(queryset.query.annotations['relevance'], TrigramWordSimilarity)
+        self.assertEqual(queryset.query.order_by, ('-relevance', '-id'))
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_catalogue(shops=2, items_per_shop=12)
+        customer = seed_customers(1, prefix='keyset')[0]
+        seed_order_history([customer], Item.objects.order_by('id'), orders_per_customer=9)
+        cls.token = Token.objects.create(user=customer).key
+
+    def setUp(self):
+        cache.clear()
+
+    def walk(self, path, add_row):
+        ids, url = [], path
+        while url:
+            data = self.client.get(url, headers={'authorization': 'Token %s' % self.token}).json()
+            self.assertNotIn('count', data)
+            results = data['results']
+            # The order list nests its rows next to the status counters
+            ids += [row['id'] for row in (results['results'] if isinstance(results, dict) else results)]
+            url = data['next']
+            # A row added mid-walk sorts before the cursor, so it never shifts later pages
+            add_row()
+        return ids
+
+    def test_products(self):
+        expected = list(Item.objects.order_by('-id').values_list('id', flat=True))
+        shop = Shop.objects.first()
+        ids = self.walk('/api/products/?cursor=&PageSize=7',
+                        lambda: Item.objects.create(shop=shop, name='Late', slug='late', price=1))
+        self.assertEqual(ids, expected)
+
+    def test_orders(self):
+        expected = list(Order.objects.order_by('-id').values_list('id', flat=True))
+        user = User.objects.first()
+        ids = self.walk('/api/order-list/?cursor=&PageSize=4',
+                        lambda: Order.objects.create(user=user, ordered_date=timezone.now()))
+        self.assertEqual(ids, expected)
+
+    def test_page_number_fallback(self):
+        data = self.client.get('/api/products/?page=2&PageSize=7').json()
+        self.assertEqual(data['count'], 24)
+        self.assertEqual([row['id'] for row in data['results']],
+                         list(Item.objects.order_by('-id').values_list('id', flat=True)[7:14]))
+
+
+class NearbyShopsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Degrees of latitude north of (6.25, -75.56); 0.009 is about 1 km
+        for name, offsets in (('Here', [0]), ('Two km', [0.018]), ('Eleven km', [0.1]), ('One km', [0.5, 0.009])):
+            vendor = User.objects.create(username='near-%s' % name, is_vendor=True)
+            Shop.objects.create(user=vendor, name=name)
+            for offset in offsets:
+                Address.objects.create(user=vendor, lat=6.25 + offset, lng=-75.56, address_type='S')
+
+    def get(self, query, prefix='/api/'):
+        return self.client.get(prefix + 'shops/?' + query)
+
+    def test_within_radius_closest_first(self):
+        # A shop is as close as its closest address
+        self.assertEqual([shop['name'] for shop in self.get('near=6.25,-75.56').json()], ['Here', 'One km', 'Two km'])
+        self.assertEqual([shop['name'] for shop in self.get('near=6.25,-75.56&radius=20').json()],
+                         ['Here', 'One km', 'Two km', 'Eleven km'])
+        self.assertEqual([shop['name'] for shop in self.get('near=6.25,-75.56&radius=0.5').json()], ['Here'])
+
+    def test_malformed_coordinates(self):
+        for query in ('near=abc', 'near=6.25', 'near=6.25,-75.56,1', 'near=91,0', 'near=nan,0',
+                      'near=6.25,-75.56&radius=far', 'near=6.25,-75.56&radius=0', 'near=6.25,-75.56&radius=1000'):
+            for prefix in ('/api/', '/api/async/'):
+                self.assertEqual(self.get(query, prefix).status_code, 400, prefix + query)
@@ -1,12 +1,14 @@
 from django.urls import path
+from .async_views import AsyncItemDetailView, AsyncItemListView, AsyncOrderDetailView, AsyncShopListView
 from .views import (
-    ItemListView, ItemDetailView, ItemCreatView,
+    ItemListView, ItemDetailView, ItemCreatView, ItemImportView, ItemExportView,
     AddToCartView, ShopListView, ShopDetailView, ShopCreateView,
     OrderDetailView, OrderQuantityUpdateView, AddCouponView, 
-    CreateCouponView, CouponDetailView, OrderListView, AddressDefaultAPIView,
+    CreateCouponView, CouponDetailView, OrderListView, OrderExportView, AddressDefaultAPIView,
 
     AddressListView, AddressCreateView, AddressUpdateView, AddressDeleteView,
-    OrderItemDeleteView, OrderItemListView, OrderUpdateView, PaymentListView, PaymentView
+    OrderItemDeleteView, OrderItemListView, OrderUpdateView, PaymentListView, PaymentView,
+    DispatchOrderListView, DispatchRiderListView, ShopSalesView, ShopItemSalesView, ShopOrderStatusView
 )
 
 urlpatterns = [
@@ -21,6 +23,8 @@ urlpatterns = [
     path('shop-detail/', ShopDetailView.as_view()),
     path('products/', ItemListView.as_view()),
     path('products-create/', ItemCreatView.as_view()),
+    path('products-import/', ItemImportView.as_view()),
+    path('products-export/', ItemExportView.as_view()),
     path('products/<pk>/', ItemDetailView.as_view()),
 
     path('add-to-cart/<pk>/', AddToCartView.as_view(), name='add-to-cart'),
@@ -36,6 +40,19 @@ urlpatterns = [
     path('order-item/update-quantity/<pk>/', OrderQuantityUpdateView.as_view()),
     
     path('order-list/', OrderListView.as_view()),
+    path('orders-export/', OrderExportView.as_view()),
     path('order/<pk>/', OrderUpdateView.as_view()),
+    path('dispatch/orders/', DispatchOrderListView.as_view()),
+    path('dispatch/orders/<pk>/riders/', DispatchRiderListView.as_view()),
     path('payments/', PaymentListView.as_view(), name='payment-list'),
+
+    path('analytics/sales/', ShopSalesView.as_view()),
+    path('analytics/items/', ShopItemSalesView.as_view()),
+    path('analytics/status/', ShopOrderStatusView.as_view()),
+
+    # Async variants of the hot read endpoints, for ASGI deployments (core/asgi.py)
+    path('async/shops/', AsyncShopListView.as_view()),
+    path('async/products/', AsyncItemListView.as_view()),
+    path('async/products/<pk>/', AsyncItemDetailView.as_view()),
+    path('async/order-summary/', AsyncOrderDetailView.as_view()),
 ]
\ No newline at end of file
@@ -1,3 +1,6 @@
+from datetime import timedelta
+
+from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
 from django.http import Http404
 from django.shortcuts import get_object_or_404
@@ -6,30 +9,56 @@ from rest_framework.generics import (
     ListAPIView, RetrieveAPIView, CreateAPIView,
     UpdateAPIView, DestroyAPIView, ListCreateAPIView
 )
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.exceptions import ParseError, PermissionDenied
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.status import HTTP_200_OK, HTTP_204_NO_CONTENT, HTTP_400_BAD_REQUEST, HTTP_201_CREATED, HTTP_401_UNAUTHORIZED
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.status import HTTP_200_OK, HTTP_204_NO_CONTENT, HTTP_400_BAD_REQUEST, HTTP_201_CREATED, HTTP_202_ACCEPTED, HTTP_401_UNAUTHORIZED, HTTP_403_FORBIDDEN
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 from .serializers import (
     ItemSerializer, OrderSerializer, ItemDetailSerializer, AddressSerializer,
     PaymentSerializer, ShopSerializer, OrderItemSerializer, CouponSerializer
 )
 from store.models import Item, OrderItem, Order, Address, Payment, Coupon, Shop
+from store.cache import (
+    CATALOGUE_CATEGORIES, CATALOGUE_SHOPS, catalogue_item_key, catalogue_list_key,
+    get_catalogue, order_counters, set_catalogue, shop_namespace
+)
+from store.conditional import not_modified, queryset_validators, set_validators, validators
+from store.search import search_by_name
+from store.bulk import EXPORT_FIELDS, ImportParseError, export_items, import_items
+from store.exports import export_dates, order_export
+from store.streaming import read_rows, streaming_export
+from store.services import CheckoutError, add_to_cart, checkout
+from store.tasks import export_orders
+from store.dispatch import DispatchError, assign, claim_nearest, complete, nearest_orders, nearest_riders, rider_position
+from store.geo import parse_point
+from store import analytics
 from Auth.serializers import UserSerializer
-from decimal import Decimal
-
-import random
-import string
 
 
-def create_ref_code():
-    return ''.join(random.choices(string.ascii_lowercase + string.digits, k=20))
-
 class CustomPagination(PageNumberPagination):
     page_size_query_param = 'PageSize'
     # max_page_size = 100
 
+class KeysetPagination(CursorPagination):
+    # Seeks on id instead of OFFSET and never runs COUNT(*)
+    ordering = '-id'
+    page_size = 20
+    page_size_query_param = 'PageSize'
+
+class KeysetPaginationMixin:
+    # Opt-in: requests with a ?cursor= parameter (empty for the first page)
+    # get keyset pages, everything else keeps the page-number pagination.
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if 'cursor' in self.request.query_params:
+                self._paginator = KeysetPagination()
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
 class ShopCreateView(APIView):
     def post(self, request, *args, **kwargs):
         serializer = ShopSerializer(data=request.data)
@@ -51,51 +80,106 @@ class ShopCreateView(APIView):
                 return Response(user_serializer.errors, status=HTTP_400_BAD_REQUEST)
         return Response(serializer.errors, status=HTTP_400_BAD_REQUEST)
     
+def shop_list_queryset(params):
+    # Shared with the async shop list in store.async_views
+    queryset = Shop.objects.with_profile()
+
+    # Filter based on request parameters
+    name = params.get('name', None)
+    if name:
+        queryset = search_by_name(queryset, name)
+
+    # ?near=lat,lng[&radius=km]: shops within radius, closest first
+    near = params.get('near', None)
+    if near:
+        try:
+            lat, lng = parse_point(near)
+            radius = float(params.get('radius', settings.NEARBY_SHOPS_RADIUS_KM))
+        except ValueError:
+            raise ParseError('near must be lat,lng and radius a number of km')
+        if not 0 < radius <= settings.NEARBY_SHOPS_MAX_RADIUS_KM:
+            raise ParseError('radius must be between 0 and %s km' % settings.NEARBY_SHOPS_MAX_RADIUS_KM)
+        queryset = queryset.near(lat, lng, radius)
+    return queryset
+
 class ShopListView(ListCreateAPIView):
     permission_classes = (AllowAny,)
     serializer_class = ShopSerializer
     pagination_class = CustomPagination
 
     def get_queryset(self):
-        queryset = Shop.objects.all()
+        return shop_list_queryset(self.request.query_params)
 
-        # Filter based on request parameters
-        name = self.request.query_params.get('name', None)
-        if name:
-            queryset = queryset.filter(name__icontains=name)
-        return queryset
+    def list(self, request, *args, **kwargs):
+        etag, last_modified = queryset_validators(self.get_queryset(), request, [CATALOGUE_SHOPS])
+        response = not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+        response = super().list(request, *args, **kwargs)
+        return set_validators(response, etag, last_modified)
     
 class ShopDetailView(APIView):
     def get(self, request, format=None):
-        user=request.user
-        queryset = Shop.objects.get(user=user)
+        # Users without a shop (or not logged in) get a 404
+        shop = Shop.objects.filter(user_id=request.user.pk).values('id', 'updated_at').first()
+        if shop is None:
+            raise Http404
+        etag, last_modified = validators(
+            [shop['id'], shop['updated_at']], shop['updated_at'], [shop_namespace(shop['id'])])
+        response = not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+
+        queryset = get_object_or_404(Shop.objects.with_profile(), pk=shop['id'])
         serializer = ShopSerializer(queryset)
-        return Response( serializer.data)
+        return set_validators(Response( serializer.data), etag, last_modified)
+
+def item_list_queryset(user, params):
+    # Shared with the async product list in store.async_views
+    queryset = Item.objects.with_shop().order_by("-id")
+
+    if getattr(user, 'is_vendor', False):
+        queryset = queryset.filter(shop__user=user)
 
-class ItemListView(ListCreateAPIView):
+    # Filter based on request parameters
+    name = params.get('name', None)
+    if name:
+        queryset = search_by_name(queryset, name)
+
+    shop_id = params.get('shop_id', None)
+    if shop_id:
+        queryset = queryset.filter(shop_id=shop_id)
+
+    return queryset
+
+class ItemListView(KeysetPaginationMixin, ListCreateAPIView):
     permission_classes = (AllowAny,)
     serializer_class = ItemSerializer
     pagination_class = CustomPagination
 
     def get_queryset(self):
-        user=self.request.user
-        queryset = Item.objects.all().order_by("-id")
+        return item_list_queryset(self.request.user, self.request.query_params)
 
-        if user.is_vendor:
-            shop = Shop.objects.get(user=user)
-            queryset = queryset.filter(shop_id=shop.id)
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['shop_cache'] = {}
+        return context
 
+    def list(self, request, *args, **kwargs):
+        etag, last_modified = queryset_validators(self.get_queryset(), request, [CATALOGUE_SHOPS])
+        response = not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
 
-        # Filter based on request parameters
-        name = self.request.query_params.get('name', None)
-        if name:
-            queryset = queryset.filter(name__icontains=name)
+        key = catalogue_list_key(request, request.user)
+        data = get_catalogue(key)
+        if data is not None:
+            return set_validators(Response(data), etag, last_modified)
 
-        shop_id = self.request.query_params.get('shop_id', None)
-        if shop_id:
-            queryset = queryset.filter(shop_id=shop_id)
-        
-        return queryset
+        response = super().list(request, *args, **kwargs)
+        results = response.data['results'] if isinstance(response.data, dict) else response.data
+        set_catalogue(key, response.data, {item['shop']['id'] for item in results})
+        return set_validators(response, etag, last_modified)
 
 class ItemCreatView(APIView):
     def post(self, request, *args, **kwargs):
@@ -110,6 +194,44 @@ class ItemCreatView(APIView):
             return Response(serializer.data, status= HTTP_201_CREATED)
         return Response(serializer.errors, status= HTTP_400_BAD_REQUEST)
     
+class ItemImportView(APIView):
+    permission_classes = (IsAuthenticated, )
+
+    def post(self, request, *args, **kwargs):
+        shop = get_object_or_404(Shop, user=request.user)
+
+        # Either a multipart upload in 'file' or the raw request body
+        if request.content_type.startswith('multipart/'):
+            upload = request.FILES.get('file')
+            if upload is None:
+                return Response({"message": "No file received"}, status=HTTP_400_BAD_REQUEST)
+            source, name = upload, upload.name
+        else:
+            source, name = request.stream, ''
+            # An empty body has no stream
+            if source is None:
+                return Response({"message": "No file received"}, status=HTTP_400_BAD_REQUEST)
+        if 'json' in request.content_type or name.endswith(('.jsonl', '.ndjson')):
+            input_format = 'ndjson'
+        else:
+            input_format = 'csv'
+
+        lines = (line.decode('utf-8-sig') for line in source)
+        try:
+            stats = import_items(shop, read_rows(lines, input_format))
+        except ImportParseError as e:
+            # The chunks before the bad row were imported
+            return Response({"message": e.message, **e.stats}, status=HTTP_400_BAD_REQUEST)
+        return Response(stats, status=HTTP_200_OK)
+
+class ItemExportView(APIView):
+    permission_classes = (IsAuthenticated, )
+
+    def get(self, request, format=None):
+        shop = get_object_or_404(Shop, user=request.user)
+        output = request.query_params.get('output', 'csv')
+        return streaming_export(EXPORT_FIELDS, export_items(shop), output, 'products')
+
 class ItemDetailView(APIView):
     def get_object(self, pk):
         try:
@@ -118,9 +240,23 @@ class ItemDetailView(APIView):
             raise Http404
 
     def get(self, request, pk, format=None):
+        updated_at = Item.objects.filter(id=pk).values_list('updated_at', flat=True).first()
+        if updated_at is None:
+            raise Http404
+        etag, last_modified = validators([pk, updated_at], updated_at, [CATALOGUE_CATEGORIES])
+        response = not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+
+        key = catalogue_item_key(pk)
+        data = get_catalogue(key)
+        if data is not None:
+            return set_validators(Response(data), etag, last_modified)
+
         instance = self.get_object(pk)
         serializer = ItemDetailSerializer(instance)
-        return Response( serializer.data)
+        set_catalogue(key, serializer.data, [instance.shop_id])
+        return set_validators(Response( serializer.data), etag, last_modified)
 
     def put(self, request, pk, format=None):
         instance = self.get_object(pk)
@@ -162,13 +298,13 @@ class OrderQuantityUpdateView(APIView):
         else:
             return Response({"message": "You do not have an active order"}, status=HTTP_400_BAD_REQUEST)
 
-class OrderItemListView(ListCreateAPIView):
+class OrderItemListView(KeysetPaginationMixin, ListCreateAPIView):
     permission_classes = (AllowAny,)
     serializer_class = OrderItemSerializer
     pagination_class = CustomPagination
 
     def get_queryset(self):
-        queryset = OrderItem.objects.all().order_by("-id")
+        queryset = OrderItem.objects.with_item().order_by("-id")
 
         # Filter based on request parameters
         shop_id = self.request.query_params.get('shop_id', None)
@@ -184,41 +320,11 @@ class OrderItemDeleteView(DestroyAPIView):
 
 class AddToCartView(APIView):
     def post(self, request, pk, *args, **kwargs):
-        item = get_object_or_404(Item, id=pk)
-        shop_instance = Shop.objects.get(id=item.shop.id)
-
-        order_item_qs = OrderItem.objects.filter(
-            item=item,
-            user=request.user,
-            ordered=False
-        )
-
-        if order_item_qs.exists():
-            order_item = order_item_qs.first()
-            order_item.quantity += 1
-            order_item.save()
-        else:
-            order_item = OrderItem.objects.create(
-                item=item,
-                user=request.user,
-                ordered=False
-            )
-            order_item.save()
-
-        order_qs = Order.objects.filter(user=request.user, ordered=False)
-        if order_qs.exists():
-            order = order_qs[0]
-            if not order.items.filter(item__id=order_item.id).exists():
-                order.items.add(order_item)
-                return Response(status=HTTP_200_OK)
-        else:
-            ordered_date = timezone.now()
-            order = Order.objects.create(
-                user=request.user, ordered_date=ordered_date, shop=shop_instance)
-            order.items.add(order_item)
-            return Response(status=HTTP_200_OK)
+        item = get_object_or_404(Item.objects.only('id', 'shop_id'), id=pk)
+        add_to_cart(request.user, item)
+        return Response(status=HTTP_200_OK)
 
-class OrderListView(ListCreateAPIView):
+class OrderListView(KeysetPaginationMixin, ListCreateAPIView):
     permission_classes = (AllowAny,)
     serializer_class = OrderSerializer
     pagination_class = CustomPagination
@@ -256,12 +362,14 @@ class OrderListView(ListCreateAPIView):
     def list(self, request, *args, **kwargs):
         queryset = self.get_queryset()
 
-        being_delivered = queryset.filter(being_delivered=True).count()
-        received = queryset.filter(received=True).count()
-        newOrder = queryset.filter(ordered=True, received=False, being_delivered=False).count()
+        counters = order_counters(queryset, request.query_params)
+        being_delivered = counters['being_delivered']
+        received = counters['received']
+        newOrder = counters['newOrder']
 
-        # Order the queryset by id
-        queryset = queryset.order_by('-id')
+        # Order the queryset by id; the page's items and totals are priced
+        # from one batched prefetch.
+        queryset = queryset.with_summary().order_by('-id')
 
         # Paginate the queryset
         page = self.paginate_queryset(queryset)
@@ -285,13 +393,49 @@ class OrderListView(ListCreateAPIView):
 
         return Response(response_data)
 
+class OrderExportView(APIView):
+    """
+    GET streams the export; POST (same query parameters) queues it as a
+    background job and returns the job to poll at api/jobs/<id>/, whose
+    result holds the file's URL once it has been written.
+    """
+    permission_classes = (IsAdminUser, )
+
+    def get_params(self, request):
+        kind = request.query_params.get('kind', 'orders')
+        if kind not in ('orders', 'items', 'payments'):
+            raise ParseError("kind must be orders, items or payments")
+        try:
+            dates = export_dates(start=request.query_params.get('start'), end=request.query_params.get('end'))
+        except ValueError as e:
+            raise ParseError(str(e))
+        output = 'ndjson' if request.query_params.get('output') == 'ndjson' else 'csv'
+        return kind, dates, output
+
+    def get(self, request, format=None):
+        try:
+            kind, dates, output = self.get_params(request)
+        except ParseError as e:
+            return Response({"message": e.detail}, status=HTTP_400_BAD_REQUEST)
+        header, rows = order_export(kind, **dates)
+        return streaming_export(header, rows, output, 'order-%s' % kind)
+
+    def post(self, request, format=None):
+        try:
+            kind, dates, output = self.get_params(request)
+        except ParseError as e:
+            return Response({"message": e.detail}, status=HTTP_400_BAD_REQUEST)
+        job = export_orders.delay(
+            kind, **{param: value.isoformat() for param, value in dates.items()}, output=output)
+        return Response({"job": job.id, "status": "/api/jobs/%s/" % job.id}, status=HTTP_202_ACCEPTED)
+
 class OrderDetailView(RetrieveAPIView):
     serializer_class = OrderSerializer
     permission_classes = (IsAuthenticated,)
 
     def get_object(self):
         try:
-            order = Order.objects.get(user=self.request.user, ordered=False)
+            order = Order.objects.with_summary().get(user=self.request.user, ordered=False)
             return order
         except ObjectDoesNotExist:
             raise Http404("You do not have an active order")
@@ -299,51 +443,141 @@ class OrderDetailView(RetrieveAPIView):
 
 class OrderUpdateView(APIView):
     def get(self, request, pk, format=None):
-        instance = Order.objects.get(id=pk)
-        instance.rider = self.request.user
-        instance.being_delivered = True
-        instance.save()
+        try:
+            assign(pk, self.request.user)
+        except DispatchError as e:
+            return Response({'error': e.message}, status=HTTP_400_BAD_REQUEST)
         return Response({"message": "Order successfully assigned to you!"} ,status=HTTP_200_OK)
     
     def put(self, request, pk, format=None):
-        instance = Order.objects.get(id=pk)
-        instance.being_delivered = False
-        instance.received = True
-        instance.save()
+        try:
+            complete(pk)
+        except DispatchError as e:
+            return Response({'error': e.message}, status=HTTP_400_BAD_REQUEST)
         return Response({"message": "Order successfully completed!"} ,status=HTTP_200_OK)
 
-class PaymentView(APIView):
+def dispatch_params(request):
+    # ?limit= (at most 50) and an optional ?radius= in km
+    limit = min(int(request.query_params.get('limit', 10)), 50)
+    radius = request.query_params.get('radius', None)
+    return limit, float(radius) if radius else None
+
+class DispatchOrderListView(APIView):
+    """
+    GET lists the available orders nearest to the rider, POST assigns the
+    nearest one to them. The rider's position is ?near=lat,lng, or their
+    default address when omitted.
+    """
+    permission_classes = (IsAuthenticated, )
+
+    def get_position(self, request):
+        near = request.query_params.get('near', None) or request.data.get('near', None)
+        if near:
+            return parse_point(near)
+        return rider_position(request.user)
+
+    def get(self, request, *args, **kwargs):
+        if not request.user.is_rider:
+            return Response({'error': 'Only riders can take orders'}, status=HTTP_403_FORBIDDEN)
+        try:
+            position = self.get_position(request)
+            limit, radius = dispatch_params(request)
+        except ValueError:
+            return Response({'error': 'Invalid near, limit or radius'}, status=HTTP_400_BAD_REQUEST)
+        if position is None:
+            return Response({'error': 'Send your position as ?near=lat,lng'}, status=HTTP_400_BAD_REQUEST)
+        return Response(nearest_orders(*position, limit=limit, radius_km=radius), status=HTTP_200_OK)
+
     def post(self, request, *args, **kwargs):
-        user = self.request.user
-        order = Order.objects.get(user=user, ordered=False)
-        # print("acc_balance", user.acc_balance)
-        # print("order total", order.get_total())
-        
-        if order.get_total() > user.acc_balance:
-            return Response({'error': 'Insufficient balance'}, status=HTTP_400_BAD_REQUEST)
-        
-        user.acc_balance -= Decimal(order.get_total())
-        user.save()
-        # print("final acc_balance", user.acc_balance)
+        if not request.user.is_rider:
+            return Response({'error': 'Only riders can take orders'}, status=HTTP_403_FORBIDDEN)
+        try:
+            position = self.get_position(request)
+            _, radius = dispatch_params(request)
+        except ValueError:
+            return Response({'error': 'Invalid near or radius'}, status=HTTP_400_BAD_REQUEST)
+        if position is None:
+            return Response({'error': 'Send your position as ?near=lat,lng'}, status=HTTP_400_BAD_REQUEST)
+        try:
+            order = claim_nearest(request.user, *position, radius_km=radius)
+        except DispatchError as e:
+            return Response({'error': e.message}, status=HTTP_400_BAD_REQUEST)
+        return Response({'message': 'Order successfully assigned to you!', 'id': order.id}, status=HTTP_200_OK)
 
-        
-        # create the payment
-        payment = Payment()
-        payment.user = user
-        payment.amount = order.get_total()
-        payment.save()
-
-        # assign the payment to the order
-        order_items = order.items.all()
-        order_items.update(ordered=True)
-        for item in order_items:
-            item.save()
-            # pass
-
-        order.ordered = True
-        order.payment = payment
-        order.ref_code = create_ref_code()
-        order.save()
+class DispatchRiderListView(APIView):
+    # Nearest free riders to an order, for staff and the order's shop
+    permission_classes = (IsAuthenticated, )
+
+    def get(self, request, pk, *args, **kwargs):
+        order = get_object_or_404(Order.objects.select_related('shop', 'shipping_address'), pk=pk)
+        if not request.user.is_staff and (order.shop is None or order.shop.user_id != request.user.id):
+            return Response({'error': 'Not your order'}, status=HTTP_403_FORBIDDEN)
+        try:
+            limit, radius = dispatch_params(request)
+        except ValueError:
+            return Response({'error': 'Invalid limit or radius'}, status=HTTP_400_BAD_REQUEST)
+        return Response(nearest_riders(order, limit=limit, radius_km=radius), status=HTTP_200_OK)
+
+class ShopAnalyticsMixin:
+    # Vendors see their own shop; staff pick one with ?shop_id=
+    permission_classes = (IsAuthenticated, )
+
+    def get_shop_id(self, request):
+        if request.user.is_staff and request.query_params.get('shop_id'):
+            try:
+                return int(request.query_params['shop_id'])
+            except ValueError:
+                raise ParseError("Invalid shop_id")
+        shop_id = Shop.objects.filter(user=request.user).values_list('id', flat=True).first()
+        if shop_id is None:
+            raise PermissionDenied("You do not have a shop")
+        return shop_id
+
+    def get_dates(self, request):
+        # ?start= and ?end= (inclusive), by default the last ANALYTICS_DEFAULT_DAYS days
+        try:
+            dates = export_dates(start=request.query_params.get('start'), end=request.query_params.get('end'))
+        except ValueError as e:
+            raise ParseError(str(e))
+        end = dates.get('end') or timezone.localdate()
+        start = dates.get('start') or end - timedelta(days=settings.ANALYTICS_DEFAULT_DAYS - 1)
+        if start > end:
+            raise ParseError("start must not be after end")
+        if (end - start).days >= settings.ANALYTICS_MAX_DAYS:
+            raise ParseError("At most %d days at a time" % settings.ANALYTICS_MAX_DAYS)
+        return start, end
+
+class ShopSalesView(ShopAnalyticsMixin, APIView):
+    def get(self, request, format=None):
+        shop_id = self.get_shop_id(request)
+        start, end = self.get_dates(request)
+        data = analytics.daily_sales(shop_id, start, end)
+        return Response({'shop': shop_id, 'start': start, 'end': end, **data}, status=HTTP_200_OK)
+
+class ShopItemSalesView(ShopAnalyticsMixin, APIView):
+    def get(self, request, format=None):
+        shop_id = self.get_shop_id(request)
+        start, end = self.get_dates(request)
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), 100)
+        except ValueError:
+            raise ParseError("Invalid limit")
+        if limit < 1:
+            raise ParseError("limit must be at least 1")
+        results = analytics.item_sales(shop_id, start, end, limit)
+        return Response({'shop': shop_id, 'start': start, 'end': end, 'results': results}, status=HTTP_200_OK)
+
+class ShopOrderStatusView(ShopAnalyticsMixin, APIView):
+    def get(self, request, format=None):
+        shop_id = self.get_shop_id(request)
+        return Response({'shop': shop_id, **analytics.status_counts(shop_id)}, status=HTTP_200_OK)
+
+class PaymentView(APIView):
+    def post(self, request, *args, **kwargs):
+        try:
+            checkout(self.request.user)
+        except CheckoutError as e:
+            return Response({'error': e.message}, status=HTTP_400_BAD_REQUEST)
 
         return Response({"message": "Your order was successful!"} ,status=HTTP_200_OK)
         
@@ -432,15 +666,8 @@ class AddressDeleteView(DestroyAPIView):
 class AddressDefaultAPIView(APIView):
     def get(self, request, pk, format=None):
         user=request.user
-        qs = Address.objects.filter(user=user)
-
-        for data in qs:
-            data.default = False
-            data.save()
-
-        instance = Address.objects.get(id=pk)
-        instance.default = True
-        instance.save()
+        instance = get_object_or_404(Address.objects.only('id', 'user_id', 'address_type'), id=pk, user=user)
+        Address.objects.make_default(instance)
 
         return Response("Successfully updated for instances", status=HTTP_200_OK)
     